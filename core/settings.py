@@ -39,12 +39,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tienda.middleware.MetricasMiddleware',
+    'tienda.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'tienda.middleware.EstaticosMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tienda.middleware.AuditoriaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,11 +76,63 @@ WSGI_APPLICATION = 'core.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(
         default=f'sqlite:///{BASE_DIR / "db.sqlite3"}',
-        conn_max_age=600
+        conn_max_age=600,
+        conn_health_checks=True,
     )
 }
 
-
+# Réplica de solo lectura opcional para listados, catálogo, reportes y APIs (ver
+# tienda.routers). Para probar en local alcanza con otro archivo SQLite, p. ej.
+# REPLICA_DATABASE_URL=sqlite:///replica.sqlite3 (copia de db.sqlite3).
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ['REPLICA_DATABASE_URL'], conn_max_age=600, conn_health_checks=True
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['tienda.routers.RouterReplica']
+
+# Retraso máximo esperado de la réplica, en segundos: tras escribir, o tras un
+# cambio de versión del catálogo/precios, se lee de la primaria durante ese lapso.
+REPLICA_RETRASO = float(os.environ.get('REPLICA_RETRASO', '5'))
+
+# Pool nativo de psycopg 3 para PostgreSQL: cada worker de gunicorn tiene el suyo,
+# así que DB_POOL_MAX debería ser al menos la cantidad de hilos (GUNICORN_THREADS).
+# Con DB_POOL_MAX=0 se vuelve a las conexiones persistentes (CONN_MAX_AGE).
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '2'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '8'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+for _db in DATABASES.values():
+    if DB_POOL_MAX > 0 and _db['ENGINE'] == 'django.db.backends.postgresql':
+        from psycopg_pool import ConnectionPool
+
+        # El pool reemplaza a las conexiones persistentes; Django exige CONN_MAX_AGE=0.
+        _db['CONN_MAX_AGE'] = 0
+        _db.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': min(DB_POOL_MIN, DB_POOL_MAX),
+            'max_size': DB_POOL_MAX,
+            'timeout': DB_POOL_TIMEOUT,
+            # Verifica la conexión al sacarla del pool (el equivalente de CONN_HEALTH_CHECKS).
+            'check': ConnectionPool.check_connection,
+        }
+
+# Con más de un proceso (workers de gunicorn) la caché debe ser compartida para
+# que las versiones del catálogo se invaliden en todos y los carritos se vean igual
+# en cada worker y en liberar_reservas. `manage.py check --deploy` lo exige; sin
+# ella gunicorn arranca con un solo worker, salvo que EXIGIR_CACHE_COMPARTIDA corte
+# el arranque.
+EXIGIR_CACHE_COMPARTIDA = os.environ.get('EXIGIR_CACHE_COMPARTIDA', 'False').lower() == 'true'
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    }
 LANGUAGE_CODE = 'es'
 TIME_ZONE = 'America/Guatemala'
 USE_I18N = True
@@ -89,6 +144,31 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
 
+MEDIA_ROOT = Path(os.environ.get('DJANGO_MEDIA_ROOT', BASE_DIR / 'media'))
+
+# Comprobantes de venta generados en segundo plano (ver tienda.comprobantes).
+COMPROBANTES_DIR = MEDIA_ROOT / 'comprobantes'
+COMPROBANTES_WORKERS = int(os.environ.get('COMPROBANTES_WORKERS', '2'))
+
+# Bitácora de cambios escrita en lotes por un hilo (ver tienda.auditoria).
+AUDITORIA_ASINCRONA = os.environ.get('AUDITORIA_ASINCRONA', 'True').lower() == 'true'
+AUDITORIA_LOTE = int(os.environ.get('AUDITORIA_LOTE', '200'))
+AUDITORIA_INTERVALO = float(os.environ.get('AUDITORIA_INTERVALO', '2'))
+
+# Métricas por vista (ver tienda.metricas). Con varios workers de gunicorn,
+# METRICAS_DIR debe ser un directorio compartido donde cada proceso vuelca las suyas.
+# Es local a la máquina: los volcados de procesos terminados se reconocen por pid.
+METRICAS_DIR = os.environ.get('METRICAS_DIR', '')
+METRICAS_VOLCADO = float(os.environ.get('METRICAS_VOLCADO', '5'))
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+
+# Token (Authorization: Bearer ...) de las integraciones que usan api/ventas/lote/.
+# Sin él, la API solo acepta usuarios con sesión y permiso tienda.add_venta.
+VENTAS_API_TOKEN = os.environ.get('VENTAS_API_TOKEN', '')
+
+# Segundos que un carrito reserva stock sin actividad (ver tienda.carrito).
+CARRITO_RESERVA = int(os.environ.get('CARRITO_RESERVA', str(15 * 60)))
+
 STORAGES = {
     "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
     "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
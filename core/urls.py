@@ -3,11 +3,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
 
+from tienda.views import exponer_metricas
+
 def root_redirect(request):
     return redirect("tienda:producto_list")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", root_redirect, name="root"),
+    path("metrics", exponer_metricas, name="metrics"),
     path("", include(("tienda.urls", "tienda"), namespace="tienda")),
 ]
@@ -0,0 +1,51 @@
+"""Perfil de producción de gunicorn (``gunicorn -c gunicorn.conf.py core.wsgi:application``).
+
+La app se carga una vez en el proceso maestro (``preload_app``), se calienta
+ahí (plantillas, URLs, traducciones; ver ``tienda.calentamiento``) y los
+workers la heredan ya lista al hacer fork, incluidos los que reemplazan a los
+reciclados por ``max_requests``. Todo se ajusta con variables de entorno.
+
+Sin caché compartida (``REDIS_URL``) cada worker tendría sus propias versiones
+del catálogo, mapas de precios y carritos: se avisa en el log y se arranca con
+un solo worker. Con ``EXIGIR_CACHE_COMPARTIDA=true`` el arranque se corta.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+wsgi_app = "core.wsgi:application"
+
+preload_app = True
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+
+# Reciclar workers acota fugas de memoria; el jitter evita que se reinicien todos juntos.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+
+def when_ready(server):
+    # Corre en el maestro, con la app ya cargada y antes de crear los workers.
+    # calentar() no abre conexiones: los pools de la base se crean en cada worker.
+    from django.conf import settings
+    from tienda.calentamiento import calentar
+    from tienda.checks import cache_compartida
+
+    if not cache_compartida():
+        mensaje = "La caché 'default' es local a cada proceso: configurá REDIS_URL."
+        if settings.EXIGIR_CACHE_COMPARTIDA:
+            server.halt(mensaje, exit_status=1)
+        # Con un solo worker (sus hilos comparten la caché) carritos y versiones siguen siendo coherentes.
+        server.log.warning("%s Se arranca con un solo worker.", mensaje)
+        server.num_workers = 1
+
+    resultado = calentar()
+    server.log.info(
+        "Calentamiento: %d plantillas y %d URLs en %.0f ms",
+        resultado["plantillas"], resultado["urls"], resultado["ms"],
+    )
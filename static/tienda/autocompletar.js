@@ -0,0 +1,54 @@
+(function () {
+  function hook(wrap) {
+    var url = wrap.getAttribute('data-autocompletar');
+    var hidden = wrap.querySelector('input[type="hidden"]');
+    var text = wrap.querySelector('input[type="text"]');
+    var list = wrap.querySelector('.autocompletar-opciones');
+    var timer = null;
+    var pedido = 0;
+
+    function limpiar() {
+      list.innerHTML = '';
+      list.hidden = true;
+    }
+
+    function mostrar(resultados) {
+      list.innerHTML = '';
+      resultados.forEach(function (r) {
+        var li = document.createElement('li');
+        li.textContent = r.texto;
+        li.addEventListener('mousedown', function (ev) {
+          ev.preventDefault();
+          hidden.value = r.id;
+          text.value = r.texto;
+          limpiar();
+          hidden.dispatchEvent(new Event('change', { bubbles: true }));
+        });
+        list.appendChild(li);
+      });
+      list.hidden = resultados.length === 0;
+    }
+
+    function buscar() {
+      var q = text.value.trim();
+      if (!q) { limpiar(); return; }
+      var actual = ++pedido;
+      fetch(url + '?k=10&q=' + encodeURIComponent(q))
+        .then(function (resp) { return resp.json(); })
+        .then(function (data) {
+          // Descarta respuestas que llegan después de una búsqueda más nueva.
+          if (actual === pedido) mostrar(data.resultados || []);
+        });
+    }
+
+    text.addEventListener('input', function () {
+      hidden.value = '';
+      clearTimeout(timer);
+      timer = setTimeout(buscar, 150);
+    });
+    text.addEventListener('blur', limpiar);
+  }
+
+  window.hookAutocompletar = hook;
+  document.querySelectorAll('[data-autocompletar]').forEach(hook);
+})();
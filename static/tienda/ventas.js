@@ -1,18 +1,32 @@
 (function () {
+  var table = document.getElementById('detalle-table');
+  var preciosUrl = table ? table.getAttribute('data-precios-url') : null;
+  // Precios ya conocidos (id -> "precio"); se piden al servidor solo los que faltan.
+  var precios = {};
+
   function fmt(num) {
     var n = parseFloat(num || 0);
     return "Q " + n.toFixed(2);
   }
 
+  function cargarPrecios(ids) {
+    var faltantes = ids.filter(function (id) { return id && !(id in precios); });
+    if (!faltantes.length || !preciosUrl) return Promise.resolve();
+    return fetch(preciosUrl + '?ids=' + faltantes.join(','))
+      .then(function (resp) { return resp.json(); })
+      .then(function (data) {
+        Object.keys(data.precios || {}).forEach(function (id) {
+          precios[id] = data.precios[id];
+        });
+      });
+  }
+
   function updateRow(row) {
-    var select = row.querySelector('select');
-    var litros = parseFloat(row.querySelector('input[name$="litros"]').value || 0);
+    var select = row.querySelector('[name$="-producto"]');
     var precioInput = row.querySelector('input[name$="precio_unitario"]');
 
     if (select && select.value) {
-      var pid = parseInt(select.value, 10);
-      var precios = window.PRODUCT_PRICES || {};
-      var precio = parseFloat(precios[pid] || 0);
+      var precio = parseFloat(precios[select.value] || 0);
       if (!precioInput.value || parseFloat(precioInput.value) === 0) {
         precioInput.value = precio.toFixed(2);
       }
@@ -31,22 +45,34 @@
   }
 
   function hook(row) {
-    var select = row.querySelector('select');
+    var select = row.querySelector('[name$="-producto"]');
     var litrosInput = row.querySelector('input[name$="litros"]');
     var precioInput = row.querySelector('input[name$="precio_unitario"]');
 
     [select, litrosInput, precioInput].forEach(function (el) {
       if (!el) return;
       el.addEventListener('change', function () {
-        if (el === select) updateRow(row);
-        updateTotal();
+        if (el !== select) { updateTotal(); return; }
+        cargarPrecios([select.value]).then(function () {
+          updateRow(row);
+          updateTotal();
+        });
       });
       el.addEventListener('input', updateTotal);
     });
-
-    updateRow(row);
-    updateTotal();
   }
 
-  document.querySelectorAll('.detalle-row').forEach(hook);
+  var rows = document.querySelectorAll('.detalle-row');
+  rows.forEach(hook);
+
+  // Una sola petición para los productos ya elegidos (p. ej. al volver con errores).
+  var elegidos = [];
+  rows.forEach(function (row) {
+    var select = row.querySelector('[name$="-producto"]');
+    if (select && select.value) elegidos.push(select.value);
+  });
+  cargarPrecios(elegidos).then(function () {
+    rows.forEach(updateRow);
+    updateTotal();
+  });
 })();
@@ -1,23 +1,119 @@
-from django.contrib import admin
-from .models import Producto, Cliente, Venta, DetalleVenta
+from django.contrib import admin, messages
+from . import busqueda
+from .forms import ProductoForm
+from .models import LogAccion, MovimientoStock, Producto, Cliente, Venta, DetalleVenta
+from .paginacion import TOPE_CONTEO, PaginadorEstimado
+
+
+class _ListadoGrande(admin.ModelAdmin):
+    """Listados que no cuentan toda la tabla (ver ``PaginadorEstimado``)."""
+
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        # La respuesta se renderiza después: los mensajes todavía salen en esta página.
+        cl = getattr(response, "context_data", {}).get("cl")
+        if cl is not None and cl.paginator.truncado:
+            messages.warning(request, (
+                f"Hay más de {TOPE_CONTEO} resultados y solo se pueden recorrer los primeros "
+                f"{TOPE_CONTEO}. Acotá el filtro (por ejemplo, por fecha) para ver el resto."
+            ))
+        elif cl is not None and cl.paginator.estimado:
+            messages.info(request, "La cantidad de resultados es aproximada (estadísticas de la base).")
+        return response
+
+
+class _BusquedaNormalizada:
+    """Busca por la columna ``busqueda`` indexada en lugar de ``icontains`` campo por campo.
+
+    Solo para modelos con esa columna. ``search_fields`` sigue haciendo falta
+    para que aparezca el buscador y para ``autocomplete_fields``.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return busqueda.filtrar(queryset, search_term), False
+
 
 @admin.register(Producto)
-class ProductoAdmin(admin.ModelAdmin):
+class ProductoAdmin(_BusquedaNormalizada, _ListadoGrande):
+    form = ProductoForm
     list_display = ("nombre", "tipo", "precio_litro", "stock_litros", "activo")
     search_fields = ("nombre", "tipo")
     list_filter = ("activo",)
+    ordering = ("nombre", "id")
+
+    def save_model(self, request, obj, form, change):
+        # ``ProductoForm.save`` deja el cambio de stock en el libro; ``obj.save()`` no.
+        form.save()
+
+class ComprasFilter(admin.SimpleListFilter):
+    title = "compras"
+    parameter_name = "compras"
+
+    def lookups(self, request, model_admin):
+        return [("con", "Con compras"), ("sin", "Sin compras")]
+
+    def queryset(self, request, queryset):
+        if self.value() == "con":
+            return queryset.filter(num_ventas__gt=0)
+        if self.value() == "sin":
+            return queryset.filter(num_ventas=0)
+        return queryset
+
 
 @admin.register(Cliente)
-class ClienteAdmin(admin.ModelAdmin):
-    list_display = ("nombre_completo", "telefono", "nit")
+class ClienteAdmin(_BusquedaNormalizada, _ListadoGrande):
+    list_display = ("nombre_completo", "telefono", "nit", "num_ventas", "total_comprado", "ultima_compra")
     search_fields = ("nombres", "apellidos", "nit")
+    list_filter = (ComprasFilter, "ultima_compra")
+    readonly_fields = ("num_ventas", "total_comprado", "ultima_compra")
+    ordering = ("apellidos", "nombres", "id")
 
 class DetalleVentaInline(admin.TabularInline):
     model = DetalleVenta
     extra = 0
+    autocomplete_fields = ("producto",)
+    readonly_fields = ("subtotal",)
 
 @admin.register(Venta)
-class VentaAdmin(admin.ModelAdmin):
+class VentaAdmin(_ListadoGrande):
     list_display = ("id", "fecha", "cliente", "total")
-    date_hierarchy = "fecha"
+    list_select_related = ("cliente",)
+    autocomplete_fields = ("cliente",)
+    # Sin date_hierarchy: arma su barra con un DISTINCT sobre toda la tabla. El
+    # filtro de fecha ofrece rangos recientes (hoy, 7 días, mes, año) y, con este
+    # orden, la página sale recorriendo el índice tienda_venta_fecha_id.
+    list_filter = ("fecha",)
+    ordering = ("-fecha", "-id")
     inlines = [DetalleVentaInline]
+
+
+@admin.register(LogAccion)
+class LogAccionAdmin(admin.ModelAdmin):
+    list_display = ("fecha_hora", "usuario", "evento", "modelo", "pk_obj")
+    list_filter = ("evento", "modelo")
+    search_fields = ("pk_obj", "usuario")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "producto", "tipo", "litros", "venta", "nota")
+    list_select_related = ("producto",)
+    raw_id_fields = ("producto", "venta")
+    list_filter = ("tipo", "fecha")
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,152 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import LogAccion
+
+logger = logging.getLogger(__name__)
+
+# Petición en curso, para saber el usuario sin tocar la sesión salvo que haya un evento.
+peticion_actual = contextvars.ContextVar("auditoria_peticion", default=None)
+
+_cola = queue.SimpleQueue()
+_hilo = None
+_lock = threading.Lock()
+
+
+def _usuario():
+    request = peticion_actual.get()
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user.get_username()
+    return ""
+
+
+def registrar(evento, instancia):
+    """Anota un evento sobre ``instancia``; se escribe en la base en segundo plano.
+
+    En la petición solo se copia el estado del objeto a una tupla; el evento
+    entra a la cola cuando la transacción se confirma (un rollback no deja
+    rastro) y el hilo escritor lo guarda con ``bulk_create`` junto a otros.
+    """
+    registrar_varios(evento, [instancia])
+
+
+def registrar_varios(evento, instancias):
+    """``registrar`` para los caminos masivos (``bulk_create``, ``update``), que no disparan señales.
+
+    Los campos diferidos (p. ej. un ``GeneratedField`` tras ``bulk_create``) no
+    se copian: leerlos costaría una consulta por objeto.
+    """
+    usuario = _usuario()
+    ahora = timezone.now()
+    entradas = []
+    for instancia in instancias:
+        diferidos = instancia.get_deferred_fields()
+        datos = {
+            f.attname: getattr(instancia, f.attname)
+            for f in instancia._meta.concrete_fields
+            if f.attname not in diferidos
+        }
+        entradas.append((usuario, evento, instancia._meta.model_name, str(instancia.pk), ahora, datos))
+    if entradas:
+        transaction.on_commit(lambda: _encolar(entradas))
+
+
+def _encolar(entradas):
+    for entrada in entradas:
+        _cola.put(entrada)
+    if settings.AUDITORIA_ASINCRONA:
+        _asegurar_hilo()
+    elif _cola.qsize() >= settings.AUDITORIA_LOTE:
+        vaciar()
+
+
+def al_terminar_peticion(**kwargs):
+    """Receptor de ``request_finished``: sin hilo escritor, lo pendiente se escribe al cerrar la petición."""
+    if not settings.AUDITORIA_ASINCRONA:
+        _vaciar_sin_fallar()
+
+
+def _a_modelo(entrada):
+    usuario, evento, modelo, pk_obj, fecha_hora, datos = entrada
+    return LogAccion(
+        usuario=usuario,
+        evento=evento,
+        modelo=modelo,
+        pk_obj=pk_obj,
+        fecha_hora=fecha_hora,
+        payload=json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False),
+    )
+
+
+def _escribir(entradas):
+    if entradas:
+        LogAccion.objects.bulk_create([_a_modelo(e) for e in entradas], batch_size=settings.AUDITORIA_LOTE)
+
+
+def vaciar():
+    """Escribe ya todo lo pendiente (al apagar, o en pruebas sin hilo)."""
+    entradas = []
+    while True:
+        try:
+            entradas.append(_cola.get_nowait())
+        except queue.Empty:
+            break
+    _escribir(entradas)
+
+
+def _trabajar():
+    lote = settings.AUDITORIA_LOTE
+    intervalo = settings.AUDITORIA_INTERVALO
+    while True:
+        entradas = [_cola.get()]
+        limite = time.monotonic() + intervalo
+        # Se escribe al juntar un lote completo o al vencer el intervalo.
+        while len(entradas) < lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                entradas.append(_cola.get(timeout=restante))
+            except queue.Empty:
+                break
+
+        close_old_connections()
+        try:
+            _escribir(entradas)
+        except Exception:
+            logger.exception("No se pudieron guardar %s eventos de auditoría", len(entradas))
+        finally:
+            close_old_connections()
+
+
+def _asegurar_hilo():
+    global _hilo
+    if _hilo is not None:
+        return
+    with _lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_trabajar, name="auditoria", daemon=True)
+            _hilo.start()
+
+
+def _vaciar_sin_fallar():
+    try:
+        vaciar()
+    except Exception:
+        logger.exception("No se pudo vaciar la cola de auditoría")
+
+
+# En los dos modos: lo que quede en la cola (menos de un lote) se escribe al
+# terminar el proceso, por ejemplo cuando gunicorn recicla un worker.
+atexit.register(_vaciar_sin_fallar)
@@ -0,0 +1,41 @@
+import re
+import unicodedata
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con un solo espacio entre palabras: ``"Pérez, José"`` -> ``"perez jose"``."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return _NO_ALFANUMERICO.sub(" ", texto).strip()
+
+
+def filtrar(queryset, q):
+    """Filtra por la columna ``busqueda``: cada término debe empezar alguna palabra.
+
+    ``startswith`` sobre la columna usa el índice B-tree (``varchar_pattern_ops``
+    en PostgreSQL); la coincidencia a mitad de texto usa el índice trigram que
+    crea la migración en PostgreSQL.
+    """
+    for termino in normalizar(q).split():
+        queryset = queryset.filter(Q(busqueda__startswith=termino) | Q(busqueda__contains=f" {termino}"))
+    return queryset
+
+
+def mejores(queryset, q, k=10):
+    """Los ``k`` mejores resultados de ``filtrar``: primero los que empiezan por la búsqueda."""
+    normalizado = normalizar(q)
+    if not normalizado:
+        return queryset.none()
+    return (
+        filtrar(queryset, normalizado)
+        .annotate(_prefijo=Case(
+            When(busqueda__startswith=normalizado, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ))
+        .order_by("_prefijo", "busqueda", "id")[:k]
+    )
@@ -0,0 +1,56 @@
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.template import engines
+from django.urls import URLPattern, resolve, reverse
+from django.utils import formats, translation
+
+
+def _plantillas():
+    """Nombres de las plantillas de ``tienda`` y del directorio de plantillas del proyecto."""
+    directorios = [Path(apps.get_app_config("tienda").path) / "templates"]
+    for motor in settings.TEMPLATES:
+        directorios += [Path(d) for d in motor.get("DIRS", [])]
+    for directorio in directorios:
+        for ruta in sorted(directorio.rglob("*.html")):
+            yield ruta.relative_to(directorio).as_posix()
+
+
+def _urls():
+    """Rutas de ejemplo de cada URL con nombre de ``tienda`` (``pk`` y similares valen 1)."""
+    from tienda import urls
+
+    for patron in urls.urlpatterns:
+        if isinstance(patron, URLPattern) and patron.name:
+            kwargs = dict.fromkeys(patron.pattern.converters, 1)
+            yield reverse(f"tienda:{patron.name}", kwargs=kwargs)
+
+
+def calentar():
+    """Deja compiladas las plantillas y resueltas las URLs antes de la primera petición.
+
+    Sin esto cada worker nuevo paga en sus primeras peticiones la compilación
+    de cada plantilla (el loader cacheado las guarda compiladas), armar el
+    resolver de URLs y cargar las traducciones y formatos de ``LANGUAGE_CODE``.
+    No consulta la base, así que puede correr en el maestro de gunicorn antes
+    del fork. Devuelve ``{"plantillas", "urls", "ms"}``.
+    """
+    inicio = time.perf_counter()
+    motor = engines["django"]
+    plantillas = 0
+    for nombre in _plantillas():
+        motor.get_template(nombre)
+        plantillas += 1
+
+    urls = 0
+    for ruta in _urls():
+        resolve(ruta)
+        urls += 1
+
+    with translation.override(settings.LANGUAGE_CODE):
+        formats.get_format("DECIMAL_SEPARATOR")
+        formats.get_format("DATETIME_INPUT_FORMATS")
+
+    return {"plantillas": plantillas, "urls": urls, "ms": (time.perf_counter() - inicio) * 1000}
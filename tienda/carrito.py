@@ -0,0 +1,232 @@
+import secrets
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import auditoria
+from .models import DetalleVenta, Producto, Venta
+
+CENTAVOS = Decimal("0.01")
+# Tiempo extra que el carrito vencido sigue en la caché para que el barrido lo encuentre.
+MARGEN = 60 * 60
+COOKIE = "carrito"
+
+# Las cantidades se guardan en centésimas de litro (enteros) para poder usar
+# ``cache.incr``/``cache.decr``, que son atómicos en Redis y en LocMem.
+
+
+def nuevo_token():
+    return secrets.token_hex(16)
+
+
+def _clave(token):
+    return f"carrito:{token}"
+
+
+def _clave_reservado(producto_id):
+    return f"carrito:reservado:{producto_id}"
+
+
+def _clave_vencen(minuto):
+    return f"carrito:vencen:{minuto}"
+
+
+def _a_centesimas(litros):
+    return int(Decimal(litros).quantize(CENTAVOS) * 100)
+
+
+def _a_litros(centesimas):
+    return (Decimal(centesimas) / 100).quantize(CENTAVOS)
+
+
+class CarritoOcupado(Exception):
+    """Otro pedido tiene tomado el carrito; las vistas responden 409."""
+
+
+@contextmanager
+def _bloqueo(clave, espera=5.0):
+    """Exclusión mutua entre procesos con ``cache.add`` (solo para operaciones cortas)."""
+    clave = f"{clave}:bloqueo"
+    limite = time.monotonic() + espera
+    while not cache.add(clave, 1, timeout=10):
+        if time.monotonic() > limite:
+            raise CarritoOcupado("El carrito está ocupado, intentá de nuevo.")
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        cache.delete(clave)
+
+
+def _reservar(producto_id, centesimas):
+    """Suma ``centesimas`` a lo reservado del producto y devuelve el nuevo total."""
+    clave = _clave_reservado(producto_id)
+    for _intento in range(3):
+        cache.add(clave, 0, timeout=None)
+        try:
+            return cache.incr(clave, centesimas)
+        except ValueError:
+            # La caché descartó el contador entre add e incr.
+            continue
+    raise ValueError("No se pudo reservar el stock, intentá de nuevo.")
+
+
+def _soltar(lineas):
+    for producto_id, centesimas in lineas.items():
+        try:
+            cache.decr(_clave_reservado(producto_id), centesimas)
+        except ValueError:
+            # El contador ya no está (la caché lo descartó): no queda nada que liberar.
+            pass
+
+
+def _leer(token, ahora=None):
+    """Carrito vigente de ``token``; si venció, libera sus reservas y lo borra.
+
+    Puede escribir, así que se llama con ``_bloqueo(_clave(token))`` tomado.
+    """
+    carrito = cache.get(_clave(token))
+    if carrito is None:
+        return {"lineas": {}, "vence": 0}
+    if carrito["vence"] <= (ahora or time.time()):
+        _soltar(carrito["lineas"])
+        cache.delete(_clave(token))
+        return {"lineas": {}, "vence": 0}
+    return carrito
+
+
+def _guardar(token, carrito):
+    """Guarda el carrito y renueva el plazo de sus reservas."""
+    if not carrito["lineas"]:
+        cache.delete(_clave(token))
+        return
+    carrito["vence"] = time.time() + settings.CARRITO_RESERVA
+    cache.set(_clave(token), carrito, settings.CARRITO_RESERVA + MARGEN)
+
+    # Índice por minuto de vencimiento para que el barrido no recorra todos los carritos.
+    clave = _clave_vencen(int(carrito["vence"] // 60))
+    with _bloqueo(clave):
+        tokens = cache.get(clave) or set()
+        tokens.add(token)
+        cache.set(clave, tokens, settings.CARRITO_RESERVA + MARGEN)
+
+
+def lineas(token):
+    """``{producto_id: litros}`` del carrito (vacío si no existe o venció)."""
+    with _bloqueo(_clave(token)):
+        carrito = _leer(token)
+    return {pk: _a_litros(c) for pk, c in carrito["lineas"].items()}
+
+
+def reservado(producto_ids):
+    """Litros reservados por todos los carritos vigentes, por producto."""
+    claves = {_clave_reservado(pk): pk for pk in producto_ids}
+    valores = cache.get_many(list(claves))
+    return {pk: _a_litros(max(valores.get(clave, 0), 0)) for clave, pk in claves.items()}
+
+
+def agregar(token, producto_id, litros):
+    """Suma ``litros`` de un producto al carrito y los reserva.
+
+    Solo se lee el stock del producto; la reserva es un ``incr`` en la caché y,
+    si con ella se supera el stock, se deshace con ``decr``. Así dos carritos
+    no pueden quedarse con los mismos litros. Lanza ``ValueError`` si no alcanza.
+    """
+    centesimas = _a_centesimas(litros)
+    if centesimas <= 0:
+        raise ValueError("Los litros deben ser mayores que cero.")
+    fila = Producto.objects.filter(pk=producto_id, activo=True).values_list("nombre", "stock_litros").first()
+    if fila is None:
+        raise ValueError("Producto inexistente.")
+    nombre, stock = fila
+
+    with _bloqueo(_clave(token)):
+        carrito = _leer(token)
+        total = _reservar(producto_id, centesimas)
+        if total > _a_centesimas(stock or 0):
+            _soltar({producto_id: centesimas})
+            disponible = max(_a_centesimas(stock or 0) - (total - centesimas), 0)
+            raise ValueError(
+                f"Stock insuficiente para {nombre}. Disponible: {_a_litros(disponible)}, solicitado: {_a_litros(centesimas)}"
+            )
+        carrito["lineas"][producto_id] = carrito["lineas"].get(producto_id, 0) + centesimas
+        _guardar(token, carrito)
+
+
+def quitar(token, producto_id):
+    with _bloqueo(_clave(token)):
+        carrito = _leer(token)
+        centesimas = carrito["lineas"].pop(producto_id, None)
+        if centesimas:
+            _soltar({producto_id: centesimas})
+        _guardar(token, carrito)
+
+
+def vaciar(token):
+    with _bloqueo(_clave(token)):
+        carrito = _leer(token)
+        _soltar(carrito["lineas"])
+        cache.delete(_clave(token))
+
+
+def confirmar(token, cliente):
+    """Convierte el carrito en una ``Venta`` confirmada y libera sus reservas.
+
+    Es el único paso que escribe en las tablas: la venta, sus detalles con un
+    ``bulk_create`` y un solo ``Venta.confirmar``, que respeta lo reservado por
+    los demás carritos (no lo propio) y rechaza productos desactivados. Si
+    ``confirmar`` falla el carrito queda intacto y el ``ValueError`` se propaga.
+    """
+    with _bloqueo(_clave(token)):
+        carrito = _leer(token)
+        if not carrito["lineas"]:
+            raise ValueError("El carrito está vacío.")
+        reservas = {
+            pk: max(litros - _a_litros(carrito["lineas"].get(pk, 0)), Decimal("0"))
+            for pk, litros in reservado(list(carrito["lineas"])).items()
+        }
+        with transaction.atomic():
+            venta = Venta.objects.create(cliente=cliente)
+            detalles = DetalleVenta.objects.bulk_create([
+                DetalleVenta(venta=venta, producto_id=pk, litros=_a_litros(c))
+                for pk, c in carrito["lineas"].items()
+            ])
+            # bulk_create no dispara señales: la bitácora se anota a mano.
+            auditoria.registrar_varios("crear", detalles)
+            venta.confirmar(reservas)
+        _soltar(carrito["lineas"])
+        cache.delete(_clave(token))
+    return venta
+
+
+def barrer(ahora=None):
+    """Libera las reservas de los carritos vencidos; devuelve cuántos se liberaron.
+
+    Recorre solo los índices por minuto desde el último barrido hasta el minuto
+    anterior al actual, así que el costo depende de los carritos que vencieron.
+    """
+    ahora = ahora or time.time()
+    hasta = int(ahora // 60)
+    desde = cache.get("carrito:barrido")
+    if desde is None:
+        desde = hasta - (settings.CARRITO_RESERVA + MARGEN) // 60 - 1
+
+    liberados = 0
+    for minuto in range(desde, hasta):
+        clave = _clave_vencen(minuto)
+        with _bloqueo(clave):
+            tokens = cache.get(clave) or set()
+            cache.delete(clave)
+        for token in tokens:
+            with _bloqueo(_clave(token)):
+                carrito = cache.get(_clave(token))
+                # Si el carrito se renovó, su vencimiento está en otro índice.
+                if carrito is not None and carrito["vence"] <= ahora:
+                    _leer(token, ahora)
+                    liberados += 1
+    cache.set("carrito:barrido", max(desde, hasta), timeout=None)
+    return liberados
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends cuya caché vive dentro de cada proceso.
+CACHES_POR_PROCESO = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def cache_compartida():
+    """Si todos los procesos (workers, ``liberar_reservas``) ven la misma caché ``default``."""
+    return settings.CACHES["default"]["BACKEND"] not in CACHES_POR_PROCESO
+
+
+@register(Tags.caches, deploy=True)
+def revisar_cache(app_configs, **kwargs):
+    if cache_compartida():
+        return []
+    return [Error(
+        "La caché 'default' es local a cada proceso.",
+        hint=(
+            "Configurá REDIS_URL. Los carritos y sus reservas, las versiones del catálogo y los "
+            "mapas de precios tienen que ser los mismos en todos los workers y en liberar_reservas."
+        ),
+        id="tienda.E001",
+    )]
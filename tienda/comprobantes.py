@@ -0,0 +1,158 @@
+import atexit
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.template.loader import render_to_string
+
+from .models import Venta
+
+try:
+    from xhtml2pdf import pisa
+except ImportError:  # sin xhtml2pdf se guarda el HTML listo para imprimir
+    pisa = None
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+TIMEOUT_PAGINA = 60 * 60 * 24 * 7
+
+
+def _clave_version(venta_id):
+    return f"venta:version:{venta_id}"
+
+
+def clave_pagina(venta_id, version):
+    """Clave de caché de la página de detalle ya renderizada de una venta."""
+    return f"venta:detalle:{venta_id}:{version}"
+
+
+async def aversion(venta_id):
+    """Versión de la página de detalle de la venta; cambia con cada corrección confirmada.
+
+    Una página renderizada antes de la corrección queda guardada bajo la versión
+    vieja, que ya nadie lee. Si la caché perdió la clave se reinicia con la hora
+    actual en milisegundos.
+    """
+    clave = _clave_version(venta_id)
+    valor = await cache.aget(clave)
+    if valor is None:
+        ahora = int(time.time() * 1000)
+        await cache.aadd(clave, ahora, TIMEOUT_PAGINA)
+        valor = await cache.aget(clave, ahora)
+    return valor
+
+
+def invalidar(venta_id):
+    """Descarta la página de detalle y el comprobante, una vez confirmada la transacción en curso.
+
+    La página pasa a una versión nueva y se borra el puntero ``ventas/<id>``:
+    el próximo pedido del comprobante lo genera de nuevo con la venta corregida.
+    """
+    def _invalidar():
+        try:
+            cache.incr(_clave_version(venta_id))
+        except ValueError:
+            cache.set(_clave_version(venta_id), int(time.time() * 1000), TIMEOUT_PAGINA)
+        (_directorio() / "ventas" / str(venta_id)).unlink(missing_ok=True)
+
+    transaction.on_commit(_invalidar)
+
+
+def _directorio():
+    return Path(settings.COMPROBANTES_DIR)
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.COMPROBANTES_WORKERS,
+                thread_name_prefix="comprobantes",
+            )
+            atexit.register(_executor.shutdown, wait=True)
+        return _executor
+
+
+def _renderizar(venta):
+    html = render_to_string("tienda/venta_pdf.html", {"venta": venta})
+    if pisa is None:
+        return html.encode("utf-8"), "html"
+    salida = io.BytesIO()
+    resultado = pisa.CreatePDF(html, dest=salida, encoding="utf-8")
+    if resultado.err:
+        raise RuntimeError(f"No se pudo generar el PDF de la venta {venta.pk}")
+    return salida.getvalue(), "pdf"
+
+
+def _escribir(destino, contenido):
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=destino.parent)
+    with os.fdopen(fd, "wb") as f:
+        f.write(contenido)
+    os.replace(temporal, destino)
+
+
+def ruta(venta_id):
+    """Archivo ya generado para la venta, o ``None``."""
+    indice = _directorio() / "ventas" / str(venta_id)
+    try:
+        relativa = indice.read_text().strip()
+    except FileNotFoundError:
+        return None
+    archivo = _directorio() / relativa
+    return archivo if archivo.exists() else None
+
+
+def generar(venta_id):
+    """Genera (una sola vez) el comprobante de la venta y devuelve su ruta.
+
+    El archivo se guarda bajo el hash de su contenido y ``ventas/<id>`` apunta a
+    él; si el admin corrige la venta, ``invalidar`` borra el puntero y el
+    siguiente pedido genera el comprobante nuevo.
+    """
+    existente = ruta(venta_id)
+    if existente is not None:
+        return existente
+
+    venta = (
+        Venta.objects.select_related("cliente")
+        .prefetch_related("detalles__producto")
+        .get(pk=venta_id)
+    )
+    contenido, extension = _renderizar(venta)
+    digest = hashlib.sha256(contenido).hexdigest()
+    relativa = f"{digest[:2]}/{digest}.{extension}"
+
+    archivo = _directorio() / relativa
+    if not archivo.exists():
+        _escribir(archivo, contenido)
+    _escribir(_directorio() / "ventas" / str(venta_id), relativa.encode())
+    return archivo
+
+
+def _generar_en_segundo_plano(venta_id):
+    close_old_connections()
+    try:
+        generar(venta_id)
+    except Exception:
+        logger.exception("Error generando el comprobante de la venta %s", venta_id)
+    finally:
+        close_old_connections()
+
+
+def encolar(venta_id):
+    """Genera el comprobante en el pool de fondo una vez confirmada la transacción."""
+    transaction.on_commit(lambda: _pool().submit(_generar_en_segundo_plano, venta_id))
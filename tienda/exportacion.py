@@ -0,0 +1,134 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import DetalleVenta
+
+COLUMNAS = ["venta", "fecha", "cliente", "nit", "producto", "litros", "precio_unitario", "subtotal"]
+
+
+class _Eco:
+    """Pseudo-archivo para ``csv.writer``: devuelve la línea en lugar de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _consulta(inicio, fin, using=None):
+    """Líneas de venta del rango, ya unidas con su venta y cliente.
+
+    Se recorre con ``iterator()`` (o ``_aiterar``): en PostgreSQL usa un cursor
+    del lado del servidor, así que la memoria no crece con el tamaño de la
+    exportación. ``using`` fija la base porque el generador se consume después
+    de que la vista retornó.
+    """
+    return (
+        DetalleVenta.objects.using(using).filter(venta__fecha__gte=inicio, venta__fecha__lt=fin)
+        .order_by("venta_id", "id")
+        .values_list(
+            "venta_id", "venta__fecha", "venta__cliente__nombres", "venta__cliente__apellidos",
+            "venta__cliente__nit", "producto__nombre", "litros", "precio_unitario", "subtotal",
+        )
+    )
+
+
+async def _aiterar(consulta, chunk_size):
+    """Recorre ``consulta.iterator()`` desde código async, un bloque por vez en el hilo del ORM.
+
+    ``aiterator()`` no sirve aquí: con ``values_list`` ejecuta la consulta en el
+    event loop y lanza ``SynchronousOnlyOperation``.
+    """
+    filas = consulta.iterator(chunk_size=chunk_size)
+    siguiente_bloque = sync_to_async(lambda: list(islice(filas, chunk_size)))
+    while bloque := await siguiente_bloque():
+        for fila in bloque:
+            yield fila
+
+
+def _linea_csv(writer, fila):
+    venta_id, fecha, nombres, apellidos, nit, producto, litros, precio, subtotal = fila
+    return writer.writerow([
+        venta_id,
+        timezone.localtime(fecha).strftime("%Y-%m-%d %H:%M"),
+        f"{nombres} {apellidos}".strip(),
+        nit,
+        producto,
+        litros,
+        precio,
+        subtotal,
+    ])
+
+
+class _PorVenta:
+    """Junta las líneas (ordenadas por venta) en un objeto JSON por venta."""
+
+    def __init__(self):
+        self.actual = None
+
+    def agregar(self, fila):
+        """Suma la línea; si empezó otra venta, devuelve la anterior ya serializada."""
+        venta_id, fecha, nombres, apellidos, nit, producto, litros, precio, subtotal = fila
+        terminada = None
+        if self.actual is None or self.actual["venta"] != venta_id:
+            terminada = self.cerrar()
+            self.actual = {
+                "venta": venta_id,
+                "fecha": timezone.localtime(fecha).isoformat(),
+                "cliente": f"{nombres} {apellidos}".strip(),
+                "nit": nit,
+                "detalles": [],
+            }
+        self.actual["detalles"].append({
+            "producto": producto,
+            "litros": str(litros),
+            "precio_unitario": str(precio),
+            "subtotal": str(subtotal),
+        })
+        return terminada
+
+    def cerrar(self):
+        if self.actual is None:
+            return None
+        return json.dumps(self.actual, ensure_ascii=False) + "\n"
+
+
+def filas_csv(inicio, fin, chunk_size=2000, using=None):
+    writer = csv.writer(_Eco())
+    yield writer.writerow(COLUMNAS)
+    for fila in _consulta(inicio, fin, using).iterator(chunk_size=chunk_size):
+        yield _linea_csv(writer, fila)
+
+
+async def afilas_csv(inicio, fin, chunk_size=2000, using=None):
+    """Versión async de ``filas_csv`` para ASGI, que no consume el generador de una vez."""
+    writer = csv.writer(_Eco())
+    yield writer.writerow(COLUMNAS)
+    async for fila in _aiterar(_consulta(inicio, fin, using), chunk_size):
+        yield _linea_csv(writer, fila)
+
+
+def lineas_jsonl(inicio, fin, chunk_size=2000, using=None):
+    """Un objeto JSON por venta con sus detalles; las filas llegan ordenadas por venta."""
+    ventas = _PorVenta()
+    for fila in _consulta(inicio, fin, using).iterator(chunk_size=chunk_size):
+        linea = ventas.agregar(fila)
+        if linea is not None:
+            yield linea
+    linea = ventas.cerrar()
+    if linea is not None:
+        yield linea
+
+
+async def alineas_jsonl(inicio, fin, chunk_size=2000, using=None):
+    """Versión async de ``lineas_jsonl`` para ASGI."""
+    ventas = _PorVenta()
+    async for fila in _aiterar(_consulta(inicio, fin, using), chunk_size):
+        linea = ventas.agregar(fila)
+        if linea is not None:
+            yield linea
+    linea = ventas.cerrar()
+    if linea is not None:
+        yield linea
@@ -0,0 +1,15 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def limites(desde, hasta):
+    """Convierte un rango de fechas locales en ``[inicio, fin)`` con datetimes conscientes.
+
+    Filtrar ``fecha__gte=inicio, fecha__lt=fin`` sobre la columna cruda (en lugar de
+    truncarla a fecha) permite que la base de datos use un índice sobre ``fecha``.
+    """
+    tz = timezone.get_current_timezone()
+    inicio = timezone.make_aware(datetime.combine(desde, time.min), tz)
+    fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min), tz)
+    return inicio, fin
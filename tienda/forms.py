@@ -1,31 +1,213 @@
+from decimal import Decimal
+
 from django import forms
-from django.forms import inlineformset_factory
-from .models import Producto, Cliente, Venta, DetalleVenta
+from django.db import transaction
+from django.forms import BaseInlineFormSet, inlineformset_factory
+from django.urls import reverse_lazy
+from . import precios
+from .models import MovimientoStock, Producto, Cliente, Venta, DetalleVenta
+
+# Con más productos que esto, las filas de venta usan búsqueda en vez de <select>.
+MAX_OPCIONES_SELECT = 200
 
 class ProductoForm(forms.ModelForm):
     class Meta:
         model = Producto
         fields = ['nombre', 'tipo', 'precio_litro', 'stock_litros', 'activo']
 
+    def save(self, commit=True):
+        """Guarda el producto y deja el cambio de stock en el libro de movimientos.
+
+        Un aumento se registra como reposición y una baja como ajuste. El stock
+        anterior se lee bloqueado para que el movimiento refleje exactamente lo
+        que se sobrescribe.
+        """
+        if not commit:
+            return super().save(commit=False)
+        with transaction.atomic():
+            anterior = Decimal('0')
+            if self.instance.pk:
+                anterior = Producto.objects.select_for_update().filter(pk=self.instance.pk).values_list(
+                    'stock_litros', flat=True
+                ).first() or Decimal('0')
+            producto = super().save()
+            delta = (producto.stock_litros or Decimal('0')) - anterior
+            if delta:
+                MovimientoStock.objects.create(
+                    producto=producto,
+                    tipo=MovimientoStock.REPOSICION if delta > 0 else MovimientoStock.AJUSTE,
+                    litros=delta,
+                    nota='Edición del producto',
+                )
+        return producto
+
 
 class ClienteForm(forms.ModelForm):
     class Meta:
         model = Cliente
         fields = ['nombres', 'apellidos', 'telefono', 'nit']
 
+class Autocompletar(forms.Widget):
+    """Campo de texto que busca en un endpoint JSON en lugar de listar todas las opciones."""
+
+    template_name = 'tienda/widgets/autocompletar.html'
+
+    class Media:
+        js = ['tienda/autocompletar.js']
+
+    def __init__(self, modelo, url, attrs=None, textos=None):
+        super().__init__(attrs)
+        self.modelo = modelo
+        self.url = url
+        # {pk: texto} ya cargado; evita una consulta por campo al re-renderizar.
+        self.textos = textos
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        if value in (None, ''):
+            texto = ''
+        elif self.textos is not None:
+            texto = self.textos.get(_entero(value), '')
+        else:
+            obj = self.modelo.objects.filter(pk=value).first()
+            texto = str(obj) if obj else ''
+        context['widget'].update({'url': self.url, 'texto': texto})
+        return context
+
+
 class VentaForm(forms.ModelForm):
     class Meta:
         model = Venta
         fields = ['cliente']
+        widgets = {
+            'cliente': Autocompletar(Cliente, reverse_lazy('tienda:api_buscar_clientes')),
+        }
+
+class CarritoForm(forms.Form):
+    producto = forms.ModelChoiceField(
+        queryset=Producto.objects.filter(activo=True),
+        widget=Autocompletar(Producto, reverse_lazy('tienda:api_buscar_productos')),
+    )
+    litros = forms.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+def _entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProductoEnMapaField(forms.ChoiceField):
+    """Elige un producto de un mapa ``{id: (nombre, precio)}`` ya cargado, sin consultar la base.
+
+    Devuelve el ``id`` del producto. El mapa solo aporta las etiquetas: el precio
+    de la línea lo completa ``Venta.confirmar`` desde la base al guardar.
+    """
+
+    def __init__(self, productos, **kwargs):
+        self.productos = productos
+        super().__init__(**kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        pk = _entero(value)
+        if pk not in self.productos:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        return pk
+
+    def validate(self, value):
+        if value is None and self.required:
+            raise forms.ValidationError(self.error_messages['required'], code='required')
+
+    def prepare_value(self, value):
+        return value.pk if isinstance(value, Producto) else value
+
+    def has_changed(self, initial, data):
+        return str(self.prepare_value(initial) or '') != str(data or '')
+
 
 class DetalleVentaForm(forms.ModelForm):
+    """Línea de venta; ``producto`` no es campo del ModelForm sino un ``ProductoEnMapaField``.
+
+    Así el ModelForm no valida la FK con una consulta por fila: el formset
+    comprueba todos los productos elegidos de una vez (ver ``clean``).
+    """
+
     class Meta:
         model = DetalleVenta
-        fields = ['producto', 'litros', 'precio_unitario']
+        fields = ['litros', 'precio_unitario']
+
+    def __init__(self, *args, productos=None, opciones=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if productos is None:
+            productos = precios.opciones_productos()
+            opciones = _opciones(productos)
+        campo = ProductoEnMapaField(productos, choices=opciones, widget=self._widget(productos, opciones))
+        self.fields = {'producto': campo, **self.fields}
+        if self.instance.producto_id:
+            self.initial.setdefault('producto', self.instance.producto_id)
+
+    def clean(self):
+        datos = super().clean()
+        if datos.get('producto'):
+            self.instance.producto_id = datos['producto']
+        return datos
+
+    @staticmethod
+    def _widget(productos, opciones):
+        if len(productos) > MAX_OPCIONES_SELECT:
+            return Autocompletar(
+                Producto, reverse_lazy('tienda:api_buscar_productos'),
+                textos={pk: nombre for pk, (nombre, _p) in productos.items()},
+            )
+        return forms.Select
+
+
+def _opciones(productos):
+    return [('', '---------')] + [(pk, nombre) for pk, (nombre, _p) in productos.items()]
+
+
+class BaseDetalleVentaFormSet(BaseInlineFormSet):
+    """Carga los productos activos una vez (o de la caché) y los comparte entre todas las filas.
+
+    Renderizar y validar el formulario cuesta lo mismo con 3 filas que con 50:
+    la caché solo arma las opciones y ``clean`` confirma contra la base, en una
+    consulta, que los productos elegidos siguen existiendo y activos.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.productos = precios.opciones_productos()
+        self.opciones = _opciones(self.productos)
+        super().__init__(*args, **kwargs)
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs.update(productos=self.productos, opciones=self.opciones)
+        return kwargs
+
+    def clean(self):
+        super().clean()
+        elegidos = {}
+        for form in self.forms:
+            pk = getattr(form, 'cleaned_data', {}).get('producto')
+            if pk and not self._should_delete_form(form):
+                elegidos.setdefault(pk, []).append(form)
+        if not elegidos:
+            return
+        activos = set(Producto.objects.filter(pk__in=elegidos, activo=True).values_list('pk', flat=True))
+        for pk, forms_producto in elegidos.items():
+            if pk not in activos:
+                for form in forms_producto:
+                    form.add_error('producto', forms.ValidationError(
+                        form.fields['producto'].error_messages['invalid_choice'], code='invalid_choice', params={'value': pk},
+                    ))
+
 
 DetalleVentaFormSet = inlineformset_factory(
     Venta, DetalleVenta,
     form=DetalleVentaForm,
+    formset=BaseDetalleVentaFormSet,
     extra=3,
     can_delete=True
 )
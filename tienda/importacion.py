@@ -0,0 +1,155 @@
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import auditoria, versiones
+from .models import MovimientoStock, Producto
+
+COLUMNAS = ("Nombre", "Tipo", "PrecioLitro", "Stock", "Activo")
+CAMPOS_ACTUALIZABLES = ["tipo", "precio_litro", "stock_litros", "activo", "busqueda"]
+MAX_ERRORES = 1000
+
+_VERDADERO = {"1", "si", "sí", "s", "true", "t", "x", "activo", "yes", "y"}
+_FALSO = {"0", "no", "n", "false", "f", "inactivo"}
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.creados = 0
+        self.actualizados = 0
+        self.total_errores = 0
+        self.errores = []
+
+    def agregar_error(self, linea, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append((linea, mensaje))
+
+
+def _decimal(valor, columna, campo):
+    """Número de la celda ajustado al campo del modelo, o ``None`` si viene vacía."""
+    valor = (valor or "").strip()
+    if not valor:
+        return None
+    try:
+        numero = Decimal(valor.replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"{columna} no es un número: {valor!r}")
+    if not numero.is_finite() or numero < 0:
+        raise ValueError(f"{columna} debe ser un número positivo.")
+    modelo = Producto._meta.get_field(campo)
+    tope = Decimal(10) ** (modelo.max_digits - modelo.decimal_places)
+    # Se compara antes de redondear (quantize falla con números enormes) y después:
+    # 99999999.999 redondeado ya no entra.
+    if numero < tope:
+        numero = numero.quantize(Decimal(1).scaleb(-modelo.decimal_places))
+    if numero >= tope:
+        raise ValueError(f"{columna} demasiado grande: {valor!r}")
+    return numero
+
+
+def _booleano(valor):
+    valor = (valor or "").strip().lower()
+    if not valor or valor in _VERDADERO:
+        return True
+    if valor in _FALSO:
+        return False
+    raise ValueError(f"Activo no reconocido: {valor!r}")
+
+
+def _fila_a_datos(fila):
+    nombre = (fila.get("Nombre") or "").strip()
+    if not nombre:
+        raise ValueError("Nombre vacío.")
+    if len(nombre) > Producto._meta.get_field("nombre").max_length:
+        raise ValueError("Nombre demasiado largo.")
+    datos = {
+        "tipo": (fila.get("Tipo") or "").strip()[:Producto._meta.get_field("tipo").max_length],
+        "activo": _booleano(fila.get("Activo")),
+    }
+    # Precio o stock vacíos no se tocan: un producto existente conserva su valor
+    # y uno nuevo toma el del modelo.
+    for columna, campo in (("PrecioLitro", "precio_litro"), ("Stock", "stock_litros")):
+        numero = _decimal(fila.get(columna), columna, campo)
+        if numero is not None:
+            datos[campo] = numero
+    return nombre, datos
+
+
+def importar_productos(archivo, lote=1000):
+    """Crea o actualiza productos (por nombre) leyendo un CSV de texto línea a línea.
+
+    El archivo nunca se carga completo: cada ``lote`` filas válidas se resuelven con
+    una consulta de existentes, un ``bulk_create`` y un ``bulk_update``. Las filas
+    inválidas (incluidos números que no entran en la columna) se reportan con su
+    número de línea y no detienen la importación.
+    """
+    resultado = ResultadoImportacion()
+    lector = csv.DictReader(archivo)
+
+    faltantes = [c for c in COLUMNAS if c not in (lector.fieldnames or [])]
+    if faltantes:
+        resultado.agregar_error(1, f"Faltan columnas: {', '.join(faltantes)}")
+        return resultado
+
+    pendientes = {}
+    for fila in lector:
+        try:
+            nombre, datos = _fila_a_datos(fila)
+        except ValueError as exc:
+            resultado.agregar_error(lector.line_num, str(exc))
+            continue
+
+        # Si el nombre se repite dentro del lote, gana la última línea.
+        pendientes[nombre] = datos
+        if len(pendientes) >= lote:
+            _guardar_lote(pendientes, resultado)
+            pendientes = {}
+
+    if pendientes:
+        _guardar_lote(pendientes, resultado)
+    return resultado
+
+
+@transaction.atomic
+def _guardar_lote(pendientes, resultado):
+    existentes = {}
+    # Bloqueados hasta el final del lote: una venta concurrente espera y no se
+    # pisa su descuento, y el ajuste del libro parte del stock real.
+    for producto in Producto.objects.select_for_update().filter(nombre__in=list(pendientes)).order_by("-id"):
+        # Con nombres duplicados en la base se actualiza el más antiguo.
+        existentes[producto.nombre] = producto
+
+    nuevos = []
+    actualizados = []
+    diferencias = []
+    for nombre, datos in pendientes.items():
+        producto = existentes.get(nombre)
+        if producto is None:
+            producto = Producto(nombre=nombre, **datos)
+            nuevos.append(producto)
+            anterior = Decimal("0")
+        else:
+            anterior = producto.stock_litros or Decimal("0")
+            for campo, valor in datos.items():
+                setattr(producto, campo, valor)
+            actualizados.append(producto)
+        # bulk_create/bulk_update no pasan por save().
+        producto.busqueda = producto.texto_busqueda()
+        if producto.stock_litros != anterior:
+            diferencias.append((producto, producto.stock_litros - anterior))
+
+    Producto.objects.bulk_create(nuevos)
+    Producto.objects.bulk_update(actualizados, CAMPOS_ACTUALIZABLES)
+    movimientos = MovimientoStock.objects.bulk_create([
+        MovimientoStock(producto=producto, tipo=MovimientoStock.AJUSTE, litros=delta, nota="Importación CSV")
+        for producto, delta in diferencias
+    ])
+    # bulk_create/bulk_update no disparan señales: la bitácora se anota a mano.
+    auditoria.registrar_varios("crear", [*nuevos, *movimientos])
+    auditoria.registrar_varios("editar", actualizados)
+    versiones.incrementar("catalogo")
+    versiones.incrementar("precios")
+    resultado.creados += len(nuevos)
+    resultado.actualizados += len(actualizados)
@@ -0,0 +1,199 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import auditoria, carrito
+from .models import (
+    Cliente, DetalleVenta, MovimientoStock, Producto, Venta, acumular_clientes, acumular_resumenes, descontar_stock,
+)
+
+CENTAVOS = Decimal("0.01")
+
+
+def _decimal(valor):
+    """Convierte a ``Decimal`` con a lo sumo dos decimales; ``None`` si no es válido."""
+    try:
+        numero = Decimal(str(valor))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not numero.is_finite() or numero.as_tuple().exponent < -2:
+        return None
+    return numero
+
+
+def _es_id(valor):
+    # bool es subclase de int: True/False no son ids.
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+def registrar_ventas_en_lote(ventas_data, permitir_precios=True):
+    """Valida e inserta varias ventas con un número fijo de consultas.
+
+    ``ventas_data`` es una lista de dicts ``{"cliente": id, "detalles": [{"producto": id,
+    "litros": "3.5", "precio_unitario": "10.00"}]}`` (``precio_unitario`` es opcional y,
+    con ``permitir_precios=False``, se ignora: se cobra el precio del producto).
+    Devuelve un resultado por venta, en el mismo orden: las ventas inválidas o sin
+    stock suficiente se reportan con sus errores y no impiden registrar las demás.
+    """
+    cliente_ids = set()
+    producto_ids = set()
+    for venta_data in ventas_data:
+        if not isinstance(venta_data, dict):
+            continue
+        cliente_ids.add(venta_data.get("cliente"))
+        detalles = venta_data.get("detalles")
+        for detalle_data in detalles if isinstance(detalles, list) else []:
+            if isinstance(detalle_data, dict):
+                producto_ids.add(detalle_data.get("producto"))
+
+    cliente_ids = {pk for pk in cliente_ids if _es_id(pk)}
+    producto_ids = {pk for pk in producto_ids if _es_id(pk)}
+
+    with transaction.atomic():
+        clientes = set(Cliente.objects.filter(pk__in=cliente_ids).values_list("pk", flat=True))
+        # Bloqueo en orden de pk para que dos lotes concurrentes no se crucen.
+        productos = {
+            p.pk: p
+            for p in Producto.objects.select_for_update().filter(pk__in=producto_ids, activo=True).order_by("pk")
+        }
+        # Lo reservado por carritos no se vende: la misma foto se usa al descontar.
+        reservas = carrito.reservado(list(productos))
+        disponibles = {
+            pk: max((p.stock_litros or Decimal("0")) - reservas[pk], Decimal("0")) for pk, p in productos.items()
+        }
+
+        resultados = []
+        aceptadas = []
+        consumos = {}
+
+        for indice, venta_data in enumerate(ventas_data):
+            errores, lineas = _validar_venta(venta_data, clientes, productos, permitir_precios)
+
+            if not errores:
+                pedido = {}
+                for producto, litros, _precio in lineas:
+                    pedido[producto.pk] = pedido.get(producto.pk, Decimal("0")) + litros
+                for pk, litros in pedido.items():
+                    if litros > disponibles[pk]:
+                        errores.append(
+                            f"Stock insuficiente para {productos[pk].nombre}. "
+                            f"Disponible: {disponibles[pk]}, solicitado: {litros}"
+                        )
+
+            if errores:
+                resultados.append({"indice": indice, "ok": False, "errores": errores})
+                continue
+
+            for pk, litros in pedido.items():
+                disponibles[pk] -= litros
+                consumos[pk] = consumos.get(pk, Decimal("0")) + litros
+
+            # Igual que DetalleVenta.subtotal: cada línea redondeada a centavos.
+            total = sum((_subtotal(litros, precio) for _p, litros, precio in lineas), Decimal("0"))
+            venta = Venta(cliente_id=venta_data["cliente"], total=total)
+            resultado = {"indice": indice, "ok": True, "total": str(total)}
+            aceptadas.append((venta, lineas, resultado))
+            resultados.append(resultado)
+
+        if aceptadas:
+            nuevas = Venta.objects.bulk_create([venta for venta, _l, _r in aceptadas])
+            detalles = DetalleVenta.objects.bulk_create([
+                DetalleVenta(venta=venta, producto=producto, litros=litros, precio_unitario=precio)
+                for venta, lineas, _r in aceptadas
+                for producto, litros, precio in lineas
+            ])
+            descontar_stock(consumos, reservas)
+            movimientos = MovimientoStock.objects.bulk_create([
+                MovimientoStock(producto_id=pk, tipo=MovimientoStock.VENTA, litros=-litros, venta=venta)
+                for venta, lineas, _r in aceptadas
+                for pk, litros in _por_producto(lineas).items()
+            ])
+            # bulk_create no dispara señales: la bitácora se anota a mano.
+            auditoria.registrar_varios("crear", [*nuevas, *detalles, *movimientos])
+            for venta, _l, resultado in aceptadas:
+                resultado["venta"] = venta.pk
+            _acumular_resumenes(aceptadas)
+
+    return resultados
+
+
+def _subtotal(litros, precio):
+    return (litros * precio).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def _por_producto(lineas):
+    litros_por_producto = {}
+    for producto, litros, _precio in lineas:
+        litros_por_producto[producto.pk] = litros_por_producto.get(producto.pk, Decimal("0")) + litros
+    return litros_por_producto
+
+
+def _acumular_resumenes(aceptadas):
+    por_fecha = {}
+    clientes = {}
+    for venta, lineas, _r in aceptadas:
+        por_producto, por_cliente = por_fecha.setdefault(timezone.localdate(venta.fecha), ({}, {}))
+        for producto, litros, precio in lineas:
+            resumen = por_producto.setdefault(producto.pk, {"litros": Decimal("0"), "monto": Decimal("0"), "lineas": 0})
+            resumen["litros"] += litros
+            resumen["monto"] += _subtotal(litros, precio)
+            resumen["lineas"] += 1
+        resumen = por_cliente.setdefault(venta.cliente_id, {"num_ventas": 0, "monto": Decimal("0")})
+        resumen["num_ventas"] += 1
+        resumen["monto"] += venta.total
+
+        cliente = clientes.setdefault(venta.cliente_id, {"num_ventas": 0, "monto": Decimal("0"), "ultima": venta.fecha})
+        cliente["num_ventas"] += 1
+        cliente["monto"] += venta.total
+        cliente["ultima"] = max(cliente["ultima"], venta.fecha)
+
+    for fecha, (por_producto, por_cliente) in por_fecha.items():
+        acumular_resumenes(fecha, por_producto, por_cliente)
+    acumular_clientes(clientes)
+
+
+def _validar_venta(venta_data, clientes, productos, permitir_precios):
+    errores = []
+    lineas = []
+
+    if not isinstance(venta_data, dict):
+        return ["Formato de venta inválido."], lineas
+
+    cliente = venta_data.get("cliente")
+    if not _es_id(cliente) or cliente not in clientes:
+        errores.append("Cliente inexistente.")
+
+    detalles = venta_data.get("detalles")
+    if not isinstance(detalles, list) or not detalles:
+        errores.append("La venta no tiene detalles.")
+        return errores, lineas
+
+    for numero, detalle_data in enumerate(detalles, start=1):
+        if not isinstance(detalle_data, dict):
+            errores.append(f"Detalle {numero}: formato inválido.")
+            continue
+
+        producto_id = detalle_data.get("producto")
+        producto = productos.get(producto_id) if _es_id(producto_id) else None
+        if producto is None:
+            errores.append(f"Detalle {numero}: producto inexistente.")
+            continue
+
+        litros = _decimal(detalle_data.get("litros"))
+        if litros is None or litros <= 0:
+            errores.append(f"Detalle {numero}: litros inválidos.")
+            continue
+
+        precio = detalle_data.get("precio_unitario") if permitir_precios else None
+        if precio in (None, ""):
+            precio = producto.precio_litro or Decimal("0")
+        else:
+            precio = _decimal(precio)
+            if precio is None or precio < 0:
+                errores.append(f"Detalle {numero}: precio inválido.")
+                continue
+
+        lineas.append((producto, litros, precio))
+
+    return errores, lineas
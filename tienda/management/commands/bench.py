@@ -0,0 +1,281 @@
+import io
+import json
+import random
+import statistics
+import tempfile
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from tienda import auditoria
+from tienda import urls as tienda_urls
+from tienda.calentamiento import calentar
+from tienda.models import Cliente, DetalleVenta, Producto, Venta
+
+# Vistas que solo aceptan POST; se miden por separado (confirmar).
+SOLO_POST = {"api_ventas_lote", "carrito_agregar", "carrito_quitar"}
+
+# Parámetros de ejemplo para las vistas que los necesitan.
+PARAMETROS = {
+    "api_buscar_clientes": {"q": "apellido 1"},
+    "api_buscar_productos": {"q": "producto 1"},
+    "api_precios": {},
+    "producto_list": {"q": ""},
+}
+
+PERCENTILES = ("p50", "p95", "p99")
+
+# Va en lugar del pk en las rutas de --rutas; se reemplaza por el pk real.
+MARCADOR_PK = "999999999"
+
+
+class _Contador:
+    """Cuenta consultas con ``execute_wrapper``; ``connection.queries`` se reinicia en cada petición."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+def _percentiles(muestras):
+    if len(muestras) == 1:
+        return dict.fromkeys(PERCENTILES, round(muestras[0], 3))
+    cortes = statistics.quantiles(muestras, n=100, method="inclusive")
+    return {"p50": round(cortes[49], 3), "p95": round(cortes[94], 3), "p99": round(cortes[98], 3)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra una base de prueba con el volumen indicado, mide todas las vistas de "
+        "tienda y Venta.confirmar, y guarda los resultados como JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--productos", type=int, default=500)
+        parser.add_argument("--clientes", type=int, default=2000)
+        parser.add_argument("--ventas", type=int, default=5000)
+        parser.add_argument("--lineas", type=int, default=3, help="Líneas por venta sembrada.")
+        parser.add_argument("--repeticiones", type=int, default=30, help="Peticiones por vista.")
+        parser.add_argument("--lineas-confirmar", default="1,5,20,50", help="Tamaños de venta para confirmar.")
+        parser.add_argument("--confirmaciones", type=int, default=20, help="Ventas confirmadas por tamaño.")
+        parser.add_argument("--salida", default="bench.json", help="Archivo JSON de resultados.")
+        parser.add_argument("--comparar", help="JSON de una corrida anterior para detectar regresiones.")
+        parser.add_argument("--umbral", type=float, default=0.25, help="Aumento relativo tolerado (0.25 = 25%%).")
+        parser.add_argument("--semilla", type=int, default=1)
+        parser.add_argument(
+            "--calentar", action="store_true", help="Calienta plantillas y URLs antes de medir, como gunicorn.conf.py."
+        )
+        parser.add_argument(
+            "--rutas",
+            help=f"JSON {{vista: url}} con {MARCADOR_PK} en lugar del pk. Evita llamar a reverse() en este "
+                 "proceso, que ya armaría el resolver de URLs (lo usa bench_arranque).",
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options["semilla"])
+        self.rutas = None
+        if options["rutas"]:
+            with open(options["rutas"], encoding="utf-8") as f:
+                self.rutas = json.load(f)
+        tamanos = [int(n) for n in options["lineas_confirmar"].split(",") if n.strip()]
+
+        # Antes que nada, como al arrancar gunicorn: así primera_ms compara proceso frío y calentado.
+        calentamiento = calentar() if options["calentar"] else None
+
+        setup_test_environment()
+        nombre_original = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as directorio, override_settings(
+                STORAGES={
+                    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+                },
+                COMPROBANTES_DIR=directorio,
+                AUDITORIA_ASINCRONA=False,
+                # La réplica no apunta a la base de prueba: todo se lee de la sembrada.
+                DATABASE_ROUTERS=[],
+            ):
+                volumen = self._sembrar(options)
+                resultados = {
+                    "fecha": timezone.now().isoformat(),
+                    "volumen": volumen,
+                    "calentamiento": calentamiento,
+                    "vistas": self._medir_vistas(options["repeticiones"]),
+                    "confirmar": self._medir_confirmar(tamanos, options["confirmaciones"]),
+                }
+        finally:
+            # Lo auditado durante la corrida va a la base de prueba, no a la real al salir.
+            auditoria.vaciar()
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+
+        with open(options["salida"], "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        self.stdout.write(f"Resultados en {options['salida']}")
+
+        if options["comparar"]:
+            self._comparar(resultados, options["comparar"], options["umbral"])
+
+    def _sembrar(self, options):
+        inicio = time.perf_counter()
+        productos = Producto.objects.bulk_create(
+            Producto(
+                nombre=f"Producto {i:05d}",
+                tipo=random.choice(["jabon", "desinfectante", "suavizante"]),
+                precio_litro=Decimal(random.randint(100, 5000)) / 100,
+                stock_litros=Decimal("99999999.00"),
+                activo=random.random() > 0.1,
+            )
+            for i in range(options["productos"])
+        )
+        for producto in productos:
+            producto.busqueda = producto.texto_busqueda()
+        Producto.objects.bulk_update(productos, ["busqueda"], batch_size=1000)
+
+        clientes = [
+            Cliente(nombres=f"Nombre {i}", apellidos=f"Apellido {i % 997}", nit=str(1000000 + i))
+            for i in range(options["clientes"])
+        ]
+        for cliente in clientes:
+            cliente.busqueda = cliente.texto_busqueda()
+        clientes = Cliente.objects.bulk_create(clientes, batch_size=1000)
+
+        ventas = Venta.objects.bulk_create(
+            (Venta(cliente=random.choice(clientes)) for _ in range(options["ventas"])), batch_size=1000
+        )
+        detalles = []
+        for venta in ventas:
+            for producto in random.sample(productos, min(options["lineas"], len(productos))):
+                detalles.append(DetalleVenta(
+                    venta=venta, producto=producto,
+                    litros=Decimal(random.randint(1, 2000)) / 100, precio_unitario=producto.precio_litro,
+                ))
+        DetalleVenta.objects.bulk_create(detalles, batch_size=2000)
+        call_command("reconstruir_resumenes", stdout=io.StringIO())
+
+        self.stdout.write(f"Sembrado en {time.perf_counter() - inicio:.1f}s")
+        return {
+            "productos": options["productos"],
+            "clientes": options["clientes"],
+            "ventas": options["ventas"],
+            "lineas_por_venta": options["lineas"],
+        }
+
+    def _url(self, patron):
+        nombre = patron.name
+        kwargs = {}
+        if "pk" in patron.pattern.converters:
+            if nombre.startswith("cliente"):
+                modelo = Cliente
+            elif nombre.startswith("venta"):
+                modelo = Venta
+            else:
+                modelo = Producto
+            kwargs["pk"] = modelo.objects.order_by("pk").values_list("pk", flat=True).first()
+        if self.rutas is not None:
+            return self.rutas[nombre].replace(MARCADOR_PK, str(kwargs.get("pk", "")))
+        return reverse(f"tienda:{nombre}", kwargs=kwargs)
+
+    def _medir_vistas(self, repeticiones):
+        cliente_http = Client()
+        resultados = {}
+        for patron in tienda_urls.urlpatterns:
+            if not isinstance(patron, URLPattern) or patron.name in SOLO_POST:
+                continue
+            url = self._url(patron)
+            params = PARAMETROS.get(patron.name, {})
+
+            cache.clear()
+            consultas = _Contador()
+            with connection.execute_wrapper(consultas):
+                inicio = time.perf_counter()
+                respuesta = cliente_http.get(url, params)
+                if respuesta.streaming:
+                    b"".join(respuesta.streaming_content)
+                primera = (time.perf_counter() - inicio) * 1000
+
+            muestras = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                respuesta = cliente_http.get(url, params)
+                if respuesta.streaming:
+                    b"".join(respuesta.streaming_content)
+                muestras.append((time.perf_counter() - inicio) * 1000)
+
+            resultados[patron.name] = {
+                "url": url,
+                "estado": respuesta.status_code,
+                "primera_ms": round(primera, 3),
+                "consultas": consultas.total,
+                **_percentiles(muestras),
+            }
+            self.stdout.write(f"{patron.name:24} p95={resultados[patron.name]['p95']:8.2f}ms  consultas={consultas.total}")
+        return resultados
+
+    def _medir_confirmar(self, tamanos, cantidad):
+        productos = list(Producto.objects.all()[:max(tamanos)])
+        cliente = Cliente.objects.first()
+        resultados = {}
+        for tamano in tamanos:
+            ventas = Venta.objects.bulk_create(Venta(cliente=cliente) for _ in range(cantidad))
+            DetalleVenta.objects.bulk_create(
+                DetalleVenta(venta=venta, producto=productos[i % len(productos)], litros=Decimal("1.00"))
+                for venta in ventas
+                for i in range(tamano)
+            )
+
+            muestras = []
+            consultas = 0
+            for venta in ventas:
+                contador = _Contador()
+                with connection.execute_wrapper(contador):
+                    inicio = time.perf_counter()
+                    venta.confirmar()
+                    muestras.append((time.perf_counter() - inicio) * 1000)
+                consultas = contador.total
+
+            resultados[str(tamano)] = {
+                "consultas": consultas,
+                "por_segundo": round(1000 * len(muestras) / sum(muestras), 1),
+                **_percentiles(muestras),
+            }
+            self.stdout.write(
+                f"confirmar {tamano:3d} líneas  p50={resultados[str(tamano)]['p50']:7.2f}ms  consultas={consultas}"
+            )
+        return resultados
+
+    def _comparar(self, actuales, ruta, umbral):
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                base = json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"No se pudo leer {ruta}: {exc}")
+
+        regresiones = []
+        for seccion, metrica in (("vistas", "p95"), ("confirmar", "p50")):
+            for nombre, actual in actuales[seccion].items():
+                anterior = base.get(seccion, {}).get(nombre)
+                if not anterior:
+                    continue
+                if actual[metrica] > anterior[metrica] * (1 + umbral):
+                    regresiones.append(f"{seccion}/{nombre} {metrica}: {anterior[metrica]} -> {actual[metrica]} ms")
+                if actual["consultas"] > anterior["consultas"]:
+                    regresiones.append(f"{seccion}/{nombre} consultas: {anterior['consultas']} -> {actual['consultas']}")
+
+        if regresiones:
+            for linea in regresiones:
+                self.stderr.write(f"REGRESIÓN {linea}")
+            raise CommandError(f"{len(regresiones)} regresiones respecto de {ruta}")
+        self.stdout.write(self.style.SUCCESS(f"Sin regresiones respecto de {ruta}"))
@@ -0,0 +1,90 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import URLPattern, reverse
+
+from tienda import urls as tienda_urls
+from tienda.management.commands.bench import MARCADOR_PK, SOLO_POST
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la latencia de la primera petición a cada vista en un proceso recién "
+        "arrancado, sin y con el calentamiento de gunicorn.conf.py (ver bench --calentar)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--productos", type=int, default=200)
+        parser.add_argument("--clientes", type=int, default=200)
+        parser.add_argument("--ventas", type=int, default=500)
+        parser.add_argument("--salida", default="bench_arranque.json", help="Archivo JSON de resultados.")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directorio:
+            # Las rutas se arman aquí: un reverse() en el proceso medido ya calentaría el resolver.
+            with open(os.path.join(directorio, "rutas.json"), "w", encoding="utf-8") as f:
+                json.dump(self._rutas(), f)
+            frio = self._correr(directorio, options, calentar=False)
+            caliente = self._correr(directorio, options, calentar=True)
+
+        vistas = {}
+        for nombre, medicion in frio["vistas"].items():
+            if nombre not in caliente["vistas"]:
+                continue
+            vistas[nombre] = {
+                "frio_ms": medicion["primera_ms"],
+                "caliente_ms": caliente["vistas"][nombre]["primera_ms"],
+            }
+            self.stdout.write(
+                f"{nombre:24} frío={vistas[nombre]['frio_ms']:8.2f}ms  caliente={vistas[nombre]['caliente_ms']:8.2f}ms"
+            )
+        totales = {
+            "frio_ms": round(sum(v["frio_ms"] for v in vistas.values()), 3),
+            "caliente_ms": round(sum(v["caliente_ms"] for v in vistas.values()), 3),
+            "calentamiento_ms": round(caliente["calentamiento"]["ms"], 3),
+        }
+        self.stdout.write(
+            f"{'total':24} frío={totales['frio_ms']:8.2f}ms  caliente={totales['caliente_ms']:8.2f}ms  "
+            f"(calentar al arrancar: {totales['calentamiento_ms']:.2f}ms)"
+        )
+
+        with open(options["salida"], "w", encoding="utf-8") as f:
+            json.dump({"totales": totales, "vistas": vistas}, f, indent=2, ensure_ascii=False)
+        self.stdout.write(f"Resultados en {options['salida']}")
+
+    def _rutas(self):
+        return {
+            patron.name: reverse(
+                f"tienda:{patron.name}", kwargs=dict.fromkeys(patron.pattern.converters, MARCADOR_PK)
+            )
+            for patron in tienda_urls.urlpatterns
+            if isinstance(patron, URLPattern) and patron.name not in SOLO_POST
+        }
+
+    def _correr(self, directorio, options, calentar):
+        """Corre ``bench`` en un proceso nuevo (una petición por vista) y devuelve su JSON."""
+        salida = os.path.join(directorio, "caliente.json" if calentar else "frio.json")
+        comando = [
+            sys.executable, "-m", "django", "bench",
+            "--productos", str(options["productos"]),
+            "--clientes", str(options["clientes"]),
+            "--ventas", str(options["ventas"]),
+            "--repeticiones", "1",
+            "--lineas-confirmar", "1",
+            "--confirmaciones", "1",
+            "--salida", salida,
+            "--rutas", os.path.join(directorio, "rutas.json"),
+        ]
+        if calentar:
+            comando.append("--calentar")
+        entorno = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "core.settings")}
+        proceso = subprocess.run(comando, cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True)
+        if proceso.returncode != 0:
+            raise CommandError(f"bench falló:\n{proceso.stderr[-2000:]}")
+        with open(salida, encoding="utf-8") as f:
+            return json.load(f)
@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from tienda.models import MovimientoStock, Producto, stock_segun_libro
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara Producto.stock_litros con el saldo del libro de movimientos, por bloques. "
+        "Termina con error si hay diferencias, salvo que se use --corregir."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=500, help="Productos por consulta.")
+        parser.add_argument(
+            "--corregir", action="store_true",
+            help="Registra un ajuste por cada diferencia para que el libro coincida con el stock.",
+        )
+
+    def handle(self, *args, **options):
+        lote = max(1, options["lote"])
+        ultimo_pk = 0
+        revisados = 0
+        diferencias = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    Producto.objects.select_for_update().filter(pk__gt=ultimo_pk).order_by("pk")
+                    .values_list("pk", flat=True)[:lote]
+                )
+                if not ids:
+                    break
+                descuadres = [
+                    (pk, nombre, stock or Decimal("0"), libro)
+                    for pk, nombre, stock, libro in stock_segun_libro(ids)
+                    .exclude(stock_litros=F("stock_libro"))
+                    .order_by("pk")
+                    .values_list("pk", "nombre", "stock_litros", "stock_libro")
+                ]
+                for _pk, nombre, stock, libro in descuadres:
+                    self.stdout.write(f"{nombre}: stock {stock}, libro {libro} (diferencia {stock - libro})")
+                if options["corregir"]:
+                    MovimientoStock.objects.bulk_create([
+                        MovimientoStock(producto_id=pk, tipo=MovimientoStock.AJUSTE, litros=stock - libro, nota="Conciliación")
+                        for pk, _nombre, stock, libro in descuadres
+                    ])
+            revisados += len(ids)
+            diferencias += len(descuadres)
+            ultimo_pk = ids[-1]
+
+        if diferencias and not options["corregir"]:
+            raise CommandError(f"{diferencias} de {revisados} productos no coinciden con el libro.")
+        self.stdout.write(self.style.SUCCESS(f"{revisados} productos revisados, {diferencias} diferencias."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda.importacion import importar_productos
+
+
+class Command(BaseCommand):
+    help = "Importa productos desde un CSV con columnas Nombre,Tipo,PrecioLitro,Stock,Activo."
+
+    def add_arguments(self, parser):
+        parser.add_argument("ruta", help="Ruta del archivo CSV (UTF-8).")
+        parser.add_argument("--lote", type=int, default=1000, help="Filas por lote de escritura.")
+
+    def handle(self, *args, **options):
+        try:
+            archivo = open(options["ruta"], encoding="utf-8-sig", newline="")
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        with archivo:
+            resultado = importar_productos(archivo, lote=max(1, options["lote"]))
+
+        for linea, mensaje in resultado.errores:
+            self.stderr.write(f"Línea {linea}: {mensaje}")
+        if resultado.total_errores > len(resultado.errores):
+            self.stderr.write(f"... y {resultado.total_errores - len(resultado.errores)} errores más.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Creados: {resultado.creados}, actualizados: {resultado.actualizados}, "
+            f"con errores: {resultado.total_errores}"
+        ))
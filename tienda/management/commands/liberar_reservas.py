@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda import carrito
+from tienda.checks import cache_compartida
+
+
+class Command(BaseCommand):
+    help = (
+        "Libera las reservas de stock de los carritos vencidos. Programarla cada minuto "
+        "o dejarla corriendo con --cada."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cada", type=float, help="Repetir cada tantos segundos en lugar de salir.")
+
+    def handle(self, *args, **options):
+        if not cache_compartida():
+            # Con una caché por proceso este comando vería una caché vacía y no liberaría nada.
+            raise CommandError("Los carritos necesitan una caché compartida: configurá REDIS_URL.")
+        while True:
+            liberados = carrito.barrer()
+            if liberados or not options["cada"]:
+                self.stdout.write(f"{liberados} carritos vencidos liberados.")
+            if not options["cada"]:
+                return
+            time.sleep(options["cada"])
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from tienda import reposicion
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula el consumo promedio, los días de cobertura y la reposición sugerida de cada "
+        "producto activo a partir de los resúmenes diarios. Programarlo una vez por día."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hasta", help="Último día considerado (AAAA-MM-DD). Por defecto, hoy.")
+        parser.add_argument("--ventana", type=int, default=reposicion.VENTANA, help="Días del promedio móvil.")
+        parser.add_argument("--plazo", type=int, default=reposicion.PLAZO, help="Días que tarda en llegar un pedido.")
+        parser.add_argument(
+            "--cobertura", type=int, default=reposicion.COBERTURA, help="Días de venta que debe cubrir un pedido."
+        )
+
+    def handle(self, *args, **options):
+        hoy = None
+        if options["hasta"]:
+            hoy = parse_date(options["hasta"])
+            if hoy is None:
+                raise CommandError(f"Fecha inválida: {options['hasta']!r}")
+        if options["plazo"] < 0 or options["cobertura"] < 0:
+            raise CommandError("--plazo y --cobertura no pueden ser negativos.")
+
+        cantidad = reposicion.recalcular(hoy, options["ventana"], options["plazo"], options["cobertura"])
+        self.stdout.write(self.style.SUCCESS(f"{cantidad} productos pronosticados."))
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from tienda.models import Cliente, Venta
+
+
+def recalcular_lote(modelo_cliente, modelo_venta, ids):
+    """Recalcula ``total_comprado``, ``num_ventas`` y ``ultima_compra`` de ``ids`` desde sus ventas."""
+    acumulados = {
+        r["cliente_id"]: r
+        for r in modelo_venta.objects.filter(cliente_id__in=ids)
+        .values("cliente_id")
+        .annotate(suma=Sum("total"), cantidad=Count("id"), ultima=Max("fecha"))
+        .order_by()
+    }
+    clientes = list(modelo_cliente.objects.filter(pk__in=ids).only("id"))
+    for cliente in clientes:
+        r = acumulados.get(cliente.pk, {})
+        cliente.total_comprado = r.get("suma") or Decimal("0")
+        cliente.num_ventas = r.get("cantidad", 0)
+        cliente.ultima_compra = r.get("ultima")
+    modelo_cliente.objects.bulk_update(clientes, ["total_comprado", "num_ventas", "ultima_compra"])
+    return len(clientes)
+
+
+class Command(BaseCommand):
+    help = "Recalcula los acumulados de compras de cada cliente a partir de sus ventas, por bloques."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=1000, help="Clientes por transacción.")
+
+    def handle(self, *args, **options):
+        lote = max(1, options["lote"])
+        ultimo_pk = 0
+        total = 0
+        while True:
+            ids = list(Cliente.objects.filter(pk__gt=ultimo_pk).order_by("pk").values_list("pk", flat=True)[:lote])
+            if not ids:
+                break
+            # Bloqueados para que una venta confirmada en medio no se pierda al sobrescribir.
+            with transaction.atomic():
+                list(Cliente.objects.select_for_update().filter(pk__in=ids).values_list("pk", flat=True))
+                total += recalcular_lote(Cliente, Venta, ids)
+            ultimo_pk = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f"{total} clientes recalculados."))
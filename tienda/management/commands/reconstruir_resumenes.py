@@ -0,0 +1,110 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Min, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from tienda.fechas import limites
+from tienda.models import DetalleVenta, Venta, VentaDiariaCliente, VentaDiariaProducto
+
+
+class Command(BaseCommand):
+    help = "Recalcula los resúmenes diarios de ventas a partir de Venta/DetalleVenta."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Primera fecha a recalcular (AAAA-MM-DD). Por defecto, la primera venta.")
+        parser.add_argument("--hasta", help="Última fecha a recalcular (AAAA-MM-DD). Por defecto, la última venta.")
+        parser.add_argument("--dias", type=int, default=31, help="Días por tramo; cada tramo es una transacción.")
+        parser.add_argument("--lote", type=int, default=1000, help="Filas por bulk_create.")
+
+    def handle(self, *args, **options):
+        desde, hasta = self._rango(options["desde"], options["hasta"])
+        if desde is None:
+            self.stdout.write("No hay ventas que resumir.")
+            return
+
+        paso = timedelta(days=max(1, options["dias"]))
+        inicio = desde
+        while inicio <= hasta:
+            fin = min(inicio + paso - timedelta(days=1), hasta)
+            filas = self._reconstruir_tramo(inicio, fin, options["lote"])
+            self.stdout.write(f"{inicio} .. {fin}: {filas} filas")
+            inicio = fin + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS("Resúmenes reconstruidos."))
+
+    def _rango(self, desde, hasta):
+        try:
+            desde = parse_date(desde) if desde else None
+            hasta = parse_date(hasta) if hasta else None
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if desde is None or hasta is None:
+            extremos = Venta.objects.aggregate(primera=Min("fecha"), ultima=Max("fecha"))
+            if extremos["primera"] is None:
+                return None, None
+            desde = desde or timezone.localdate(extremos["primera"])
+            hasta = hasta or timezone.localdate(extremos["ultima"])
+        return desde, hasta
+
+    @transaction.atomic
+    def _reconstruir_tramo(self, desde, hasta, lote):
+        VentaDiariaProducto.objects.filter(fecha__range=(desde, hasta)).delete()
+        VentaDiariaCliente.objects.filter(fecha__range=(desde, hasta)).delete()
+
+        tz = timezone.get_current_timezone()
+        inicio, fin = limites(desde, hasta)
+
+        por_producto = (
+            DetalleVenta.objects.filter(litros__gt=0, venta__fecha__gte=inicio, venta__fecha__lt=fin)
+            .annotate(dia=TruncDate("venta__fecha", tzinfo=tz))
+            .values("dia", "producto_id")
+            .annotate(suma_litros=Sum("litros"), suma_monto=Sum("subtotal"), num_lineas=Count("id"))
+            .order_by()
+        )
+        por_cliente = (
+            Venta.objects.filter(fecha__gte=inicio, fecha__lt=fin)
+            .annotate(dia=TruncDate("fecha", tzinfo=tz))
+            .values("dia", "cliente_id")
+            .annotate(cantidad=Count("id"), suma_monto=Sum("total"))
+            .order_by()
+        )
+
+        filas = self._insertar(
+            VentaDiariaProducto,
+            (
+                VentaDiariaProducto(
+                    fecha=r["dia"], producto_id=r["producto_id"],
+                    litros=r["suma_litros"], monto=r["suma_monto"], lineas=r["num_lineas"],
+                )
+                for r in por_producto.iterator(chunk_size=lote)
+            ),
+            lote,
+        )
+        filas += self._insertar(
+            VentaDiariaCliente,
+            (
+                VentaDiariaCliente(fecha=r["dia"], cliente_id=r["cliente_id"], num_ventas=r["cantidad"], monto=r["suma_monto"])
+                for r in por_cliente.iterator(chunk_size=lote)
+            ),
+            lote,
+        )
+        return filas
+
+    def _insertar(self, modelo, objetos, lote):
+        total = 0
+        buffer = []
+        for obj in objetos:
+            buffer.append(obj)
+            if len(buffer) >= lote:
+                modelo.objects.bulk_create(buffer)
+                total += len(buffer)
+                buffer = []
+        if buffer:
+            modelo.objects.bulk_create(buffer)
+            total += len(buffer)
+        return total
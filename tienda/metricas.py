@@ -0,0 +1,279 @@
+import atexit
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.template.backends.django import Template
+
+# Límites (le) de los histogramas, al estilo de Prometheus.
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_BYTES = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+HISTOGRAMAS = {
+    "tienda_peticion_segundos": ("Latencia total por vista.", BUCKETS_SEGUNDOS),
+    "tienda_db_segundos": ("Tiempo en la base de datos por petición.", BUCKETS_SEGUNDOS),
+    "tienda_plantilla_segundos": ("Tiempo renderizando plantillas por petición.", BUCKETS_SEGUNDOS),
+    "tienda_respuesta_bytes": ("Tamaño de la respuesta.", BUCKETS_BYTES),
+}
+CONTADORES = {
+    "tienda_db_consultas_total": "Consultas SQL ejecutadas.",
+}
+
+# En METRICAS_DIR: "<pid>-<inicio>.json" por proceso vivo y lo acumulado por los que ya terminaron.
+TOTALES = "totales.json"
+
+medicion_actual = contextvars.ContextVar("metricas_medicion", default=None)
+
+
+class Medicion:
+    __slots__ = ("consultas", "db", "plantillas", "_profundidad")
+
+    def __init__(self):
+        self.consultas = 0
+        self.db = 0.0
+        self.plantillas = 0.0
+        self._profundidad = 0
+
+
+def contar_consulta(execute, sql, params, many, context):
+    """``execute_wrapper`` que suma consultas y tiempo a la medición en curso."""
+    medicion = medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.db += time.perf_counter() - inicio
+        medicion.consultas += 1
+
+
+def instrumentar_conexion(connection, **kwargs):
+    """Deja ``contar_consulta`` fijo en cada conexión (receptor de ``connection_created``).
+
+    Se instala una sola vez y no con ``execute_wrapper`` por petición porque en
+    las vistas async las consultas corren en otro hilo, con su propia conexión.
+    Va al principio de la lista: ``execute_wrapper`` saca siempre el último.
+    """
+    if contar_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, contar_consulta)
+
+
+_render_original = None
+
+
+def instrumentar_plantillas():
+    """Envuelve ``Template.render`` del backend Django para medir plantillas.
+
+    Solo cuenta el render más externo: los widgets e includes renderizados dentro
+    de otra plantilla ya están incluidos en su tiempo.
+    """
+    global _render_original
+    if _render_original is not None:
+        return
+    _render_original = Template.render
+
+    def render(self, context=None, request=None):
+        medicion = medicion_actual.get()
+        if medicion is None:
+            return _render_original(self, context, request)
+        medicion._profundidad += 1
+        inicio = time.perf_counter()
+        try:
+            return _render_original(self, context, request)
+        finally:
+            medicion._profundidad -= 1
+            if medicion._profundidad == 0:
+                medicion.plantillas += time.perf_counter() - inicio
+
+    Template.render = render
+
+
+class _Registro:
+    """Histogramas y contadores del proceso, protegidos por un lock (workers gthread)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histogramas = {}
+        self.contadores = {}
+        self._ultimo_volcado = 0.0
+        self._pid = None
+        self._archivo = None
+
+    def archivo(self):
+        """Nombre del volcado de este proceso.
+
+        Lleva el momento de arranque además del pid: un worker nuevo que recibe
+        el pid de uno reciclado no pisa su archivo (los contadores no retroceden).
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._archivo = f"{self._pid}-{time.time_ns()}.json"
+        return self._archivo
+
+    def observar(self, vista, medicion, total, tamano):
+        valores = {
+            "tienda_peticion_segundos": total,
+            "tienda_db_segundos": medicion.db,
+            "tienda_plantilla_segundos": medicion.plantillas,
+            "tienda_respuesta_bytes": tamano,
+        }
+        with self._lock:
+            for nombre, valor in valores.items():
+                if valor is None:
+                    continue
+                limites = HISTOGRAMAS[nombre][1]
+                serie = self.histogramas.setdefault(nombre, {}).setdefault(
+                    vista, {"buckets": [0] * (len(limites) + 1), "suma": 0.0, "cuenta": 0}
+                )
+                serie["buckets"][bisect_left(limites, valor)] += 1
+                serie["suma"] += valor
+                serie["cuenta"] += 1
+            consultas = self.contadores.setdefault("tienda_db_consultas_total", {})
+            consultas[vista] = consultas.get(vista, 0) + medicion.consultas
+
+    def copia(self):
+        with self._lock:
+            return json.loads(json.dumps({"histogramas": self.histogramas, "contadores": self.contadores}))
+
+    def volcar_si_toca(self):
+        """Escribe el estado del proceso en ``METRICAS_DIR`` cada ``METRICAS_VOLCADO`` segundos."""
+        directorio = getattr(settings, "METRICAS_DIR", None)
+        if not directorio:
+            return
+        ahora = time.monotonic()
+        if ahora - self._ultimo_volcado < settings.METRICAS_VOLCADO:
+            return
+        self._ultimo_volcado = ahora
+        self.volcar(directorio)
+
+    def volcar(self, directorio):
+        os.makedirs(directorio, exist_ok=True)
+        _escribir(os.path.join(directorio, self.archivo()), self.copia())
+
+
+registro = _Registro()
+
+
+def _volcar_al_salir():
+    # Lo contado después del último volcado periódico (p. ej. al reciclar un worker).
+    directorio = getattr(settings, "METRICAS_DIR", None)
+    if directorio and (registro.histogramas or registro.contadores):
+        registro.volcar(directorio)
+
+
+atexit.register(_volcar_al_salir)
+
+
+def _escribir(destino, estado):
+    temporal = f"{destino}.{os.getpid()}.tmp"
+    with open(temporal, "w") as f:
+        json.dump(estado, f)
+    os.replace(temporal, destino)
+
+
+def _leer(ruta):
+    try:
+        with open(ruta) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _terminado(ruta):
+    """``True`` si el proceso que escribió el volcado ``ruta`` ya no existe."""
+    try:
+        pid = int(os.path.basename(ruta).split("-", 1)[0])
+    except ValueError:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _plegar_terminados(directorio):
+    """Suma a ``TOTALES`` los volcados de procesos que ya terminaron y los borra.
+
+    Sin esto el directorio crece con cada worker reciclado por ``max_requests``.
+    El candado evita que dos procesos sumen el mismo archivo dos veces.
+    """
+    import fcntl
+
+    with open(os.path.join(directorio, ".candado"), "w") as candado:
+        fcntl.flock(candado, fcntl.LOCK_EX)
+        terminados = [
+            ruta for ruta in glob.glob(os.path.join(directorio, "*.json"))
+            if os.path.basename(ruta) != TOTALES and _terminado(ruta)
+        ]
+        if not terminados:
+            return
+        totales = os.path.join(directorio, TOTALES)
+        estados = [_leer(ruta) for ruta in (totales, *terminados)]
+        _escribir(totales, _combinar(e for e in estados if e is not None))
+        for ruta in terminados:
+            os.remove(ruta)
+
+
+def _combinar(estados):
+    total = {"histogramas": {}, "contadores": {}}
+    for estado in estados:
+        for nombre, series in estado.get("histogramas", {}).items():
+            for vista, serie in series.items():
+                destino = total["histogramas"].setdefault(nombre, {}).setdefault(
+                    vista, {"buckets": [0] * len(serie["buckets"]), "suma": 0.0, "cuenta": 0}
+                )
+                destino["buckets"] = [a + b for a, b in zip(destino["buckets"], serie["buckets"])]
+                destino["suma"] += serie["suma"]
+                destino["cuenta"] += serie["cuenta"]
+        for nombre, series in estado.get("contadores", {}).items():
+            for vista, valor in series.items():
+                contador = total["contadores"].setdefault(nombre, {})
+                contador[vista] = contador.get(vista, 0) + valor
+    return total
+
+
+def _etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def exposicion():
+    """Texto en formato Prometheus con la suma de todos los workers.
+
+    Con ``METRICAS_DIR`` se leen los volcados de cada proceso vivo y los totales
+    de los que ya terminaron (el propio se toma de memoria); sin él, solo se
+    exponen las métricas de este proceso.
+    """
+    estados = [registro.copia()]
+    directorio = getattr(settings, "METRICAS_DIR", None)
+    if directorio and os.path.isdir(directorio):
+        _plegar_terminados(directorio)
+        propio = os.path.join(directorio, registro.archivo())
+        for ruta in glob.glob(os.path.join(directorio, "*.json")):
+            if ruta != propio:
+                estados.append(_leer(ruta))
+    estado = _combinar(e for e in estados if e is not None)
+
+    lineas = []
+    for nombre, (ayuda, limites) in HISTOGRAMAS.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+        for vista, serie in sorted(estado["histogramas"].get(nombre, {}).items()):
+            acumulado = 0
+            for limite, cantidad in zip((*limites, "+Inf"), serie["buckets"]):
+                acumulado += cantidad
+                lineas.append(f'{nombre}_bucket{{vista="{_etiqueta(vista)}",le="{limite}"}} {acumulado}')
+            lineas.append(f'{nombre}_sum{{vista="{_etiqueta(vista)}"}} {serie["suma"]}')
+            lineas.append(f'{nombre}_count{{vista="{_etiqueta(vista)}"}} {serie["cuenta"]}')
+    for nombre, ayuda in CONTADORES.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter"]
+        for vista, valor in sorted(estado["contadores"].get(nombre, {}).items()):
+            lineas.append(f'{nombre}{{vista="{_etiqueta(vista)}"}} {valor}')
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,157 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metricas, routers
+from .auditoria import peticion_actual
+
+
+class _SyncYAsync:
+    """Base para middleware que corre sin adaptadores tanto bajo WSGI como bajo ASGI."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+
+class EstaticosMiddleware(WhiteNoiseMiddleware):
+    """``WhiteNoiseMiddleware`` que también corre async.
+
+    El original es solo síncrono: bajo ASGI Django adaptaría con él toda la
+    cadena de middleware y las vistas async correrían en un hilo. La búsqueda
+    del archivo es un diccionario en memoria (salvo con autorefresh en DEBUG).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        return super().__call__(request)
+
+    async def _acall(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class AuditoriaMiddleware(_SyncYAsync):
+    """Deja la petición a mano de ``tienda.auditoria`` para anotar el usuario."""
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        token = peticion_actual.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            peticion_actual.reset(token)
+
+    async def _acall(self, request):
+        token = peticion_actual.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            peticion_actual.reset(token)
+
+
+class MetricasMiddleware(_SyncYAsync):
+    """Mide consultas, plantillas, latencia y tamaño de cada petición.
+
+    Devuelve el desglose en ``Server-Timing`` y lo acumula por vista en
+    ``tienda.metricas`` para ``/metrics``. Por petición solo suma floats en un
+    objeto propio y toma un lock al final, así que puede quedar activo en producción.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        metricas.instrumentar_plantillas()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        medicion = metricas.Medicion()
+        token = metricas.medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metricas.medicion_actual.reset(token)
+        return self._registrar(request, response, medicion, time.perf_counter() - inicio)
+
+    async def _acall(self, request):
+        # El contextvar viaja a los hilos de sync_to_async, donde corren las consultas.
+        medicion = metricas.Medicion()
+        token = metricas.medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metricas.medicion_actual.reset(token)
+        return self._registrar(request, response, medicion, time.perf_counter() - inicio)
+
+    def _registrar(self, request, response, medicion, total):
+        match = getattr(request, "resolver_match", None)
+        vista = match.view_name if match else "sin_ruta"
+        tamano = None if response.streaming else len(response.content)
+
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={medicion.db * 1000:.2f};desc="{medicion.consultas} consultas"',
+            f"tpl;dur={medicion.plantillas * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ])
+        metricas.registro.observar(vista, medicion, total, tamano)
+        metricas.registro.volcar_si_toca()
+        return response
+
+
+class ReplicaMiddleware(_SyncYAsync):
+    """Lleva el estado de ruteo de cada petición (ver ``tienda.routers``).
+
+    Tras una petición que escribió se deja una cookie corta: la siguiente (el
+    GET después de un POST) lee de la primaria y ve sus propios cambios aunque
+    la réplica venga atrasada.
+    """
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        estado = routers.Estado(escribio=routers.COOKIE in request.COOKIES)
+        token = routers.estado_actual.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.estado_actual.reset(token)
+        return self._pegar(request, response, estado)
+
+    async def _acall(self, request):
+        estado = routers.Estado(escribio=routers.COOKIE in request.COOKIES)
+        token = routers.estado_actual.set(estado)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.estado_actual.reset(token)
+        return self._pegar(request, response, estado)
+
+    def _pegar(self, request, response, estado):
+        if estado.escribio and routers.COOKIE not in request.COOKIES:
+            response.set_cookie(
+                routers.COOKIE, "1", max_age=max(1, int(settings.REPLICA_RETRASO)), httponly=True, samesite="Lax"
+            )
+        return response
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+from tienda.busqueda import normalizar
+
+LOTE = 2000
+
+
+def _rellenar(modelo, texto):
+    buffer = []
+    for obj in modelo.objects.order_by("pk").iterator(chunk_size=LOTE):
+        obj.busqueda = texto(obj)
+        buffer.append(obj)
+        if len(buffer) >= LOTE:
+            modelo.objects.bulk_update(buffer, ["busqueda"])
+            buffer = []
+    if buffer:
+        modelo.objects.bulk_update(buffer, ["busqueda"])
+
+
+def rellenar_busqueda(apps, schema_editor):
+    # Los modelos históricos no tienen texto_busqueda(); se repite la fórmula.
+    _rellenar(
+        apps.get_model("tienda", "Producto"),
+        lambda p: normalizar(f"{p.nombre} {p.tipo}"),
+    )
+    _rellenar(
+        apps.get_model("tienda", "Cliente"),
+        lambda c: normalizar(f"{c.nombres} {c.apellidos} {''.join(d for d in c.nit or '' if d.isdigit())}"),
+    )
+
+
+def crear_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for tabla in ("tienda_cliente", "tienda_producto"):
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {tabla}_busqueda_trgm ON {tabla} USING gin (busqueda gin_trgm_ops)"
+        )
+
+
+def borrar_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for tabla in ("tienda_cliente", "tienda_producto"):
+        schema_editor.execute(f"DROP INDEX IF EXISTS {tabla}_busqueda_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0006_resumenes_diarios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='busqueda',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='busqueda',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(rellenar_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indices_trigram, borrar_indices_trigram),
+    ]
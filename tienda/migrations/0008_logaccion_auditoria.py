@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0007_busqueda_normalizada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogAccion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('usuario', models.CharField(blank=True, max_length=150)),
+                ('evento', models.CharField(max_length=20)),
+                ('modelo', models.CharField(max_length=50)),
+                ('pk_obj', models.CharField(max_length=50)),
+                ('fecha_hora', models.DateTimeField(default=django.utils.timezone.now)),
+                ('payload', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-fecha_hora'],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+LOTE = 2000
+
+
+def saldo_inicial(apps, schema_editor):
+    """Abre el libro con un ajuste por el stock actual de cada producto."""
+    Producto = apps.get_model("tienda", "Producto")
+    MovimientoStock = apps.get_model("tienda", "MovimientoStock")
+    buffer = []
+    for pk, stock in Producto.objects.exclude(stock_litros=0).order_by("pk").values_list("pk", "stock_litros").iterator(chunk_size=LOTE):
+        buffer.append(MovimientoStock(producto_id=pk, tipo="ajuste", litros=stock, nota="Saldo inicial"))
+        if len(buffer) >= LOTE:
+            MovimientoStock.objects.bulk_create(buffer)
+            buffer = []
+    if buffer:
+        MovimientoStock.objects.bulk_create(buffer)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0009_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('venta', 'Venta'), ('reposicion', 'Reposición'), ('ajuste', 'Ajuste'), ('devolucion', 'Devolución')], max_length=20)),
+                ('litros', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('nota', models.CharField(blank=True, default='', max_length=200)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movimientos', to='tienda.producto')),
+                ('venta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tienda.venta')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['producto', 'id'], name='tienda_mov_producto_id')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('stock', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('ultimo_movimiento_id', models.BigIntegerField(default=0)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tienda.producto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='tienda_snap_producto_fecha')],
+            },
+        ),
+        migrations.RunPython(saldo_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+LOTE = 1000
+
+
+def rellenar_acumulados(apps, schema_editor):
+    from tienda.management.commands.recalcular_clientes import recalcular_lote
+
+    Cliente = apps.get_model("tienda", "Cliente")
+    Venta = apps.get_model("tienda", "Venta")
+    ids = list(Cliente.objects.order_by("pk").values_list("pk", flat=True))
+    for inicio in range(0, len(ids), LOTE):
+        recalcular_lote(Cliente, Venta, ids[inicio:inicio + LOTE])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0010_libro_existencias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='num_ventas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='total_comprado',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='ultima_compra',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['total_comprado', 'id'], name='tienda_cli_total_id'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['num_ventas', 'id'], name='tienda_cli_ventas_id'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['ultima_compra', 'id'], name='tienda_cli_ultima_id'),
+        ),
+        migrations.RunPython(rellenar_acumulados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:07
+
+import django.db.models.expressions
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0011_acumulados_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detalleventa',
+            name='subtotal',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(models.F('litros'), '*', models.F('precio_unitario')), 2), output_field=models.DecimalField(decimal_places=2, max_digits=14)),
+        ),
+    ]
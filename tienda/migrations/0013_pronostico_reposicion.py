@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0012_subtotal_generado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PronosticoReposicion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('consumo_diario', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('consumo_semana', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('dias_cobertura', models.DecimalField(decimal_places=1, max_digits=10, null=True)),
+                ('sugerido', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('calculado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pronostico', to='tienda.producto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dias_cobertura', 'producto'], name='tienda_pron_cobertura')],
+            },
+        ),
+    ]
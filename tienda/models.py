@@ -1,27 +1,132 @@
 from decimal import Decimal
 
 from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Round
+from django.utils import timezone
 
-class Producto(models.Model):
+from . import versiones
+from .busqueda import normalizar
+
+
+class _ConBusqueda:
+    """Mantiene la columna ``busqueda`` (ver ``tienda.busqueda``) en cada ``save()``."""
+
+    def save(self, *args, **kwargs):
+        self.busqueda = self.texto_busqueda()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "busqueda" not in update_fields:
+            kwargs["update_fields"] = {*update_fields, "busqueda"}
+        super().save(*args, **kwargs)
+
+
+class _StockInsuficiente(Exception):
+    pass
+
+
+def descontar_stock(consumos, reservas=None):
+    """Descuenta ``{producto_id: litros}`` del stock en un solo UPDATE.
+
+    La condición ``stock_litros >= litros + reservado`` va dentro del propio
+    UPDATE, así que dos ventas concurrentes del mismo producto no pueden
+    sobrevender ni quedarse con litros reservados por carritos ajenos: si el
+    número de filas afectadas no coincide, falta stock (o el producto ya no
+    está activo), se deshace el descuento parcial y se lanza ``ValueError``.
+    ``reservas`` son los litros reservados que hay que respetar, por producto;
+    por defecto, todo lo reservado en ``tienda.carrito``. Como ``update`` no
+    dispara señales, quien llama deja el descuento en la bitácora con sus
+    ``MovimientoStock``.
+    """
+    if not consumos:
+        return
+    if reservas is None:
+        from . import carrito  # carrito importa este módulo
+
+        reservas = carrito.reservado(list(consumos))
+
+    condicion = Q()
+    nuevo_stock = []
+    for pk, litros in consumos.items():
+        condicion |= Q(pk=pk, activo=True, stock_litros__gte=litros + reservas.get(pk, 0))
+        nuevo_stock.append(When(pk=pk, then=F("stock_litros") - Value(litros)))
+
+    try:
+        with transaction.atomic():
+            actualizados = Producto.objects.filter(condicion).update(
+                stock_litros=Case(*nuevo_stock, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+            )
+            if actualizados != len(consumos):
+                raise _StockInsuficiente
+        versiones.incrementar("catalogo")
+        return
+    except _StockInsuficiente:
+        pass
+
+    # El savepoint ya deshizo el descuento parcial; se relee solo para el mensaje.
+    faltantes = Producto.objects.filter(pk__in=list(consumos)).order_by("pk")
+    for producto in faltantes:
+        if not producto.activo:
+            raise ValueError(f"{producto.nombre} ya no está a la venta.")
+        solicitado = consumos[producto.pk]
+        disponibles = (producto.stock_litros or Decimal("0")) - reservas.get(producto.pk, 0)
+        if solicitado > disponibles:
+            raise ValueError(
+                f"Stock insuficiente para {producto.nombre}. Disponible: {max(disponibles, Decimal('0'))}, solicitado: {solicitado}"
+            )
+    raise ValueError("Stock insuficiente: uno de los productos ya no existe.")
+
+
+class Producto(_ConBusqueda, models.Model):
     nombre = models.CharField(max_length=120)
     tipo = models.CharField(max_length=60, blank=True, default="")
     precio_litro = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     stock_litros = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     activo = models.BooleanField(default=True)
+    busqueda = models.CharField(max_length=200, blank=True, default="", editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            # catalogo: activo=True ORDER BY nombre
+            models.Index(fields=["activo", "nombre"], name="tienda_prod_activo_nombre"),
+            # producto_list: keyset sobre (nombre, id)
+            models.Index(fields=["nombre", "id"], name="tienda_prod_nombre_id"),
+        ]
 
     def __str__(self):
         return self.nombre
 
+    def texto_busqueda(self):
+        return normalizar(f"{self.nombre} {self.tipo}")
+
 
-class Cliente(models.Model):
+class Cliente(_ConBusqueda, models.Model):
     nombres = models.CharField(max_length=120, default="")
     apellidos = models.CharField(max_length=120, blank=True, default="")
     telefono = models.CharField(max_length=30, blank=True, default="")
     nit = models.CharField(max_length=30, blank=True, default="CF")
+    busqueda = models.CharField(max_length=300, blank=True, default="", editable=False, db_index=True)
+    # Acumulados mantenidos por Venta.confirmar (ver acumular_clientes).
+    total_comprado = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    num_ventas = models.PositiveIntegerField(default=0, editable=False)
+    ultima_compra = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # cliente_list: keyset sobre (apellidos, nombres, id)
+            models.Index(fields=["apellidos", "nombres", "id"], name="tienda_cli_apellidos_nombres"),
+            # Rankings de cliente_list y del admin (se recorren hacia atrás).
+            models.Index(fields=["total_comprado", "id"], name="tienda_cli_total_id"),
+            models.Index(fields=["num_ventas", "id"], name="tienda_cli_ventas_id"),
+            models.Index(fields=["ultima_compra", "id"], name="tienda_cli_ultima_id"),
+        ]
 
     def __str__(self):
         return self.nombre_completo or "Cliente"
 
+    def texto_busqueda(self):
+        digitos_nit = "".join(c for c in self.nit or "" if c.isdigit())
+        return normalizar(f"{self.nombres} {self.apellidos} {digitos_nit}")
+
     @property
     def nombre_completo(self):
         nombres = (self.nombres or "").strip()
@@ -29,53 +134,93 @@ class Cliente(models.Model):
         return f"{nombres} {apellidos}".strip()
 
 
+class VentaQuerySet(models.QuerySet):
+    @staticmethod
+    def _detalles():
+        return DetalleVenta.objects.filter(venta=OuterRef("pk")).order_by().values("venta")
+
+    def con_num_lineas(self):
+        """Anota ``num_lineas`` sin cargar los detalles; es lo único que usa el listado.
+
+        Es una subconsulta correlacionada y no un JOIN con GROUP BY: con un LIMIT
+        (listados paginados) solo se calcula para las filas de la página.
+        """
+        return self.annotate(
+            num_lineas=Coalesce(Subquery(self._detalles().annotate(c=Count("id")).values("c")), Value(0)),
+        )
+
+    def con_totales(self):
+        """Como ``con_num_lineas``, más ``total_lineas`` (suma de subtotales)."""
+        decimal = models.DecimalField(max_digits=14, decimal_places=2)
+        return self.con_num_lineas().annotate(
+            total_lineas=Coalesce(
+                Subquery(self._detalles().annotate(s=Sum("subtotal")).values("s"), output_field=decimal),
+                Value(Decimal("0")),
+                output_field=decimal,
+            ),
+        )
+
+
 class Venta(models.Model):
     cliente = models.ForeignKey(Cliente, on_delete=models.PROTECT, related_name="ventas")
     fecha = models.DateTimeField(auto_now_add=True)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
-    def __str__(self):
-        return f"Venta #{self.pk} - {self.cliente}"
-
-    def confirmar(self):
-        """Confirma la venta, actualizando existencias y el total."""
-        with transaction.atomic():
-            detalles = list(self.detalles.select_related("producto"))
+    objects = VentaQuerySet.as_manager()
 
-            consumos = {}
-            total = Decimal("0")
+    class Meta:
+        indexes = [
+            # Rangos de fecha: reportes, exportación y filtro de fecha del admin.
+            models.Index(fields=["fecha", "id"], name="tienda_venta_fecha_id"),
+        ]
 
-            for detalle in detalles:
-                producto = detalle.producto
-                litros = detalle.litros or Decimal("0")
-
-                if litros <= 0:
-                    continue
+    def __str__(self):
+        return f"Venta #{self.pk} - {self.cliente}"
 
-                if not detalle.precio_unitario:
-                    detalle.precio_unitario = producto.precio_litro or Decimal("0")
-                    detalle.save(update_fields=["precio_unitario"])
+    def confirmar(self, reservas=None):
+        """Confirma la venta, actualizando existencias y el total.
 
-                total += litros * detalle.precio_unitario
+        El número de consultas no depende de la cantidad de líneas: los precios
+        faltantes se completan con un UPDATE, los litros y montos por producto
+        salen de un solo ``Sum`` agrupado sobre ``subtotal`` (calculado por la
+        base), el stock se descuenta con un único UPDATE condicional (ver
+        ``descontar_stock``, que respeta ``reservas``) y las salidas quedan en
+        el libro de movimientos con un ``bulk_create``.
+        """
+        with transaction.atomic():
+            detalles = self.detalles.filter(litros__gt=0)
+            detalles.filter(precio_unitario=0).update(
+                precio_unitario=Subquery(Producto.objects.filter(pk=OuterRef("producto_id")).values("precio_litro")[:1])
+            )
 
-                data = consumos.setdefault(producto.pk, {"producto": producto, "litros": Decimal("0")})
-                data["litros"] += litros
+            por_producto = {
+                r["producto_id"]: {"litros": r["suma_litros"], "monto": r["suma_monto"], "lineas": r["num_lineas"]}
+                for r in detalles.values("producto_id")
+                .annotate(suma_litros=Sum("litros"), suma_monto=Sum("subtotal"), num_lineas=Count("id"))
+                .order_by()
+            }
+            consumos = {pk: resumen["litros"] for pk, resumen in por_producto.items()}
+            total = sum((resumen["monto"] for resumen in por_producto.values()), Decimal("0"))
 
-            for data in consumos.values():
-                producto = data["producto"]
-                disponibles = producto.stock_litros or Decimal("0")
-                if data["litros"] > disponibles:
-                    raise ValueError(
-                        f"Stock insuficiente para {producto.nombre}. Disponible: {disponibles}, solicitado: {data['litros']}"
-                    )
+            descontar_stock(consumos, reservas)
+            movimientos = MovimientoStock.objects.bulk_create([
+                MovimientoStock(producto_id=pk, tipo=MovimientoStock.VENTA, litros=-litros, venta=self)
+                for pk, litros in consumos.items()
+            ])
+            # El descuento de stock es un UPDATE sin señales: sus movimientos van a la bitácora.
+            from . import auditoria  # auditoria importa este módulo
 
-            for data in consumos.values():
-                producto = data["producto"]
-                producto.stock_litros = (producto.stock_litros or Decimal("0")) - data["litros"]
-                producto.save(update_fields=["stock_litros"])
+            auditoria.registrar_varios("crear", movimientos)
 
             self.total = total
             self.save(update_fields=["total"])
+
+            acumular_resumenes(
+                timezone.localdate(self.fecha),
+                por_producto,
+                {self.cliente_id: {"num_ventas": 1, "monto": total}},
+            )
+            acumular_clientes({self.cliente_id: {"num_ventas": 1, "monto": total, "ultima": self.fecha}})
             return total
 
 
@@ -84,4 +229,213 @@ class DetalleVenta(models.Model):
     producto = models.ForeignKey(Producto, on_delete=models.PROTECT)
     litros = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # <- se usa en ventas
-  
+    # Lo calcula y guarda la base: reportes y totales suman la columna sin multiplicar en Python.
+    subtotal = models.GeneratedField(
+        expression=Round(F("litros") * F("precio_unitario"), 2),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        db_persist=True,
+    )
+
+
+class LogAccion(models.Model):
+    """Bitácora de cambios; la escribe en lotes ``tienda.auditoria``."""
+
+    usuario = models.CharField(max_length=150, blank=True)
+    evento = models.CharField(max_length=20)
+    modelo = models.CharField(max_length=50)
+    pk_obj = models.CharField(max_length=50)
+    fecha_hora = models.DateTimeField(default=timezone.now)
+    payload = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["-fecha_hora"]
+
+    def __str__(self):
+        return f"{self.evento} {self.modelo} #{self.pk_obj}"
+
+
+class VentaDiariaProducto(models.Model):
+    """Resumen diario por producto, mantenido por ``Venta.confirmar``."""
+
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="+")
+    litros = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    lineas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["fecha", "producto"], name="tienda_resumen_producto_dia"),
+        ]
+
+
+class VentaDiariaCliente(models.Model):
+    """Resumen diario por cliente, mantenido por ``Venta.confirmar``."""
+
+    fecha = models.DateField()
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name="+")
+    num_ventas = models.PositiveIntegerField(default=0)
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["fecha", "cliente"], name="tienda_resumen_cliente_dia"),
+        ]
+
+
+class PronosticoReposicion(models.Model):
+    """Consumo estimado y reposición sugerida por producto (ver ``tienda.reposicion``)."""
+
+    producto = models.OneToOneField(Producto, on_delete=models.CASCADE, related_name="pronostico")
+    stock = models.DecimalField(max_digits=12, decimal_places=2)
+    consumo_diario = models.DecimalField(max_digits=12, decimal_places=3)
+    consumo_semana = models.DecimalField(max_digits=12, decimal_places=3)
+    # Nulo: sin consumo en la ventana, el stock no se agota.
+    dias_cobertura = models.DecimalField(max_digits=10, decimal_places=1, null=True)
+    sugerido = models.DecimalField(max_digits=12, decimal_places=2)
+    calculado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["dias_cobertura", "producto"], name="tienda_pron_cobertura"),
+        ]
+
+
+def _incrementar(modelo, fecha, campo, deltas):
+    """Suma ``deltas = {pk: {columna: valor}}`` a las filas ``(fecha, campo=pk)`` de ``modelo``.
+
+    Primero asegura que las filas existan (``ignore_conflicts``) y luego aplica
+    todos los incrementos con ``F()`` en un solo UPDATE, así que dos ventas del
+    mismo día no se pisan.
+    """
+    if not deltas:
+        return
+
+    modelo.objects.bulk_create(
+        [modelo(fecha=fecha, **{f"{campo}_id": pk}) for pk in deltas],
+        ignore_conflicts=True,
+    )
+
+    columnas = {columna for valores in deltas.values() for columna in valores}
+    cambios = {}
+    for columna in columnas:
+        salida = modelo._meta.get_field(columna)
+        cambios[columna] = F(columna) + Case(
+            *[
+                When(**{f"{campo}_id": pk}, then=Value(valores.get(columna, 0), output_field=salida))
+                for pk, valores in deltas.items()
+            ],
+            default=Value(0, output_field=salida),
+            output_field=salida,
+        )
+    modelo.objects.filter(fecha=fecha, **{f"{campo}_id__in": list(deltas)}).update(**cambios)
+
+
+def acumular_resumenes(fecha, por_producto, por_cliente):
+    """Incrementa los resúmenes diarios de ``fecha`` (una fecha local, no un datetime)."""
+    _incrementar(VentaDiariaProducto, fecha, "producto", por_producto)
+    _incrementar(VentaDiariaCliente, fecha, "cliente", por_cliente)
+
+
+def acumular_clientes(por_cliente):
+    """Suma ventas a los acumulados de cada cliente en un solo UPDATE con ``F()``.
+
+    ``por_cliente = {pk: {"num_ventas": n, "monto": m, "ultima": datetime}}``.
+    ``ultima_compra`` solo avanza: una confirmación que llega tarde no la pisa.
+    """
+    if not por_cliente:
+        return
+
+    def _caso(clave, salida):
+        return Case(
+            *[When(pk=pk, then=Value(valores[clave], output_field=salida)) for pk, valores in por_cliente.items()],
+            output_field=salida,
+        )
+
+    total = Cliente._meta.get_field("total_comprado")
+    cantidad = Cliente._meta.get_field("num_ventas")
+    fecha = _caso("ultima", Cliente._meta.get_field("ultima_compra"))
+    Cliente.objects.filter(pk__in=list(por_cliente)).update(
+        total_comprado=F("total_comprado") + _caso("monto", total),
+        num_ventas=F("num_ventas") + _caso("num_ventas", cantidad),
+        ultima_compra=Greatest(Coalesce("ultima_compra", fecha), fecha),
+    )
+
+
+class MovimientoStock(models.Model):
+    """Libro de existencias: solo se agregan filas; ``litros`` es negativo en las salidas."""
+
+    VENTA = "venta"
+    REPOSICION = "reposicion"
+    AJUSTE = "ajuste"
+    DEVOLUCION = "devolucion"
+    TIPOS = [
+        (VENTA, "Venta"),
+        (REPOSICION, "Reposición"),
+        (AJUSTE, "Ajuste"),
+        (DEVOLUCION, "Devolución"),
+    ]
+
+    producto = models.ForeignKey(Producto, on_delete=models.PROTECT, related_name="movimientos")
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    litros = models.DecimalField(max_digits=12, decimal_places=2)
+    fecha = models.DateTimeField(default=timezone.now)
+    venta = models.ForeignKey(Venta, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    nota = models.CharField(max_length=200, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # Delta desde la última foto: producto = X AND id > corte.
+            models.Index(fields=["producto", "id"], name="tienda_mov_producto_id"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.litros} L {self.producto}"
+
+
+class SnapshotStock(models.Model):
+    """Foto del saldo del libro que incluye todos los movimientos hasta ``ultimo_movimiento_id``."""
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="+")
+    fecha = models.DateTimeField(default=timezone.now)
+    stock = models.DecimalField(max_digits=12, decimal_places=2)
+    ultimo_movimiento_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["producto", "fecha"], name="tienda_snap_producto_fecha"),
+        ]
+
+
+def stock_segun_libro(productos=None, momento=None, hasta_movimiento=None):
+    """Saldo del libro por producto en ``momento`` (por defecto, ahora).
+
+    Parte de la última foto anterior a ``momento`` y suma solo los movimientos
+    posteriores a ella, así que el costo depende de cuánto pasó desde la foto y
+    no de toda la historia. ``hasta_movimiento`` ignora los movimientos con id
+    mayor (para fotos consistentes). Devuelve un queryset de ``Producto``
+    anotado con ``stock_libro``.
+    """
+    momento = momento or timezone.now()
+    decimal = models.DecimalField(max_digits=12, decimal_places=2)
+
+    foto = SnapshotStock.objects.filter(producto=OuterRef("pk"), fecha__lte=momento).order_by("-fecha", "-id")
+    movimientos = MovimientoStock.objects.filter(producto=OuterRef("pk"), id__gt=OuterRef("corte"), fecha__lte=momento)
+    if hasta_movimiento is not None:
+        movimientos = movimientos.filter(id__lte=hasta_movimiento)
+    delta = (
+        movimientos.order_by()
+        .values("producto")
+        .annotate(suma=Sum("litros"))
+        .values("suma")
+    )
+    queryset = Producto.objects.all() if productos is None else Producto.objects.filter(pk__in=productos)
+    return (
+        queryset.annotate(
+            base=Coalesce(Subquery(foto.values("stock")[:1]), Value(Decimal("0")), output_field=decimal),
+            corte=Coalesce(Subquery(foto.values("ultimo_movimiento_id")[:1]), Value(0)),
+        )
+        .annotate(
+            stock_libro=F("base") + Coalesce(Subquery(delta, output_field=decimal), Value(Decimal("0")), output_field=decimal),
+        )
+    )
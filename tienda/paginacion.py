@@ -0,0 +1,190 @@
+import base64
+import datetime
+import json
+
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+TAMANO_PAGINA = 25
+TAMANO_MAXIMO = 100
+
+
+class PaginaCursor:
+    """Una página obtenida por keyset, con los querystrings de sus vecinas."""
+
+    def __init__(self, objetos, url_siguiente=None, url_anterior=None):
+        self.objetos = objetos
+        self.url_siguiente = url_siguiente
+        self.url_anterior = url_anterior
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+
+class _Codificador(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder recorta a milisegundos; el cursor necesita el valor exacto.
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _codificar(valores):
+    # Decimales y fechas viajan como texto; el ORM los convierte al filtrar.
+    crudo = json.dumps(valores, separators=(",", ":"), cls=_Codificador).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def _decodificar(cursor, cantidad):
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(crudo)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != cantidad:
+        return None
+    return valores
+
+
+def _despues_de(orden, valores):
+    """``Q`` que selecciona las filas estrictamente posteriores a ``valores`` en ``orden``."""
+    condicion = Q()
+    iguales = {}
+    for campo, valor in zip(orden, valores):
+        nombre = campo.lstrip("-")
+        lookup = "lt" if campo.startswith("-") else "gt"
+        condicion |= Q(**iguales, **{f"{nombre}__{lookup}": valor})
+        iguales[nombre] = valor
+    return condicion
+
+
+def _invertir(orden):
+    return [campo[1:] if campo.startswith("-") else f"-{campo}" for campo in orden]
+
+
+def _tamano(request):
+    try:
+        tamano = int(request.GET.get("n", TAMANO_PAGINA))
+    except ValueError:
+        return TAMANO_PAGINA
+    return max(1, min(tamano, TAMANO_MAXIMO))
+
+
+def _consulta(request, queryset, orden):
+    """Queryset ya filtrado y limitado a ``n + 1`` filas, más lo necesario para armar la página."""
+    tamano = _tamano(request)
+    despues = _decodificar(request.GET.get("despues", ""), len(orden)) if request.GET.get("despues") else None
+    antes = _decodificar(request.GET.get("antes", ""), len(orden)) if request.GET.get("antes") else None
+
+    if antes is not None:
+        queryset = queryset.filter(_despues_de(_invertir(orden), antes)).order_by(*_invertir(orden))
+    else:
+        if despues is not None:
+            queryset = queryset.filter(_despues_de(orden, despues))
+        queryset = queryset.order_by(*orden)
+    return queryset[:tamano + 1], tamano, despues, antes
+
+
+def _pagina(request, orden, filas, tamano, despues, antes):
+    if antes is not None:
+        hay_anterior, hay_siguiente = len(filas) > tamano, True
+        objetos = filas[:tamano][::-1]
+    else:
+        hay_anterior, hay_siguiente = despues is not None, len(filas) > tamano
+        objetos = filas[:tamano]
+
+    campos = [campo.lstrip("-") for campo in orden]
+
+    def _url(clave, objeto):
+        params = request.GET.copy()
+        params.pop("despues", None)
+        params.pop("antes", None)
+        params[clave] = _codificar([getattr(objeto, campo) for campo in campos])
+        return params.urlencode()
+
+    return PaginaCursor(
+        objetos,
+        url_siguiente=_url("despues", objetos[-1]) if objetos and hay_siguiente else None,
+        url_anterior=_url("antes", objetos[0]) if objetos and hay_anterior else None,
+    )
+
+
+def paginar_por_cursor(request, queryset, orden):
+    """Pagina ``queryset`` por keyset según ``orden`` (el último campo debe ser único).
+
+    Lee ``?despues=`` / ``?antes=`` (cursor opaco) y ``?n=`` (tamaño de página) de
+    ``request.GET``. Nunca usa OFFSET: cada página es un ``WHERE`` sobre las
+    columnas del orden más un ``LIMIT n + 1``, así que el costo no depende de
+    cuán adentro de la tabla esté la página.
+    """
+    consulta, *resto = _consulta(request, queryset, orden)
+    return _pagina(request, orden, list(consulta), *resto)
+
+
+async def apaginar_por_cursor(request, queryset, orden):
+    """Versión para vistas async de ``paginar_por_cursor``."""
+    consulta, *resto = _consulta(request, queryset, orden)
+    return _pagina(request, orden, [obj async for obj in consulta], *resto)
+
+
+# Por encima de esto el paginador del admin deja de contar filas exactas.
+TOPE_CONTEO = 10_000
+
+
+def filas_estimadas(consulta):
+    """Filas de ``consulta`` según las estadísticas del planificador, o ``None``.
+
+    Solo PostgreSQL las expone de forma barata: sin filtros, ``pg_class.reltuples``
+    (que mantienen ANALYZE y autovacuum; ``-1`` si nunca se analizó); con
+    filtros, las filas que el plan de ``EXPLAIN`` espera devolver.
+    """
+    conexion = connections[consulta.db]
+    if conexion.vendor != "postgresql":
+        return None
+    if consulta.query.where:
+        plan = json.loads(consulta.order_by().explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
+    with conexion.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [consulta.model._meta.db_table])
+        fila = cursor.fetchone()
+    if fila is None or fila[0] < 0:
+        return None
+    return fila[0]
+
+
+class PaginadorEstimado(Paginator):
+    """``Paginator`` para listados del admin sobre tablas enormes.
+
+    Cuenta exacto hasta ``TOPE_CONTEO`` filas. Por encima usa la estimación
+    del planificador (``estimado``), así que se puede paginar hasta el final;
+    si la base no la da, se queda en ``TOPE_CONTEO`` y marca ``truncado``
+    para que el listado avise que hay más filas que las navegables.
+    """
+
+    estimado = False
+    truncado = False
+
+    @cached_property
+    def count(self):
+        consulta = self.object_list
+        if not consulta.query.where:
+            # Sin filtros ni siquiera el conteo acotado hace falta si la tabla es grande.
+            estimado = filas_estimadas(consulta)
+            if estimado is not None and estimado > TOPE_CONTEO:
+                self.estimado = True
+                return estimado
+        contadas = consulta.order_by()[:TOPE_CONTEO + 1].count()
+        if contadas <= TOPE_CONTEO:
+            return contadas
+        estimado = filas_estimadas(consulta)
+        if estimado is not None and estimado > TOPE_CONTEO:
+            self.estimado = True
+            return estimado
+        self.truncado = True
+        return TOPE_CONTEO
@@ -0,0 +1,68 @@
+from contextlib import nullcontext
+
+from django.core.cache import cache
+
+from . import routers, versiones
+from .models import Producto
+
+TIMEOUT_MAPAS = 60 * 60 * 24
+
+
+def _mapa(version):
+    return cache.get(f"precios:{version}")
+
+
+def mapa_precios():
+    """``(version, {id: "precio"})`` de los productos activos, cacheado por versión.
+
+    Solo consulta la base cuando la versión ``"precios"`` cambió desde la última
+    vez; los mapas viejos se conservan un día para poder responder diferencias.
+    """
+    version = versiones.version("precios")
+    precios = _mapa(version)
+    if precios is None:
+        with routers.primaria() if versiones.reciente(versiones.modificado("precios")) else nullcontext():
+            precios = {
+                str(pk): str(precio)
+                for pk, precio in Producto.objects.filter(activo=True).values_list("id", "precio_litro")
+            }
+        cache.set(f"precios:{version}", precios, TIMEOUT_MAPAS)
+    return version, precios
+
+
+def opciones_productos():
+    """``{id: (nombre, "precio")}`` de los productos activos ordenados por nombre, cacheado por versión.
+
+    Lo comparten todas las filas del formset de ventas: se arma una vez por
+    versión de ``"precios"``, que cambia con cualquier alta, baja o edición
+    de productos.
+    """
+    version = versiones.version("precios")
+    clave = f"productos:opciones:{version}"
+    opciones = cache.get(clave)
+    if opciones is None:
+        with routers.primaria() if versiones.reciente(versiones.modificado("precios")) else nullcontext():
+            opciones = {
+                pk: (nombre, str(precio))
+                for pk, nombre, precio in Producto.objects.filter(activo=True)
+                .order_by("nombre", "id")
+                .values_list("id", "nombre", "precio_litro")
+            }
+        cache.set(clave, opciones, TIMEOUT_MAPAS)
+    return opciones
+
+
+def cambios_desde(version_cliente):
+    """Precios que cambiaron desde ``version_cliente``; ``None`` si ese mapa ya no está.
+
+    Un producto desactivado o borrado aparece con precio ``None``.
+    """
+    version, actuales = mapa_precios()
+    if version_cliente == version:
+        return {}
+    anteriores = _mapa(version_cliente)
+    if anteriores is None:
+        return None
+    cambios = {pk: precio for pk, precio in actuales.items() if anteriores.get(pk) != precio}
+    cambios.update({pk: None for pk in anteriores if pk not in actuales})
+    return cambios
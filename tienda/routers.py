@@ -0,0 +1,100 @@
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = "replica"
+COOKIE = "primaria"
+
+
+class Estado:
+    __slots__ = ("replica", "escribio", "forzada")
+
+    def __init__(self, escribio=False):
+        self.replica = False
+        self.escribio = escribio
+        self.forzada = 0
+
+
+# Estado de la petición en curso. Es un objeto mutable para que lo que marcan las
+# consultas hechas en hilos de sync_to_async (vistas async) se vea en la petición.
+estado_actual = contextvars.ContextVar("routers_estado", default=None)
+
+
+class RouterReplica:
+    """Manda a la réplica las lecturas de las vistas marcadas con ``lectura_replica``.
+
+    Se queda en la primaria dentro de ``transaction.atomic`` (incluye
+    ``Venta.confirmar``), cuando la petición ya escribió algo y dentro de
+    ``primaria()``. Fuera de una vista marcada no interviene.
+    """
+
+    def db_for_read(self, model, **hints):
+        estado = estado_actual.get()
+        if estado is None or not estado.replica or estado.escribio or estado.forzada:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        estado = estado_actual.get()
+        if estado is not None:
+            estado.escribio = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las dos bases tienen los mismos datos.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplica recibe el esquema por replicación.
+        return db != REPLICA
+
+
+def lectura_replica(vista):
+    """Marca una vista de solo lectura para que sus consultas puedan ir a la réplica."""
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            with _marcar():
+                return await vista(request, *args, **kwargs)
+        return envoltura_async
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        with _marcar():
+            return vista(request, *args, **kwargs)
+    return envoltura
+
+
+@contextmanager
+def _marcar():
+    estado = estado_actual.get()
+    token = None
+    if estado is None:
+        estado = Estado()
+        token = estado_actual.set(estado)
+    estado.replica = True
+    try:
+        yield
+    finally:
+        estado.replica = False
+        if token is not None:
+            estado_actual.reset(token)
+
+
+@contextmanager
+def primaria():
+    """Lee de la primaria dentro del bloque (p. ej. para llenar una caché versionada)."""
+    estado = estado_actual.get()
+    if estado is None:
+        yield
+        return
+    estado.forzada += 1
+    try:
+        yield
+    finally:
+        estado.forzada -= 1
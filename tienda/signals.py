@@ -0,0 +1,42 @@
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import auditoria, comprobantes, metricas, versiones
+from .models import Cliente, DetalleVenta, Producto, Venta
+
+MODELOS_AUDITADOS = (Producto, Cliente, Venta, DetalleVenta)
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_catalogo(sender, **kwargs):
+    versiones.incrementar("catalogo")
+    versiones.incrementar("precios")
+
+
+@receiver(post_save, sender=Venta)
+@receiver(post_delete, sender=Venta)
+@receiver(post_save, sender=DetalleVenta)
+@receiver(post_delete, sender=DetalleVenta)
+def invalidar_detalle_venta(sender, instance, **kwargs):
+    # Una venta confirmada no cambia, salvo correcciones desde el admin.
+    comprobantes.invalidar(instance.pk if sender is Venta else instance.venta_id)
+
+
+def auditar_guardado(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        auditoria.registrar("crear" if created else "editar", instance)
+
+
+def auditar_borrado(sender, instance, **kwargs):
+    auditoria.registrar("eliminar", instance)
+
+
+for _modelo in MODELOS_AUDITADOS:
+    post_save.connect(auditar_guardado, sender=_modelo, dispatch_uid=f"auditoria_guardado_{_modelo.__name__}")
+    post_delete.connect(auditar_borrado, sender=_modelo, dispatch_uid=f"auditoria_borrado_{_modelo.__name__}")
+request_finished.connect(auditoria.al_terminar_peticion, dispatch_uid="auditoria_fin_peticion")
+
+connection_created.connect(metricas.instrumentar_conexion)
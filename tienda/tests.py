@@ -1,6 +1,35 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import time
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from unittest import mock
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from decimal import Decimal
-from .models import Producto, Cliente, Venta, DetalleVenta
+from io import StringIO
+from . import auditoria, carrito, comprobantes, routers
+from .calentamiento import calentar
+from .lotes import registrar_ventas_en_lote
+from .paginacion import PaginadorEstimado
+from .models import (
+    LogAccion, MovimientoStock, Producto, Cliente, PronosticoReposicion, SnapshotStock, Venta, DetalleVenta, VentaDiariaCliente,
+    VentaDiariaProducto, stock_segun_libro,
+)
+
+# Las plantillas usan {% static %}; sin collectstatic no hay manifiesto.
+sin_manifiesto = override_settings(STORAGES={
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
 
 class VentaTests(TestCase):
     def setUp(self):
@@ -20,3 +49,1062 @@ class VentaTests(TestCase):
         DetalleVenta.objects.create(venta=v, producto=self.prod, litros=Decimal("60.00"), precio_unitario=Decimal("10.00"))
         with self.assertRaises(ValueError):
             v.confirmar()
+
+    def test_confirmar_consultas_constantes(self):
+        otro = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"), stock_litros=Decimal("20"))
+        v = Venta.objects.create(cliente=self.cli)
+        for _ in range(10):
+            DetalleVenta.objects.create(venta=v, producto=self.prod, litros=Decimal("1.00"))
+            DetalleVenta.objects.create(venta=v, producto=otro, litros=Decimal("1.00"))
+        with self.assertNumQueries(14):
+            v.confirmar()
+        self.prod.refresh_from_db()
+        otro.refresh_from_db()
+        self.assertEqual(self.prod.stock_litros, Decimal("40.00"))
+        self.assertEqual(otro.stock_litros, Decimal("10.00"))
+        self.assertEqual(v.total, Decimal("150.00"))
+        self.assertFalse(v.detalles.filter(precio_unitario=0).exists())
+
+    def test_subtotal_y_totales_calculados_en_la_base(self):
+        v = Venta.objects.create(cliente=self.cli)
+        DetalleVenta.objects.bulk_create([
+            DetalleVenta(venta=v, producto=self.prod, litros=Decimal("1.25"), precio_unitario=Decimal("3.33")),
+            DetalleVenta(venta=v, producto=self.prod, litros=Decimal("2.00")),
+        ])
+        self.assertEqual(v.confirmar(), Decimal("24.16"))
+        self.assertEqual(
+            sorted(v.detalles.values_list("subtotal", flat=True)), [Decimal("4.16"), Decimal("20.00")]
+        )
+        anotada = Venta.objects.con_totales().get(pk=v.pk)
+        self.assertEqual((anotada.total_lineas, anotada.num_lineas), (Decimal("24.16"), 2))
+        vacia = Venta.objects.con_totales().get(pk=Venta.objects.create(cliente=self.cli).pk)
+        self.assertEqual((vacia.total_lineas, vacia.num_lineas), (Decimal("0"), 0))
+
+    def test_sobreventa_no_descuenta_parcialmente(self):
+        otro = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"), stock_litros=Decimal("2"))
+        v = Venta.objects.create(cliente=self.cli)
+        DetalleVenta.objects.create(venta=v, producto=self.prod, litros=Decimal("5.00"), precio_unitario=Decimal("10.00"))
+        DetalleVenta.objects.create(venta=v, producto=otro, litros=Decimal("3.00"), precio_unitario=Decimal("5.00"))
+        with self.assertRaisesMessage(ValueError, "Cloro"):
+            v.confirmar()
+        self.prod.refresh_from_db()
+        self.assertEqual(self.prod.stock_litros, Decimal("50.00"))
+
+
+@override_settings(VENTAS_API_TOKEN="secreto")
+class VentasLoteTests(TestCase):
+    def setUp(self):
+        self.cli = Cliente.objects.create(nombres="Ana", apellidos="López")
+        self.prod = Producto.objects.create(nombre="Jabón Azul", precio_litro=Decimal("10.00"), stock_litros=Decimal("10"))
+
+    def _enviar(self, ventas, token="secreto", **kwargs):
+        if token:
+            kwargs["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        kwargs.setdefault("content_type", "application/json")
+        return self.client.post("/api/ventas/lote/", json.dumps({"ventas": ventas}), **kwargs)
+
+    def test_lote_registra_ventas_y_reporta_errores(self):
+        ventas = [
+            {"cliente": self.cli.pk, "detalles": [{"producto": self.prod.pk, "litros": "4"}]},
+            {"cliente": self.cli.pk, "detalles": [{"producto": self.prod.pk, "litros": "7"}]},
+            {"cliente": 999, "detalles": [{"producto": self.prod.pk, "litros": "1"}]},
+            {"cliente": self.cli.pk, "detalles": [{"producto": self.prod.pk, "litros": "6", "precio_unitario": "9.50"}]},
+        ]
+        resp = self._enviar(ventas)
+        self.assertEqual(resp.status_code, 200)
+        resultados = resp.json()["resultados"]
+        self.assertEqual([r["ok"] for r in resultados], [True, False, False, True])
+        self.assertIn("Stock insuficiente", resultados[1]["errores"][0])
+        self.assertEqual(Venta.objects.get(pk=resultados[3]["venta"]).total, Decimal("57.00"))
+        self.assertEqual(DetalleVenta.objects.count(), 2)
+        self.prod.refresh_from_db()
+        self.assertEqual(self.prod.stock_litros, Decimal("0.00"))
+
+    def test_lote_json_invalido(self):
+        resp = self.client.post(
+            "/api/ventas/lote/", "no-json", content_type="application/json", HTTP_AUTHORIZATION="Bearer secreto"
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_lote_exige_autenticacion_y_json(self):
+        venta = [{"cliente": self.cli.pk, "detalles": [{"producto": self.prod.pk, "litros": "1"}]}]
+        self.assertEqual(self._enviar(venta, token=None).status_code, 401)
+        self.assertEqual(self._enviar(venta, token="otro").status_code, 401)
+        self.assertEqual(self._enviar(venta, content_type="text/plain").status_code, 415)
+        self.assertFalse(Venta.objects.exists())
+
+    def test_lote_con_sesion_ignora_precios_sin_permiso(self):
+        from django.contrib.auth.models import Permission, User
+
+        usuario = User.objects.create_user("caja", password="x")
+        usuario.user_permissions.add(Permission.objects.get(codename="add_venta"))
+        self.client.force_login(usuario)
+        venta = [{"cliente": self.cli.pk, "detalles": [{"producto": self.prod.pk, "litros": "1", "precio_unitario": "0"}]}]
+        resultado = self._enviar(venta, token=None).json()["resultados"][0]
+        self.assertEqual(resultado["total"], "10.00")
+
+        from django.test import Client
+        con_csrf = Client(enforce_csrf_checks=True)
+        con_csrf.force_login(usuario)
+        resp = con_csrf.post("/api/ventas/lote/", json.dumps({"ventas": venta}), content_type="application/json")
+        self.assertEqual(resp.status_code, 403)
+
+    def test_lote_no_acepta_booleanos_como_ids(self):
+        resp = self._enviar([{"cliente": True, "detalles": [{"producto": True, "litros": "1"}]}])
+        errores = resp.json()["resultados"][0]["errores"]
+        self.assertEqual(errores, ["Cliente inexistente.", "Detalle 1: producto inexistente."])
+
+
+@sin_manifiesto
+class FormularioVentaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cli = Cliente.objects.create(nombres="Ana", apellidos="López")
+        self.prods = [
+            Producto.objects.create(nombre=f"Jabón {i}", precio_litro=Decimal("10.00"), stock_litros=Decimal("100"))
+            for i in range(5)
+        ]
+
+    def _datos(self, filas, litros="1.00"):
+        datos = {"cliente": self.cli.pk, "d-TOTAL_FORMS": filas, "d-INITIAL_FORMS": 0}
+        for i in range(filas):
+            datos[f"d-{i}-producto"] = self.prods[i % len(self.prods)].pk
+            datos[f"d-{i}-litros"] = litros
+            datos[f"d-{i}-precio_unitario"] = "0"
+        return datos
+
+    def _consultas(self, datos):
+        cache.clear()
+        with CaptureQueriesContext(connection) as contexto:
+            resp = self.client.post("/ventas/nueva/", datos)
+        self.assertEqual(resp.status_code, 200)
+        return len(contexto.captured_queries)
+
+    def test_consultas_no_dependen_de_las_filas(self):
+        # Litros inválidos: el formulario se valida y se vuelve a renderizar completo.
+        self.assertEqual(self._consultas(self._datos(3, "x")), self._consultas(self._datos(30, "x")))
+
+    def test_producto_inactivo_se_rechaza(self):
+        self.prods[0].activo = False
+        self.prods[0].save()
+        resp = self.client.post("/ventas/nueva/", self._datos(1))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("producto", resp.context["formset"].forms[0].errors)
+        self.assertFalse(Venta.objects.exists())
+
+    def test_crea_venta_con_precio_del_producto(self):
+        resp = self.client.post("/ventas/nueva/", self._datos(2, "2.00"))
+        self.assertRedirects(resp, "/ventas/")
+        venta = Venta.objects.get()
+        self.assertEqual(venta.total, Decimal("40.00"))
+        self.assertEqual(set(venta.detalles.values_list("precio_unitario", flat=True)), {Decimal("10.00")})
+
+    def test_cache_desactualizada_no_fija_precio_ni_producto(self):
+        self.client.get("/ventas/nueva/")  # llena el mapa de opciones
+        # ``update`` no dispara señales: la caché sigue con el precio y el estado viejos.
+        Producto.objects.filter(pk=self.prods[0].pk).update(precio_litro=Decimal("12.00"))
+        Producto.objects.filter(pk=self.prods[1].pk).update(activo=False)
+
+        resp = self.client.post("/ventas/nueva/", self._datos(2))
+        self.assertIn("producto", resp.context["formset"].forms[1].errors)
+        self.assertFalse(Venta.objects.exists())
+
+        resp = self.client.post("/ventas/nueva/", self._datos(1))
+        self.assertRedirects(resp, "/ventas/")
+        self.assertEqual(Venta.objects.get().total, Decimal("12.00"))
+
+
+@sin_manifiesto
+class PaginacionTests(TestCase):
+    def setUp(self):
+        self.cli = Cliente.objects.create(nombres="Ana", apellidos="López")
+        for i in range(7):
+            Venta.objects.create(cliente=self.cli)
+
+    def test_venta_list_pagina_por_cursor(self):
+        with CaptureQueriesContext(connection) as contexto:
+            resp = self.client.get("/ventas/", {"n": 3})
+        # El listado solo muestra la cantidad de líneas: nada de sumar subtotales.
+        self.assertNotIn("SUM(", " ".join(q["sql"] for q in contexto.captured_queries))
+        ids = [v.pk for v in resp.context["ventas"]]
+        self.assertEqual(ids, [7, 6, 5])
+
+        siguiente = resp.context["pagina"].url_siguiente
+        resp = self.client.get(f"/ventas/?{siguiente}")
+        self.assertEqual([v.pk for v in resp.context["ventas"]], [4, 3, 2])
+
+        anterior = resp.context["pagina"].url_anterior
+        resp = self.client.get(f"/ventas/?{anterior}")
+        self.assertEqual([v.pk for v in resp.context["ventas"]], [7, 6, 5])
+        self.assertIsNone(resp.context["pagina"].url_anterior)
+
+    def test_cliente_list_desempata_por_id(self):
+        Cliente.objects.create(nombres="Ana", apellidos="López")
+        resp = self.client.get("/clientes/", {"n": 1})
+        primero = resp.context["clientes"].objetos[0].pk
+        resp = self.client.get(f"/clientes/?{resp.context['pagina'].url_siguiente}")
+        self.assertNotEqual(resp.context["clientes"].objetos[0].pk, primero)
+        self.assertIsNone(resp.context["pagina"].url_siguiente)
+
+
+@sin_manifiesto
+class ResumenesTests(TestCase):
+    def setUp(self):
+        self.cli = Cliente.objects.create(nombres="Ana", apellidos="López")
+        self.prod = Producto.objects.create(nombre="Jabón Azul", precio_litro=Decimal("10.00"), stock_litros=Decimal("50"))
+        for litros in ("2.00", "3.00"):
+            v = Venta.objects.create(cliente=self.cli)
+            DetalleVenta.objects.create(venta=v, producto=self.prod, litros=Decimal(litros))
+            v.confirmar()
+
+    def test_confirmar_acumula_resumen_diario(self):
+        resumen = VentaDiariaProducto.objects.get(producto=self.prod, fecha=timezone.localdate())
+        self.assertEqual((resumen.litros, resumen.monto, resumen.lineas), (Decimal("5.00"), Decimal("50.00"), 2))
+        resumen = VentaDiariaCliente.objects.get(cliente=self.cli)
+        self.assertEqual((resumen.num_ventas, resumen.monto), (2, Decimal("50.00")))
+
+    def test_reconstruir_coincide_con_incremental(self):
+        antes = list(VentaDiariaProducto.objects.values_list("fecha", "producto_id", "litros", "monto", "lineas"))
+        VentaDiariaProducto.objects.update(litros=0)
+        call_command("reconstruir_resumenes", stdout=StringIO())
+        despues = list(VentaDiariaProducto.objects.values_list("fecha", "producto_id", "litros", "monto", "lineas"))
+        self.assertEqual(antes, despues)
+
+    def test_reporte_lee_resumenes(self):
+        hoy = timezone.localdate().isoformat()
+        with self.assertNumQueries(3):
+            resp = self.client.get("/reportes/ventas/", {"desde": hoy, "hasta": hoy})
+        self.assertEqual(resp.context["totales"]["ventas"], 2)
+        self.assertContains(resp, "Jabón Azul")
+
+    def test_exportar_csv_y_jsonl(self):
+        hoy = timezone.localdate().isoformat()
+        resp = self.client.get("/reportes/ventas/exportar/", {"desde": hoy, "hasta": hoy})
+        self.assertTrue(resp.streaming)
+        lineas = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(lineas[0], "venta,fecha,cliente,nit,producto,litros,precio_unitario,subtotal")
+        self.assertEqual(len(lineas), 3)
+
+        resp = self.client.get("/reportes/ventas/exportar/", {"desde": hoy, "hasta": hoy, "formato": "jsonl"})
+        ventas = [json.loads(l) for l in b"".join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual([len(v["detalles"]) for v in ventas], [1, 1])
+        self.assertEqual(ventas[1]["detalles"][0]["subtotal"], "30.00")
+
+
+@sin_manifiesto
+class ReposicionTests(TestCase):
+    def setUp(self):
+        self.hoy = timezone.localdate()
+        self.jabon = Producto.objects.create(nombre="Jabón", precio_litro=Decimal("10.00"), stock_litros=Decimal("30"))
+        self.cloro = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"), stock_litros=Decimal("100"))
+        # Jabón: 1 L diario durante cuatro semanas y 4 L diarios la última.
+        VentaDiariaProducto.objects.bulk_create([
+            VentaDiariaProducto(
+                fecha=self.hoy - timedelta(days=d), producto=self.jabon,
+                litros=Decimal("4") if d < 7 else Decimal("1"),
+            )
+            for d in range(40)
+        ])
+
+    def test_pronostico_por_producto(self):
+        # Consumo, stock, borrado e inserción (más el savepoint), con cualquier cantidad de productos.
+        with self.assertNumQueries(6):
+            call_command("pronosticar_reposicion", hasta=self.hoy.isoformat(), plazo=7, cobertura=7, stdout=StringIO())
+
+        jabon = PronosticoReposicion.objects.get(producto=self.jabon)
+        self.assertEqual(jabon.consumo_diario, Decimal("1.750"))
+        self.assertEqual(jabon.consumo_semana, Decimal("4.000"))
+        # Se usa el consumo de la última semana: 30 L alcanzan 7,5 días y faltan 4 * 14 - 30.
+        self.assertEqual(jabon.dias_cobertura, Decimal("7.5"))
+        self.assertEqual(jabon.sugerido, Decimal("26.00"))
+
+        cloro = PronosticoReposicion.objects.get(producto=self.cloro)
+        self.assertIsNone(cloro.dias_cobertura)
+        self.assertEqual(cloro.sugerido, Decimal("0"))
+
+    def test_reporte_ordena_por_cobertura(self):
+        call_command("pronosticar_reposicion", stdout=StringIO())
+        resp = self.client.get("/reportes/reposicion/")
+        self.assertEqual([p.producto for p in resp.context["pronosticos"]], [self.jabon, self.cloro])
+        resp = self.client.get("/reportes/reposicion/", {"reponer": "1"})
+        self.assertEqual([p.producto for p in resp.context["pronosticos"]], [self.jabon])
+
+    def test_cobertura_acotada_a_la_columna(self):
+        # 0,01 L vendidos en cuatro semanas y stock al máximo: sin tope no entra en DecimalField(10, 1).
+        Producto.objects.filter(pk=self.cloro.pk).update(stock_litros=Decimal("99999999.99"))
+        VentaDiariaProducto.objects.create(fecha=self.hoy, producto=self.cloro, litros=Decimal("0.01"))
+        call_command("pronosticar_reposicion", hasta=self.hoy.isoformat(), stdout=StringIO())
+        self.assertEqual(PronosticoReposicion.objects.get(producto=self.cloro).dias_cobertura, Decimal("36500.0"))
+
+
+class ImportacionTests(TestCase):
+    def test_importar_crea_actualiza_y_reporta_errores(self):
+        existente = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"), stock_litros=Decimal("1"))
+        csv_texto = (
+            "Nombre,Tipo,PrecioLitro,Stock,Activo\n"
+            "Cloro,desinfectante,6.50,20,si\n"
+            "Jabón Azul,jabon,10,50,\n"
+            ",jabon,1,1,si\n"
+            "Suavizante,otro,abc,1,no\n"
+        )
+        archivo = SimpleUploadedFile("productos.csv", csv_texto.encode("utf-8"))
+        resp = self.client.post("/productos/importar/", {"archivo": archivo})
+        resultado = resp.context["resultado"]
+        self.assertEqual((resultado.creados, resultado.actualizados), (1, 1))
+        self.assertEqual([linea for linea, _m in resultado.errores], [4, 5])
+        existente.refresh_from_db()
+        self.assertEqual((existente.precio_litro, existente.stock_litros), (Decimal("6.50"), Decimal("20.00")))
+
+    def test_celdas_vacias_no_pisan_y_numeros_grandes_se_reportan(self):
+        existente = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"), stock_litros=Decimal("8"))
+        csv_texto = (
+            "Nombre,Tipo,PrecioLitro,Stock,Activo\n"
+            "Cloro,desinfectante,,,si\n"
+            "Jabón,jabon,1,123456789,si\n"
+            "Suavizante,otro,1,99999999.999,si\n"
+            "Cera,otro,1e40,1,si\n"
+        )
+        from .importacion import importar_productos
+
+        resultado = importar_productos(StringIO(csv_texto))
+        self.assertEqual([linea for linea, _m in resultado.errores], [3, 4, 5])
+        self.assertEqual((resultado.creados, resultado.actualizados), (0, 1))
+        existente.refresh_from_db()
+        self.assertEqual((existente.precio_litro, existente.stock_litros), (Decimal("5.00"), Decimal("8.00")))
+        self.assertFalse(MovimientoStock.objects.filter(producto=existente).exists())
+
+    def test_comando_en_lotes(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8") as f:
+            f.write("Nombre,Tipo,PrecioLitro,Stock,Activo\n")
+            for i in range(25):
+                f.write(f"Producto {i},jabon,1.00,{i},si\n")
+        self.addCleanup(os.remove, f.name)
+        call_command("importar_productos", f.name, "--lote", "10", stdout=StringIO())
+        self.assertEqual(Producto.objects.count(), 25)
+
+
+@sin_manifiesto
+class AcumuladosClienteTests(TestCase):
+    def setUp(self):
+        self.prod = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"), stock_litros=Decimal("100"))
+        self.ana = Cliente.objects.create(nombres="Ana", apellidos="López")
+        self.beto = Cliente.objects.create(nombres="Beto", apellidos="Arias")
+
+    def _vender(self, cliente, litros):
+        venta = Venta.objects.create(cliente=cliente)
+        DetalleVenta.objects.create(venta=venta, producto=self.prod, litros=Decimal(litros))
+        venta.confirmar()
+        return venta
+
+    def test_confirmar_y_lote_actualizan_acumulados(self):
+        self._vender(self.ana, "2")
+        ultima = self._vender(self.ana, "1")
+        registrar_ventas_en_lote([
+            {"cliente": self.beto.pk, "detalles": [{"producto": self.prod.pk, "litros": "10"}]},
+            {"cliente": self.beto.pk, "detalles": [{"producto": self.prod.pk, "litros": "1"}]},
+        ])
+        self.ana.refresh_from_db()
+        self.beto.refresh_from_db()
+        self.assertEqual((self.ana.num_ventas, self.ana.total_comprado), (2, Decimal("15.00")))
+        self.assertEqual(self.ana.ultima_compra, ultima.fecha)
+        self.assertEqual((self.beto.num_ventas, self.beto.total_comprado), (2, Decimal("55.00")))
+
+        resp = self.client.get("/clientes/", {"orden": "total"})
+        self.assertEqual([c.pk for c in resp.context["clientes"]], [self.beto.pk, self.ana.pk])
+        resp = self.client.get("/clientes/", {"orden": "total", "minimo": "20"})
+        self.assertEqual([c.pk for c in resp.context["clientes"]], [self.beto.pk])
+        resp = self.client.get("/clientes/", {"orden": "reciente", "n": 1})
+        self.assertEqual([c.pk for c in resp.context["clientes"]], [self.beto.pk])
+        siguiente = self.client.get(f"/clientes/?{resp.context['pagina'].url_siguiente}")
+        self.assertEqual([c.pk for c in siguiente.context["clientes"]], [self.ana.pk])
+
+    def test_recalcular_corrige_acumulados(self):
+        self._vender(self.ana, "2")
+        Cliente.objects.update(total_comprado=999, num_ventas=7)
+        call_command("recalcular_clientes", "--lote", "1", stdout=StringIO())
+        self.ana.refresh_from_db()
+        self.beto.refresh_from_db()
+        self.assertEqual((self.ana.num_ventas, self.ana.total_comprado), (1, Decimal("10.00")))
+        self.assertEqual((self.beto.num_ventas, self.beto.total_comprado, self.beto.ultima_compra), (0, Decimal("0.00"), None))
+
+
+class LibroStockTests(TestCase):
+    def setUp(self):
+        self.cli = Cliente.objects.create(nombres="Juan", apellidos="Pérez")
+        self.client.post("/productos/nuevo/", {
+            "nombre": "Cloro", "tipo": "desinfectante", "precio_litro": "5.00", "stock_litros": "20", "activo": "on",
+        })
+        self.prod = Producto.objects.get(nombre="Cloro")
+
+    def _vender(self, litros):
+        venta = Venta.objects.create(cliente=self.cli)
+        DetalleVenta.objects.create(venta=venta, producto=self.prod, litros=Decimal(litros))
+        venta.confirmar()
+
+    def _libro(self, **kwargs):
+        return stock_segun_libro([self.prod.pk], **kwargs).get().stock_libro
+
+    def test_venta_y_edicion_quedan_en_el_libro(self):
+        self._vender("3")
+        self.client.post(f"/productos/{self.prod.pk}/editar/", {
+            "nombre": "Cloro", "tipo": "desinfectante", "precio_litro": "5.00", "stock_litros": "30",
+        })
+        tipos = list(MovimientoStock.objects.filter(producto=self.prod).order_by("id").values_list("tipo", "litros"))
+        self.assertEqual(tipos, [
+            ("reposicion", Decimal("20.00")), ("venta", Decimal("-3.00")), ("reposicion", Decimal("13.00")),
+        ])
+        self.assertEqual(self._libro(), Decimal("30.00"))
+
+    def test_foto_acota_la_suma_y_respeta_el_momento(self):
+        self._vender("5")
+        call_command("snapshot_stock", stdout=StringIO())
+        foto = SnapshotStock.objects.get(producto=self.prod)
+        self.assertEqual(foto.stock, Decimal("15.00"))
+        antes = timezone.now()
+        self._vender("2")
+        self.assertEqual(self._libro(), Decimal("13.00"))
+        self.assertEqual(self._libro(momento=antes), Decimal("15.00"))
+        # Sin movimientos nuevos no se toma otra foto.
+        call_command("snapshot_stock", stdout=StringIO())
+        call_command("snapshot_stock", stdout=StringIO())
+        self.assertEqual(SnapshotStock.objects.filter(producto=self.prod).count(), 2)
+
+    def test_edicion_desde_el_admin_queda_en_el_libro(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "x"))
+        self.client.post(f"/admin/tienda/producto/{self.prod.pk}/change/", {
+            "nombre": "Cloro", "tipo": "desinfectante", "precio_litro": "5.00", "stock_litros": "12", "activo": "on",
+        })
+        self.prod.refresh_from_db()
+        self.assertEqual(self.prod.stock_litros, Decimal("12.00"))
+        self.assertEqual(self._libro(), Decimal("12.00"))
+
+    def test_conciliar_detecta_y_corrige(self):
+        call_command("conciliar_stock", stdout=StringIO())
+        Producto.objects.filter(pk=self.prod.pk).update(stock_litros=Decimal("18"))
+        with self.assertRaises(CommandError):
+            call_command("conciliar_stock", "--lote", "1", stdout=StringIO())
+        call_command("conciliar_stock", "--corregir", stdout=StringIO())
+        self.assertEqual(self._libro(), Decimal("18.00"))
+        call_command("conciliar_stock", stdout=StringIO())
+
+
+@sin_manifiesto
+class BusquedaTests(TestCase):
+    def setUp(self):
+        self.perez = Cliente.objects.create(nombres="José", apellidos="Pérez", nit="1234567-8")
+        Cliente.objects.create(nombres="Ana", apellidos="López")
+
+    def test_busqueda_ignora_tildes_y_mayusculas(self):
+        self.assertEqual(self.perez.busqueda, "jose perez 12345678")
+        resp = self.client.get("/clientes/", {"q": "PEREZ"})
+        self.assertEqual([c.pk for c in resp.context["clientes"]], [self.perez.pk])
+
+    def test_autocompletar_clientes(self):
+        resp = self.client.get("/api/clientes/buscar/", {"q": "jos", "k": 5})
+        self.assertEqual(resp.json()["resultados"], [{"id": self.perez.pk, "texto": "José Pérez (1234567-8)"}])
+        resp = self.client.get("/api/clientes/buscar/", {"q": "1234"})
+        self.assertEqual(len(resp.json()["resultados"]), 1)
+
+    def test_formulario_venta_no_lista_clientes(self):
+        resp = self.client.get("/ventas/nueva/")
+        self.assertContains(resp, 'data-autocompletar="/api/clientes/buscar/"')
+        self.assertNotContains(resp, "López")
+
+
+@sin_manifiesto
+@override_settings(AUDITORIA_ASINCRONA=False)
+class CatalogoCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.prod = Producto.objects.create(nombre="Jabón Azul", precio_litro=Decimal("10.00"), stock_litros=Decimal("50"))
+
+    def test_catalogo_cacheado_y_condicional(self):
+        primera = self.client.get("/catalogo/")
+        self.assertContains(primera, "Jabón Azul")
+        with self.assertNumQueries(0):
+            segunda = self.client.get("/catalogo/")
+        self.assertEqual(segunda.content, primera.content)
+
+        resp = self.client.get("/catalogo/", HTTP_IF_NONE_MATCH=primera["ETag"])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_guardar_producto_invalida_catalogo(self):
+        etag = self.client.get("/catalogo/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prod.nombre = "Jabón Verde"
+            self.prod.save()
+        resp = self.client.get("/catalogo/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "Jabón Verde")
+
+    def test_confirmar_invalida_catalogo(self):
+        etag = self.client.get("/catalogo/")["ETag"]
+        v = Venta.objects.create(cliente=Cliente.objects.create(nombres="Ana"))
+        DetalleVenta.objects.create(venta=v, producto=self.prod, litros=Decimal("5.00"))
+        with self.captureOnCommitCallbacks(execute=True):
+            v.confirmar()
+        self.assertNotEqual(self.client.get("/catalogo/")["ETag"], etag)
+
+
+@override_settings(AUDITORIA_ASINCRONA=False)
+class PreciosApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.azul = Producto.objects.create(nombre="Jabón Azul", precio_litro=Decimal("10.00"))
+        self.cloro = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"))
+        Producto.objects.create(nombre="Viejo", precio_litro=Decimal("1.00"), activo=False)
+
+    def test_mapa_filtrado_y_cacheado(self):
+        resp = self.client.get("/api/productos/precios/", {"ids": f"{self.azul.pk}"})
+        self.assertEqual(resp.json()["precios"], {str(self.azul.pk): "10.00"})
+        with self.assertNumQueries(0):
+            resp = self.client.get("/api/productos/precios/")
+        self.assertEqual(len(resp.json()["precios"]), 2)
+        resp = self.client.get("/api/productos/precios/", HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_cambios_desde_version(self):
+        version = self.client.get("/api/productos/precios/").json()["version"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cloro.precio_litro = Decimal("6.00")
+            self.cloro.save()
+        data = self.client.get("/api/productos/precios/", {"version": version}).json()
+        self.assertFalse(data["completo"])
+        self.assertEqual(data["precios"], {str(self.cloro.pk): "6.00"})
+
+
+class ComprobantesTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajuste = override_settings(COMPROBANTES_DIR=directorio.name)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+        cli = Cliente.objects.create(nombres="Ana", apellidos="López")
+        self.venta = Venta.objects.create(cliente=cli)
+        for nombre in ("Jabón Azul", "Cloro", "Suavizante"):
+            prod = Producto.objects.create(nombre=nombre, precio_litro=Decimal("4.00"), stock_litros=Decimal("10"))
+            DetalleVenta.objects.create(venta=self.venta, producto=prod, litros=Decimal("2.00"))
+        self.venta.confirmar()
+
+    def test_generar_una_vez_sin_n_mas_1(self):
+        with self.assertNumQueries(3):
+            archivo = comprobantes.generar(self.venta.pk)
+        self.assertIn("Q 8,00<", archivo.read_text())
+        with self.assertNumQueries(0):
+            self.assertEqual(comprobantes.generar(self.venta.pk), archivo)
+
+    def test_descarga_sirve_archivo_cacheado(self):
+        comprobantes.generar(self.venta.pk)
+        with self.assertNumQueries(0):
+            resp = self.client.get(f"/ventas/{self.venta.pk}/comprobante/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("no-cache", resp["Cache-Control"])
+        resp.close()
+        resp = self.client.get(f"/ventas/{self.venta.pk}/comprobante/", HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_correccion_regenera_el_comprobante(self):
+        archivo = comprobantes.generar(self.venta.pk)
+        detalle = self.venta.detalles.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            detalle.litros = Decimal("5.00")
+            detalle.save()
+        self.assertIsNone(comprobantes.ruta(self.venta.pk))
+        nuevo = comprobantes.generar(self.venta.pk)
+        self.assertNotEqual(nuevo, archivo)
+        self.assertIn("Q 20,00<", nuevo.read_text())
+
+    def test_venta_inexistente(self):
+        self.assertEqual(self.client.get("/ventas/999/comprobante/").status_code, 404)
+
+
+@override_settings(AUDITORIA_ASINCRONA=False, AUDITORIA_LOTE=50)
+class AuditoriaTests(TestCase):
+    def setUp(self):
+        auditoria.vaciar()
+        LogAccion.objects.all().delete()
+
+    def test_eventos_se_escriben_en_lote_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            prod = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"))
+            prod.precio_litro = Decimal("6.00")
+            prod.save()
+            prod.delete()
+        self.assertFalse(LogAccion.objects.exists())
+
+        with self.assertNumQueries(1):
+            auditoria.vaciar()
+        self.assertEqual(
+            list(LogAccion.objects.order_by("id").values_list("evento", "modelo")),
+            [("crear", "producto"), ("editar", "producto"), ("eliminar", "producto")],
+        )
+        self.assertEqual(json.loads(LogAccion.objects.get(evento="editar").payload)["precio_litro"], "6.00")
+
+    def test_rollback_no_deja_eventos(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Cliente.objects.create(nombres="Ana")
+        self.assertEqual(len(callbacks), 1)
+        auditoria.vaciar()
+        self.assertFalse(LogAccion.objects.exists())
+
+    def test_caminos_masivos_quedan_en_la_bitacora(self):
+        from .importacion import importar_productos
+
+        cli = Cliente.objects.create(nombres="Ana")
+        prod = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"), stock_litros=Decimal("10"))
+        auditoria.vaciar()
+        LogAccion.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_ventas_en_lote([{"cliente": cli.pk, "detalles": [{"producto": prod.pk, "litros": "2"}]}])
+        with self.captureOnCommitCallbacks(execute=True):
+            importar_productos(StringIO("Nombre,Tipo,PrecioLitro,Stock,Activo\nCloro,,,20,si\nJabón,,1,5,si\n"))
+        auditoria.vaciar()
+        eventos = sorted(LogAccion.objects.values_list("evento", "modelo"))
+        self.assertEqual(eventos, sorted([
+            ("crear", "venta"), ("crear", "detalleventa"), ("crear", "movimientostock"),
+            ("editar", "producto"), ("crear", "producto"), ("crear", "movimientostock"), ("crear", "movimientostock"),
+        ]))
+
+    def test_sin_hilo_se_escribe_al_terminar_la_peticion(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Cliente.objects.create(nombres="Ana")
+        self.assertFalse(LogAccion.objects.exists())
+        self.client.get("/api/productos/buscar/")
+        self.assertEqual(list(LogAccion.objects.values_list("evento", "modelo")), [("crear", "cliente")])
+
+
+@sin_manifiesto
+@override_settings(AUDITORIA_ASINCRONA=False)
+class PlanesConsultaTests(TestCase):
+    """Las consultas que emiten las vistas más usadas no deben recorrer tablas completas.
+
+    Se captura el SQL real de cada petición y se le pide el plan a la base.
+    """
+
+    # SQLite lista "SCAN t" al recorrer la tabla en orden de rowid; solo se
+    # acepta si la consulta ordena por la PK de esa tabla y corta con LIMIT.
+    _ORDEN_POR_PK = re.compile(r'ORDER BY "(\w+)"\."id" (?:ASC|DESC) LIMIT \d+$')
+
+    @classmethod
+    def setUpTestData(cls):
+        productos = Producto.objects.bulk_create(
+            Producto(nombre=f"Producto {i:04d}", busqueda=f"producto {i:04d}", precio_litro=Decimal("1.00"), activo=i % 5 != 0)
+            for i in range(300)
+        )
+        clientes = Cliente.objects.bulk_create(
+            Cliente(
+                nombres=f"Nombre {i}", apellidos=f"Apellido {i % 50:02d}", busqueda=f"apellido {i % 50:02d} nombre {i}",
+                num_ventas=i % 7, total_comprado=Decimal(i), ultima_compra=timezone.now() if i % 3 else None,
+            )
+            for i in range(300)
+        )
+        ventas = Venta.objects.bulk_create(Venta(cliente=clientes[i % 300]) for i in range(600))
+        DetalleVenta.objects.bulk_create(
+            DetalleVenta(venta=v, producto=productos[i % 300], litros=Decimal("1.00")) for i, v in enumerate(ventas)
+        )
+        hoy = timezone.localdate()
+        VentaDiariaProducto.objects.bulk_create(
+            VentaDiariaProducto(fecha=hoy - timedelta(days=d), producto=p) for d in range(60) for p in productos[:20]
+        )
+        VentaDiariaCliente.objects.bulk_create(
+            VentaDiariaCliente(fecha=hoy - timedelta(days=d), cliente=c) for d in range(60) for c in clientes[:20]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def _sql_de(self, url):
+        """Las SELECT sobre tablas de la tienda que emite la vista al responder ``url``."""
+        cache.clear()  # algunas páginas se guardan enteras
+        with CaptureQueriesContext(connection) as contexto:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200, url)
+            if resp.streaming:
+                b"".join(resp.streaming_content)
+        return [
+            q["sql"] for q in contexto.captured_queries
+            if q["sql"].startswith("SELECT") and '"tienda_' in q["sql"]
+        ]
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # Con el recorrido secuencial penalizado, si igual aparece es que no hay índice que sirva.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {sql}")
+                return "\n".join(fila[0] for fila in cursor.fetchall())
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return "\n".join(fila[-1] for fila in cursor.fetchall())
+
+    def assertSinRecorridoSecuencial(self, url):
+        consultas = self._sql_de(url)
+        self.assertTrue(consultas, f"{url} no consultó la base")
+        for sql in consultas:
+            plan = self._plan(sql)
+            if connection.vendor == "postgresql":
+                recorridos = re.findall(r"Seq Scan on (\w+)", plan)
+            else:
+                recorridos = re.findall(r"\bSCAN (\w+)\b(?! USING)", plan)
+                orden = self._ORDEN_POR_PK.search(sql)
+                if orden and "USE TEMP B-TREE" not in plan:
+                    recorridos = [t for t in recorridos if t != orden.group(1)]
+            self.assertFalse(recorridos, f"{url}: recorrido secuencial en {recorridos}:\n{sql}\n{plan}")
+
+    def _siguiente(self, url, contexto):
+        return f"{url.split('?')[0]}?{self.client.get(url).context[contexto].url_siguiente}"
+
+    def test_consultas_de_las_vistas_usan_indices(self):
+        hoy = timezone.localdate()
+        rango = f"desde={hoy - timedelta(days=7)}&hasta={hoy}"
+        urls = [
+            "/catalogo/",
+            "/productos/",
+            self._siguiente("/productos/", "pagina"),
+            "/clientes/",
+            "/clientes/?orden=total",
+            "/clientes/?orden=ventas",
+            "/clientes/?orden=reciente",
+            self._siguiente("/clientes/?orden=total", "pagina"),
+            "/ventas/",
+            self._siguiente("/ventas/", "pagina"),
+            f"/reportes/ventas/?{rango}",
+            f"/reportes/ventas/exportar/?{rango}",
+            f"/reportes/ventas/exportar/?{rango}&formato=jsonl",
+        ]
+        for url in urls:
+            with self.subTest(url):
+                self.assertSinRecorridoSecuencial(url)
+
+    def test_busqueda_usa_indices(self):
+        if connection.vendor != "postgresql":
+            # SQLite no tiene índice trigram y su LIKE ignora el B-tree: solo se puede comprobar en PostgreSQL.
+            self.skipTest("Los índices de búsqueda solo existen en PostgreSQL.")
+        for url in ("/productos/?q=producto+01", "/clientes/?q=apellido+07", "/api/productos/buscar/?q=prod", "/api/clientes/buscar/?q=ape"):
+            with self.subTest(url):
+                self.assertSinRecorridoSecuencial(url)
+
+
+@sin_manifiesto
+@override_settings(AUDITORIA_ASINCRONA=False, CARRITO_RESERVA=600)
+class CarritoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cli = Cliente.objects.create(nombres="Ana", apellidos="López")
+        self.prod = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"), stock_litros=Decimal("10"))
+
+    def tearDown(self):
+        # Las reservas viven en la caché: que no pasen a otras pruebas con los mismos pk.
+        cache.clear()
+
+    def test_reserva_impide_vender_dos_veces_los_mismos_litros(self):
+        # Agregar solo lee el producto; nada se escribe en las tablas.
+        with self.assertNumQueries(1):
+            carrito.agregar("a", self.prod.pk, Decimal("8"))
+        with self.assertRaisesMessage(ValueError, "Disponible: 2.00"):
+            carrito.agregar("b", self.prod.pk, Decimal("3"))
+        carrito.agregar("b", self.prod.pk, Decimal("2"))
+        self.assertEqual(carrito.reservado([self.prod.pk]), {self.prod.pk: Decimal("10.00")})
+        carrito.quitar("a", self.prod.pk)
+        self.assertEqual(carrito.reservado([self.prod.pk]), {self.prod.pk: Decimal("2.00")})
+        self.assertFalse(Venta.objects.exists())
+
+    def test_barrido_libera_carritos_vencidos(self):
+        carrito.agregar("a", self.prod.pk, Decimal("4"))
+        self.assertEqual(carrito.barrer(), 0)
+        self.assertEqual(carrito.barrer(ahora=time.time() + 700), 1)
+        self.assertEqual(carrito.reservado([self.prod.pk]), {self.prod.pk: Decimal("0.00")})
+        self.assertEqual(carrito.lineas("a"), {})
+
+    def test_contador_descartado_no_rompe_el_carrito(self):
+        carrito.agregar("a", self.prod.pk, Decimal("4"))
+        cache.delete(f"carrito:reservado:{self.prod.pk}")
+        carrito.quitar("a", self.prod.pk)
+        self.assertEqual(carrito.reservado([self.prod.pk]), {self.prod.pk: Decimal("0.00")})
+        carrito.agregar("a", self.prod.pk, Decimal("1"))
+        self.assertEqual(carrito.reservado([self.prod.pk]), {self.prod.pk: Decimal("1.00")})
+
+    def test_barrido_exige_cache_compartida(self):
+        from .checks import revisar_cache
+
+        self.assertEqual([e.id for e in revisar_cache(None)], ["tienda.E001"])
+        with self.assertRaisesMessage(CommandError, "REDIS_URL"):
+            call_command("liberar_reservas", stdout=StringIO())
+
+    def test_checkout_crea_venta_y_libera(self):
+        self.client.post("/carrito/agregar/", {"producto": self.prod.pk, "litros": "3"})
+        self.assertContains(self.client.get("/carrito/"), "Q 15,00")
+        resp = self.client.post("/carrito/checkout/", {"cliente": self.cli.pk})
+        self.assertRedirects(resp, "/ventas/", fetch_redirect_response=False)
+        venta = Venta.objects.get()
+        self.assertEqual(venta.total, Decimal("15.00"))
+        self.prod.refresh_from_db()
+        self.assertEqual(self.prod.stock_litros, Decimal("7.00"))
+        self.assertEqual(carrito.reservado([self.prod.pk]), {self.prod.pk: Decimal("0.00")})
+
+    def test_ventas_directas_respetan_lo_reservado(self):
+        carrito.agregar("a", self.prod.pk, Decimal("8"))
+        venta = Venta.objects.create(cliente=self.cli)
+        DetalleVenta.objects.create(venta=venta, producto=self.prod, litros=Decimal("3"))
+        with self.assertRaisesMessage(ValueError, "Disponible: 2.00"):
+            venta.confirmar()
+        resultados = registrar_ventas_en_lote([
+            {"cliente": self.cli.pk, "detalles": [{"producto": self.prod.pk, "litros": "3"}]},
+            {"cliente": self.cli.pk, "detalles": [{"producto": self.prod.pk, "litros": "2"}]},
+        ])
+        self.assertEqual([r["ok"] for r in resultados], [False, True])
+        self.assertIn("Disponible: 2.00", resultados[0]["errores"][0])
+        # El carrito que reservó sí puede cerrar su compra.
+        self.assertEqual(carrito.confirmar("a", self.cli).total, Decimal("40.00"))
+        self.prod.refresh_from_db()
+        self.assertEqual(self.prod.stock_litros, Decimal("0.00"))
+
+    def test_checkout_rechaza_producto_desactivado(self):
+        self.client.post("/carrito/agregar/", {"producto": self.prod.pk, "litros": "3"})
+        Producto.objects.filter(pk=self.prod.pk).update(activo=False)
+        resp = self.client.post("/carrito/checkout/", {"cliente": self.cli.pk})
+        self.assertContains(resp, "ya no está a la venta")
+        self.assertFalse(Venta.objects.exists())
+        self.prod.refresh_from_db()
+        self.assertEqual(self.prod.stock_litros, Decimal("10.00"))
+
+    def test_carrito_ocupado_responde_409(self):
+        self.client.get("/carrito/")
+        token = self.client.cookies[carrito.COOKIE].value
+        cache.add(f"carrito:{token}:bloqueo", 1)
+        with mock.patch("tienda.carrito.time", wraps=time) as reloj:
+            reloj.monotonic.side_effect = [0, 10]  # el plazo de espera vence enseguida
+            resp = self.client.post("/carrito/agregar/", {"producto": self.prod.pk, "litros": "1"})
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(carrito.reservado([self.prod.pk]), {self.prod.pk: Decimal("0.00")})
+
+
+@sin_manifiesto
+@override_settings(AUDITORIA_ASINCRONA=False, DATABASE_ROUTERS=["tienda.routers.RouterReplica"])
+class ReplicaTests(TestCase):
+    def test_router_lee_de_la_replica_salvo_en_transacciones_o_tras_escribir(self):
+        router = routers.RouterReplica()
+        self.assertIsNone(router.db_for_read(Producto))
+
+        @routers.lectura_replica
+        def vista(request):
+            destinos = [router.db_for_read(Producto)]
+            with routers.primaria():
+                destinos.append(router.db_for_read(Producto))
+            connection.in_atomic_block = True
+            destinos.append(router.db_for_read(Producto))
+            connection.in_atomic_block = False
+            destinos.append(router.db_for_read(Producto))
+            router.db_for_write(Producto)
+            destinos.append(router.db_for_read(Producto))
+            return destinos
+
+        # TestCase envuelve todo en una transacción; se simula estar fuera de ella.
+        previo = connection.in_atomic_block
+        try:
+            connection.in_atomic_block = False
+            destinos = vista(None)
+        finally:
+            connection.in_atomic_block = previo
+        self.assertEqual(destinos, ["replica", None, None, "replica", None])
+
+    def test_cookie_pega_a_la_primaria_tras_escribir(self):
+        resp = self.client.post("/productos/nuevo/", {
+            "nombre": "Cloro", "tipo": "x", "precio_litro": "5.00", "stock_litros": "1", "activo": "on",
+        })
+        self.assertIn(routers.COOKIE, resp.cookies)
+        # Con la cookie, la vista marcada lee de la primaria (no hay alias "replica" en las pruebas).
+        self.assertContains(self.client.get("/productos/"), "Cloro")
+        self.assertNotIn(routers.COOKIE, self.client.get("/catalogo/").cookies)
+
+
+@sin_manifiesto
+@override_settings(AUDITORIA_ASINCRONA=False)
+class VistasAsyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def test_lecturas_con_async_client(self):
+        producto = await Producto.objects.acreate(nombre="Cloro", precio_litro=Decimal("5.00"), activo=True)
+        cliente = await Cliente.objects.acreate(nombres="Ana", apellidos="López")
+        await Venta.objects.acreate(cliente=cliente)
+
+        resp = await self.async_client.get("/catalogo/")
+        self.assertContains(resp, "Cloro")
+        resp = await self.async_client.get(f"/api/productos/{producto.pk}/precio/")
+        self.assertEqual(resp.json(), {"precio": "5.00"})
+        self.assertEqual((await self.async_client.get("/api/productos/999999/precio/")).status_code, 404)
+
+        resp = await self.async_client.get("/ventas/")
+        self.assertContains(resp, "Ana López")
+        # Las consultas corren en el hilo de sync_to_async y aun así se miden.
+        self.assertIn('desc="1 consultas"', resp["Server-Timing"])
+
+    def test_cadena_de_middleware_sin_adaptar_bajo_asgi(self):
+        from django.core.handlers.asgi import ASGIHandler
+
+        # Django anota en django.request cada middleware que tiene que adaptar.
+        with self.assertNoLogs("django.request", "DEBUG"):
+            handler = ASGIHandler()
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
+
+    async def test_exportacion_async_no_junta_el_archivo(self):
+        cliente = await Cliente.objects.acreate(nombres="Ana", apellidos="López")
+        producto = await Producto.objects.acreate(nombre="Cloro", precio_litro=Decimal("5.00"))
+        venta = await Venta.objects.acreate(cliente=cliente)
+        await DetalleVenta.objects.acreate(venta=venta, producto=producto, litros=Decimal("2"), precio_unitario=Decimal("5"))
+        hoy = timezone.localdate().isoformat()
+
+        resp = await self.async_client.get("/reportes/ventas/exportar/", {"desde": hoy, "hasta": hoy, "formato": "jsonl"})
+        self.assertTrue(resp.is_async)
+        contenido = b"".join([parte async for parte in resp.streaming_content])
+        self.assertEqual(json.loads(contenido)["detalles"][0]["subtotal"], "10.00")
+
+    async def test_pagina_versionada_async(self):
+        await Producto.objects.acreate(nombre="Cloro", precio_litro=Decimal("5.00"))
+        primera = await self.async_client.get("/productos/")
+        resp = await self.async_client.get("/productos/", headers={"if-none-match": primera["ETag"]})
+        self.assertEqual(resp.status_code, 304)
+
+
+@sin_manifiesto
+class VentaDetalleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cli = Cliente.objects.create(nombres="Ana", apellidos="López")
+        prod = Producto.objects.create(nombre="Cloro", precio_litro=Decimal("5.00"), stock_litros=Decimal("20"))
+        self.venta = Venta.objects.create(cliente=cli)
+        self.detalle = DetalleVenta.objects.create(venta=self.venta, producto=prod, litros=Decimal("2.00"))
+        self.venta.confirmar()
+        self.url = f"/ventas/{self.venta.pk}/"
+
+    def test_detalle_en_dos_consultas_y_luego_desde_cache(self):
+        resp = self.client.get(self.url)
+        self.assertContains(resp, "Cloro")
+        self.assertIn('desc="2 consultas"', resp["Server-Timing"])
+        self.assertIn("no-cache", resp["Cache-Control"])
+        self.assertNotIn("immutable", resp["Cache-Control"])
+
+        otra = self.client.get(self.url)
+        self.assertIn('desc="0 consultas"', otra["Server-Timing"])
+        self.assertEqual(otra["ETag"], resp["ETag"])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get("/ventas/999999/").status_code, 404)
+
+    def test_correccion_invalida_la_pagina(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.detalle.litros = Decimal("3.00")
+            self.detalle.save()
+        # El navegador revalida con el ETag viejo y recibe la página corregida.
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+
+    def test_lector_tardio_no_deja_la_pagina_vieja(self):
+        vieja = async_to_sync(comprobantes.aversion)(self.venta.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.detalle.litros = Decimal("3.00")
+            self.detalle.save()
+        # Un lector que renderizó antes del commit guarda su página después.
+        cache.set(comprobantes.clave_pagina(self.venta.pk, vieja), ('"viejo"', b"viejo"))
+        resp = self.client.get(self.url)
+        self.assertNotEqual(resp["ETag"], '"viejo"')
+        self.assertContains(resp, "3,00")
+
+
+@sin_manifiesto
+class AdminVentasTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "x"))
+        self.cli = Cliente.objects.create(nombres="Ana", apellidos="López")
+
+    def _consultas_listado(self, ventas):
+        Venta.objects.bulk_create(Venta(cliente=Cliente.objects.create(nombres=f"C{i}")) for i in range(ventas))
+        with CaptureQueriesContext(connection) as contexto:
+            resp = self.client.get("/admin/tienda/venta/")
+        self.assertEqual(resp.status_code, 200)
+        return len(contexto.captured_queries)
+
+    def test_listado_no_depende_de_las_ventas(self):
+        self.assertEqual(self._consultas_listado(3), self._consultas_listado(12))
+
+    def test_paginador_cuenta_hasta_el_tope_con_filtros(self):
+        Venta.objects.bulk_create(Venta(cliente=self.cli) for _ in range(5))
+        with mock.patch("tienda.paginacion.TOPE_CONTEO", 3):
+            paginador = PaginadorEstimado(Venta.objects.filter(cliente=self.cli).order_by("-id"), 2)
+            self.assertEqual(paginador.count, 3)
+            self.assertTrue(paginador.truncado)
+            # El listado avisa que hay filas que no se pueden recorrer.
+            with mock.patch("tienda.admin.TOPE_CONTEO", 3):
+                resp = self.client.get("/admin/tienda/venta/", {"cliente__id__exact": self.cli.pk})
+            self.assertContains(resp, "Hay más de 3 resultados")
+        # Sin estadísticas del planificador (SQLite) se cuenta exacto.
+        self.assertEqual(PaginadorEstimado(Venta.objects.order_by("-id"), 2).count, 5)
+
+    def test_filtro_de_fecha_no_recorre_toda_la_tabla(self):
+        Venta.objects.create(cliente=self.cli)
+        desde = timezone.localdate() - timedelta(days=7)
+        for url in ("/admin/tienda/venta/", "/admin/tienda/movimientostock/"):
+            with CaptureQueriesContext(connection) as contexto:
+                resp = self.client.get(url, {"fecha__gte": desde.isoformat()})
+            self.assertEqual(resp.status_code, 200)
+            self.assertFalse([q["sql"] for q in contexto.captured_queries if "DISTINCT" in q["sql"]])
+
+    def test_busqueda_en_ventas_no_usa_columna_busqueda(self):
+        self.assertEqual(self.client.get("/admin/tienda/venta/", {"q": "x"}).status_code, 200)
+
+    def test_autocompletar_cliente_usa_busqueda_normalizada(self):
+        resp = self.client.get("/admin/autocomplete/", {
+            "app_label": "tienda", "model_name": "venta", "field_name": "cliente", "term": "lopez",
+        })
+        self.assertEqual([r["id"] for r in resp.json()["results"]], [str(self.cli.pk)])
+
+
+class CalentamientoTests(TestCase):
+    def test_calentar_no_consulta_la_base(self):
+        # Corre en el maestro de gunicorn antes del fork: no debe abrir conexiones.
+        with self.assertNumQueries(0):
+            resultado = calentar()
+        self.assertGreaterEqual(resultado["plantillas"], 20)
+        self.assertGreaterEqual(resultado["urls"], 20)
+
+
+@sin_manifiesto
+class MetricasTests(TestCase):
+    def test_server_timing_y_metrics(self):
+        Cliente.objects.create(nombres="Ana")
+        resp = self.client.get("/clientes/")
+        self.assertRegex(resp["Server-Timing"], r'db;dur=[\d.]+;desc="1 consultas", tpl;dur=[\d.]+, total;dur=[\d.]+')
+
+        texto = self.client.get("/metrics").content.decode()
+        self.assertIn('tienda_peticion_segundos_bucket{vista="tienda:cliente_list",le="+Inf"}', texto)
+        self.assertRegex(texto, r'tienda_db_consultas_total\{vista="tienda:cliente_list"\} \d+')
+
+    @override_settings(METRICAS_TOKEN="secreto")
+    def test_metrics_con_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secreto").status_code, 200)
+
+    def test_combinar_volcados_de_workers(self):
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIR=directorio):
+            with open(os.path.join(directorio, f"{os.getppid()}-1.json"), "w") as f:
+                json.dump({"histogramas": {}, "contadores": {"tienda_db_consultas_total": {"otro": 7}}}, f)
+            texto = self.client.get("/metrics").content.decode()
+        self.assertIn('tienda_db_consultas_total{vista="otro"} 7', texto)
+
+    def test_volcados_de_procesos_terminados_pasan_a_totales(self):
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIR=directorio):
+            # Un pid que no puede existir: el worker ya terminó.
+            muerto = os.path.join(directorio, "999999999-1.json")
+            with open(muerto, "w") as f:
+                json.dump({"histogramas": {}, "contadores": {"tienda_db_consultas_total": {"otro": 3}}}, f)
+            for _ in range(2):
+                texto = self.client.get("/metrics").content.decode()
+                self.assertIn('tienda_db_consultas_total{vista="otro"} 3', texto)
+            self.assertFalse(os.path.exists(muerto))
+            self.assertTrue(os.path.exists(os.path.join(directorio, "totales.json")))
@@ -5,6 +5,7 @@ urlpatterns = [
     # Productos
     path('productos/', views.producto_list, name='producto_list'),
     path('productos/nuevo/', views.producto_edit, name='producto_new'),
+    path('productos/importar/', views.producto_import, name='producto_import'),
     path('productos/<int:pk>/editar/', views.producto_edit, name='producto_edit'),
 
     # Clientes
@@ -15,10 +16,27 @@ urlpatterns = [
     # Ventas
     path('ventas/', views.venta_list, name='venta_list'),
     path('ventas/nueva/', views.venta_create, name='venta_create'),
+    path('ventas/<int:pk>/', views.venta_detail, name='venta_detail'),
+    path('ventas/<int:pk>/comprobante/', views.venta_pdf, name='venta_pdf'),
+
+    # Reportes
+    path('reportes/ventas/', views.reporte_ventas, name='reporte_ventas'),
+    path('reportes/ventas/exportar/', views.venta_exportar, name='venta_exportar'),
+    path('reportes/reposicion/', views.reporte_reposicion, name='reporte_reposicion'),
 
     # Catálogo
     path('catalogo/', views.catalogo, name='catalogo'),
 
+    # Carrito
+    path('carrito/', views.carrito_ver, name='carrito'),
+    path('carrito/agregar/', views.carrito_agregar, name='carrito_agregar'),
+    path('carrito/<int:pk>/quitar/', views.carrito_quitar, name='carrito_quitar'),
+    path('carrito/checkout/', views.checkout, name='checkout'),
+
     
     path('api/productos/<int:pk>/precio/', views.api_precio_producto, name='api_precio_producto'),
+    path('api/productos/precios/', views.api_precios, name='api_precios'),
+    path('api/ventas/lote/', views.api_ventas_lote, name='api_ventas_lote'),
+    path('api/clientes/buscar/', views.api_buscar_clientes, name='api_buscar_clientes'),
+    path('api/productos/buscar/', views.api_buscar_productos, name='api_buscar_productos'),
 ]
@@ -0,0 +1,168 @@
+import hashlib
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import routers
+
+TIMEOUT_PAGINAS = 60 * 60 * 24
+
+
+def _clave(nombre):
+    return f"version:{nombre}"
+
+
+def version(nombre):
+    """Versión actual de ``nombre`` (p. ej. ``"catalogo"``), leída solo de la caché.
+
+    Si la caché perdió la clave se reinicia con la hora actual en milisegundos,
+    para no repetir versiones (ni ETags) que algún cliente ya haya visto.
+    """
+    valor = cache.get(_clave(nombre))
+    if valor is None:
+        ahora = int(time.time() * 1000)
+        cache.add(_clave(nombre), ahora, timeout=None)
+        cache.add(f"{_clave(nombre)}:modificado", time.time(), timeout=None)
+        valor = cache.get(_clave(nombre), ahora)
+    return valor
+
+
+async def aversion(nombre):
+    """``version`` para vistas async."""
+    valor = await cache.aget(_clave(nombre))
+    if valor is None:
+        ahora = int(time.time() * 1000)
+        await cache.aadd(_clave(nombre), ahora, timeout=None)
+        await cache.aadd(f"{_clave(nombre)}:modificado", time.time(), timeout=None)
+        valor = await cache.aget(_clave(nombre), ahora)
+    return valor
+
+
+def modificado(nombre):
+    """Momento (epoch) del último cambio de ``nombre``, para ``Last-Modified``."""
+    valor = cache.get(f"{_clave(nombre)}:modificado")
+    if valor is None:
+        version(nombre)
+        valor = cache.get(f"{_clave(nombre)}:modificado", time.time())
+    return valor
+
+
+async def amodificado(nombre):
+    """``modificado`` para vistas async."""
+    valor = await cache.aget(f"{_clave(nombre)}:modificado")
+    if valor is None:
+        await aversion(nombre)
+        valor = await cache.aget(f"{_clave(nombre)}:modificado", time.time())
+    return valor
+
+
+def reciente(ultima):
+    """``True`` si el cambio en ``ultima`` (epoch) puede no haber llegado aún a la réplica.
+
+    Quien llena una caché versionada lee entonces de la primaria: con datos de
+    una réplica atrasada la versión nueva quedaría cacheada con contenido viejo.
+    """
+    return time.time() - ultima < settings.REPLICA_RETRASO
+
+
+def incrementar(nombre):
+    """Invalida todo lo cacheado bajo ``nombre``, una vez confirmada la transacción en curso.
+
+    Incrementar antes del commit dejaría que otra petición vuelva a cachear los
+    datos viejos bajo la versión nueva.
+    """
+    def _incrementar():
+        try:
+            cache.incr(_clave(nombre))
+        except ValueError:
+            cache.set(_clave(nombre), int(time.time() * 1000), timeout=None)
+        cache.set(f"{_clave(nombre)}:modificado", time.time(), timeout=None)
+
+    transaction.on_commit(_incrementar)
+
+
+def _etiquetar(response, etag, ultima):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(ultima)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _variante(request):
+    return hashlib.sha1(f"{request.path}?{request.GET.urlencode()}".encode()).hexdigest()[:16]
+
+
+def pagina_versionada(nombre, timeout=TIMEOUT_PAGINAS):
+    """Cachea la respuesta de una vista GET bajo la versión actual de ``nombre``.
+
+    Mientras la versión no cambie, la vista no se ejecuta (cero consultas) y los
+    clientes que envían ``If-None-Match``/``If-Modified-Since`` reciben un 304.
+    La querystring forma parte de la clave, así que búsquedas y páginas se
+    cachean por separado. Acepta vistas sync y async; con las async la caché
+    se lee con la API async.
+    """
+    def decorador(vista):
+        if iscoroutinefunction(vista):
+            @wraps(vista)
+            async def envoltura_async(request, *args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return await vista(request, *args, **kwargs)
+
+                actual = await aversion(nombre)
+                variante = _variante(request)
+                etag = f'"{nombre}-{actual}-{variante}"'
+                ultima = int(await amodificado(nombre))
+
+                response = get_conditional_response(request, etag=etag, last_modified=ultima)
+                if response is None:
+                    clave = f"pagina:{nombre}:{actual}:{variante}"
+                    guardada = await cache.aget(clave)
+                    if guardada is None:
+                        with routers.primaria() if reciente(ultima) else nullcontext():
+                            response = await vista(request, *args, **kwargs)
+                        if response.status_code != 200 or response.streaming:
+                            return response
+                        await cache.aset(clave, (response.content, response["Content-Type"]), timeout)
+                    else:
+                        contenido, content_type = guardada
+                        response = HttpResponse(contenido, content_type=content_type)
+                return _etiquetar(response, etag, ultima)
+
+            return envoltura_async
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return vista(request, *args, **kwargs)
+
+            actual = version(nombre)
+            variante = _variante(request)
+            etag = f'"{nombre}-{actual}-{variante}"'
+            ultima = int(modificado(nombre))
+
+            response = get_conditional_response(request, etag=etag, last_modified=ultima)
+            if response is None:
+                clave = f"pagina:{nombre}:{actual}:{variante}"
+                guardada = cache.get(clave)
+                if guardada is None:
+                    with routers.primaria() if reciente(ultima) else nullcontext():
+                        response = vista(request, *args, **kwargs)
+                    if response.status_code != 200 or response.streaming:
+                        return response
+                    cache.set(clave, (response.content, response["Content-Type"]), timeout)
+                else:
+                    contenido, content_type = guardada
+                    response = HttpResponse(contenido, content_type=content_type)
+            return _etiquetar(response, etag, ultima)
+
+        return envoltura
+
+    return decorador
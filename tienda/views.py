@@ -1,20 +1,50 @@
+import hashlib
+import hmac
+import io
+import json
+from datetime import timedelta
 from decimal import Decimal
+from functools import wraps
 
-from django.db import transaction
-from django.db.models import Q
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404, redirect, render
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router, transaction
+from django.db.models import F, Prefetch, Sum
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_POST
 
-from .forms import ClienteForm, DetalleVentaFormSet, ProductoForm, VentaForm
-from .models import Cliente, DetalleVenta, Producto, Venta
+from . import busqueda, carrito, comprobantes, metricas, precios, versiones
+from .routers import lectura_replica, primaria
+from .exportacion import afilas_csv, alineas_jsonl, filas_csv, lineas_jsonl
+from .fechas import limites
+from .forms import CarritoForm, ClienteForm, DetalleVentaFormSet, ProductoForm, VentaForm
+from .importacion import importar_productos
+from .lotes import registrar_ventas_en_lote
+from .models import (
+    Cliente, DetalleVenta, Producto, PronosticoReposicion, Venta, VentaDiariaCliente, VentaDiariaProducto,
+)
+from .paginacion import apaginar_por_cursor
 
 
-def producto_list(request):
+# Las vistas de solo lectura son async: bajo ASGI un cliente lento no retiene un
+# hilo, y las consultas pasan por la API async del ORM.
+
+@lectura_replica
+@versiones.pagina_versionada('catalogo')
+async def producto_list(request):
     q = request.GET.get('q', '').strip()
-    productos = Producto.objects.all().order_by('nombre')
+    productos = Producto.objects.all()
     if q:
-        productos = productos.filter(nombre__icontains=q)
-    return render(request, 'tienda/producto_list.html', {'productos': productos})
+        productos = busqueda.filtrar(productos, q)
+    pagina = await apaginar_por_cursor(request, productos, ('nombre', 'id'))
+    return render(request, 'tienda/producto_list.html', {'productos': pagina, 'pagina': pagina})
 
 def producto_edit(request, pk=None):
     instance = get_object_or_404(Producto, pk=pk) if pk else None
@@ -25,12 +55,59 @@ def producto_edit(request, pk=None):
     return render(request, 'tienda/producto_form.html', {'form': form})
 
 
-def cliente_list(request):
+def producto_import(request):
+    resultado = error = None
+    if request.method == 'POST' and request.FILES.get('archivo'):
+        archivo = io.TextIOWrapper(request.FILES['archivo'].file, encoding='utf-8-sig', newline='')
+        try:
+            resultado = importar_productos(archivo)
+        except UnicodeDecodeError:
+            error = 'El archivo no está en UTF-8.'
+    return render(request, 'tienda/producto_import.html', {'resultado': resultado, 'error': error})
+
+
+# Cada orden tiene su índice; los rankings lo recorren hacia atrás.
+ORDENES_CLIENTES = {
+    'nombre': ('apellidos', 'nombres', 'id'),
+    'total': ('-total_comprado', '-id'),
+    'ventas': ('-num_ventas', '-id'),
+    'reciente': ('-ultima_compra', '-id'),
+}
+
+
+@lectura_replica
+async def cliente_list(request):
     q = request.GET.get('q', '').strip()
-    clientes = Cliente.objects.all().order_by('apellidos', 'nombres')
+    orden = request.GET.get('orden', 'nombre')
+    if orden not in ORDENES_CLIENTES:
+        orden = 'nombre'
+
+    clientes = Cliente.objects.all()
     if q:
-        clientes = clientes.filter(Q(nombres__icontains=q) | Q(apellidos__icontains=q))
-    return render(request, 'tienda/cliente_list.html', {'clientes': clientes})
+        clientes = busqueda.filtrar(clientes, q)
+    try:
+        minimo = Decimal(request.GET.get('minimo', '') or '0')
+    except ArithmeticError:
+        minimo = Decimal('0')
+    if not minimo.is_finite() or minimo < 0:
+        minimo = Decimal('0')
+    if minimo:
+        clientes = clientes.filter(total_comprado__gte=minimo)
+    compro_desde = _fecha_param(request, 'compro_desde')
+    if compro_desde:
+        clientes = clientes.filter(ultima_compra__gte=limites(compro_desde, compro_desde)[0])
+    if orden == 'reciente':
+        # El cursor no puede comparar con NULL: los que nunca compraron no entran en este orden.
+        clientes = clientes.filter(ultima_compra__isnull=False)
+
+    pagina = await apaginar_por_cursor(request, clientes, ORDENES_CLIENTES[orden])
+    return render(request, 'tienda/cliente_list.html', {
+        'clientes': pagina,
+        'pagina': pagina,
+        'orden': orden,
+        'minimo': minimo or '',
+        'compro_desde': compro_desde,
+    })
 
 def cliente_edit(request, pk=None):
     instance = get_object_or_404(Cliente, pk=pk) if pk else None
@@ -41,24 +118,52 @@ def cliente_edit(request, pk=None):
     return render(request, 'tienda/cliente_form.html', {'form': form})
 
 
-def venta_list(request):
-    ventas = Venta.objects.select_related('cliente').order_by('-id')
-    return render(request, 'tienda/venta_list.html', {'ventas': ventas})
+@lectura_replica
+async def venta_list(request):
+    ventas = Venta.objects.select_related('cliente').con_num_lineas()
+    pagina = await apaginar_por_cursor(request, ventas, ('-id',))
+    return render(request, 'tienda/venta_list.html', {'ventas': pagina, 'pagina': pagina})
+
+@lectura_replica
+async def venta_detail(request, pk):
+    """Detalle de una venta, renderizado una sola vez por versión.
+
+    Una venta confirmada casi nunca cambia: la página se guarda en la caché bajo
+    la versión de la venta, que cambia cuando el admin corrige la venta o sus
+    líneas (ver ``comprobantes.invalidar``). Se renderiza leyendo de la
+    primaria, para no guardar lo que todavía muestra una réplica atrasada, y se
+    sirve con un ETag fuerte calculado sobre el contenido. El navegador la
+    revalida en cada visita (``no-cache``) y recibe un 304 sin consultas.
+    """
+    clave = comprobantes.clave_pagina(pk, await comprobantes.aversion(pk))
+    guardada = await cache.aget(clave)
+    if guardada is None:
+        detalles = Prefetch('detalles', queryset=DetalleVenta.objects.select_related('producto').order_by('id'))
+        with primaria():
+            venta = await aget_object_or_404(Venta.objects.select_related('cliente').prefetch_related(detalles), pk=pk)
+        # Sin request: la página es la misma para todos y no lleva CSRF.
+        contenido = render_to_string('tienda/venta_detail.html', {'venta': venta}).encode('utf-8')
+        guardada = (f'"{hashlib.sha256(contenido).hexdigest()[:32]}"', contenido)
+        await cache.aset(clave, guardada, comprobantes.TIMEOUT_PAGINA)
+
+    etag, contenido = guardada
+    response = get_conditional_response(request, etag=etag) or HttpResponse(contenido)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 
 @transaction.atomic
 def venta_create(request):
     form = VentaForm(request.POST or None)
     formset = DetalleVentaFormSet(request.POST or None, prefix='d')
-   
-    product_prices = {p.id: str(p.precio_litro) for p in Producto.objects.all()}
+
     if request.method == 'POST' and form.is_valid() and formset.is_valid():
         venta = form.save()
         detalles = formset.save(commit=False)
         for d in detalles:
             d.venta = venta
-
-            if not d.precio_unitario:
-                d.precio_unitario = d.producto.precio_litro or Decimal('0')
+            # Sin precio queda en 0: ``confirmar`` lo completa desde la base, no desde la caché.
             d.save()
 
 
@@ -71,20 +176,350 @@ def venta_create(request):
             transaction.set_rollback(True)
             form.add_error(None, str(exc))
         else:
+            comprobantes.encolar(venta.pk)
             return redirect('tienda:venta_list')
 
     return render(
         request,
         'tienda/venta_form.html',
-        {'form': form, 'formset': formset, 'product_prices': product_prices}
+        {'form': form, 'formset': formset}
+    )
+
+
+def _sin_respuesta(request):
+    return None
+
+
+def _autorizar_lote(request):
+    """``(respuesta_de_rechazo, permitir_precios)`` para ``api_ventas_lote``.
+
+    Acepta el token ``VENTAS_API_TOKEN`` (integraciones, que pueden fijar
+    precios) o una sesión con permiso ``tienda.add_venta``; con sesión se exige
+    el token CSRF y los precios enviados solo se respetan con permiso
+    ``tienda.change_detalleventa``.
+    """
+    token = settings.VENTAS_API_TOKEN
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return None, True
+    usuario = request.user
+    if not usuario.is_authenticated:
+        return JsonResponse({'error': 'Autenticación requerida.'}, status=401), False
+    if not usuario.has_perm('tienda.add_venta'):
+        return JsonResponse({'error': 'Sin permiso para registrar ventas.'}, status=403), False
+    rechazo = csrf_protect(_sin_respuesta)(request)
+    return rechazo, usuario.has_perm('tienda.change_detalleventa')
+
+
+@csrf_exempt
+@require_POST
+def api_ventas_lote(request):
+    """Registra varias ventas enviadas como JSON ``{"ventas": [...]}`` en una sola pasada."""
+    rechazo, permitir_precios = _autorizar_lote(request)
+    if rechazo is not None:
+        return rechazo
+    if request.content_type != 'application/json':
+        return JsonResponse({'error': 'Se esperaba Content-Type: application/json.'}, status=415)
+    try:
+        data = json.loads(request.body)
+    except (UnicodeDecodeError, ValueError):
+        return JsonResponse({'error': 'JSON inválido.'}, status=400)
+
+    ventas = data.get('ventas') if isinstance(data, dict) else None
+    if not isinstance(ventas, list):
+        return JsonResponse({'error': 'Se esperaba una lista "ventas".'}, status=400)
+
+    resultados = registrar_ventas_en_lote(ventas, permitir_precios=permitir_precios)
+    for resultado in resultados:
+        if resultado['ok']:
+            comprobantes.encolar(resultado['venta'])
+    return JsonResponse({'resultados': resultados})
+
+
+def _autocompletar(request, queryset, texto):
+    try:
+        k = min(max(int(request.GET.get('k', 10)), 1), 50)
+    except ValueError:
+        k = 10
+    resultados = busqueda.mejores(queryset, request.GET.get('q', ''), k)
+    return JsonResponse({'resultados': [{'id': obj.pk, 'texto': texto(obj)} for obj in resultados]})
+
+
+@lectura_replica
+def api_buscar_clientes(request):
+    return _autocompletar(
+        request,
+        Cliente.objects.only('id', 'nombres', 'apellidos', 'nit', 'busqueda'),
+        lambda c: f'{c.nombre_completo} ({c.nit})' if c.nit else c.nombre_completo,
     )
 
 
-def api_precio_producto(request, pk):
-    p = get_object_or_404(Producto, pk=pk)
+@lectura_replica
+def api_buscar_productos(request):
+    return _autocompletar(
+        request,
+        Producto.objects.filter(activo=True).only('id', 'nombre', 'busqueda'),
+        str,
+    )
+
+
+def venta_pdf(request, pk):
+    """Sirve el comprobante ya generado; si el pool aún no llegó, lo genera aquí."""
+    archivo = comprobantes.ruta(pk)
+    if archivo is None:
+        try:
+            archivo = comprobantes.generar(pk)
+        except Venta.DoesNotExist:
+            raise Http404('Venta inexistente.')
+
+    # El archivo se llama como el hash de su contenido: sirve de ETag y, si la
+    # venta se corrige, el comprobante nuevo tiene otro nombre.
+    etag = f'"{archivo.stem}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+        return response
+
+    es_pdf = archivo.suffix == '.pdf'
+    response = FileResponse(
+        open(archivo, 'rb'),
+        content_type='application/pdf' if es_pdf else 'text/html; charset=utf-8',
+        as_attachment=es_pdf,
+        filename=f'venta_{pk}{archivo.suffix}',
+    )
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@lectura_replica
+def api_precios(request):
+    """Mapa ``{id: precio}`` de productos activos: todos, ``?ids=1,2,3`` o ``?version=N``.
+
+    Con ``version`` solo se devuelven los precios que cambiaron desde esa versión
+    (``completo: false``); si ya no se conoce, el mapa completo.
+    """
+    version, mapa = precios.mapa_precios()
+    ids = request.GET.get('ids', '')
+    version_cliente = request.GET.get('version', '')
+
+    variante = hashlib.sha1(f'{ids}|{version_cliente}'.encode()).hexdigest()[:12]
+    etag = f'"precios-{version}-{variante}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    completo = True
+    if ids:
+        pedidos = {pk.strip() for pk in ids.split(',') if pk.strip()}
+        mapa = {pk: precio for pk, precio in mapa.items() if pk in pedidos}
+        completo = False
+    elif version_cliente.isdigit():
+        cambios = precios.cambios_desde(int(version_cliente))
+        if cambios is not None:
+            mapa, completo = cambios, False
+
+    response = JsonResponse({'version': version, 'completo': completo, 'precios': mapa})
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@lectura_replica
+async def api_precio_producto(request, pk):
+    p = await aget_object_or_404(Producto.objects.only('id', 'precio_litro'), pk=pk)
     return JsonResponse({'precio': str(p.precio_litro)})
 
 
-def catalogo(request):
-    productos = Producto.objects.filter(activo=True).order_by('nombre')
+@lectura_replica
+@versiones.pagina_versionada('catalogo')
+async def catalogo(request):
+    productos = [p async for p in Producto.objects.filter(activo=True).order_by('nombre').aiterator()]
     return render(request, 'tienda/catalogo.html', {'productos': productos})
+
+
+def _fecha_param(request, nombre):
+    try:
+        return parse_date(request.GET.get(nombre, '') or '')
+    except ValueError:
+        return None
+
+
+def _rango_fechas(request, dias_por_defecto=30):
+    """Lee ``desde``/``hasta`` (AAAA-MM-DD) de la querystring; por defecto, los últimos días."""
+    hasta = _fecha_param(request, 'hasta') or timezone.localdate()
+    desde = _fecha_param(request, 'desde') or hasta - timedelta(days=dias_por_defecto)
+    return desde, hasta
+
+
+@lectura_replica
+def reporte_ventas(request):
+    desde, hasta = _rango_fechas(request)
+
+    # Solo se leen los resúmenes diarios: el costo depende de los días y
+    # productos/clientes del rango, no de cuántas ventas hubo.
+    por_producto = (
+        VentaDiariaProducto.objects.filter(fecha__range=(desde, hasta))
+        .values('producto_id', 'producto__nombre')
+        .annotate(litros_total=Sum('litros'), monto_total=Sum('monto'), lineas_total=Sum('lineas'))
+        .order_by('-monto_total')
+    )
+    por_cliente = (
+        VentaDiariaCliente.objects.filter(fecha__range=(desde, hasta))
+        .values('cliente_id', 'cliente__nombres', 'cliente__apellidos')
+        .annotate(ventas_total=Sum('num_ventas'), monto_total=Sum('monto'))
+        .order_by('-monto_total')
+    )
+    totales = VentaDiariaCliente.objects.filter(fecha__range=(desde, hasta)).aggregate(
+        ventas=Sum('num_ventas'), monto=Sum('monto')
+    )
+
+    return render(request, 'tienda/reporte_ventas.html', {
+        'desde': desde,
+        'hasta': hasta,
+        'por_producto': por_producto,
+        'por_cliente': por_cliente,
+        'totales': totales,
+    })
+
+
+@lectura_replica
+def reporte_reposicion(request):
+    """Último pronóstico de ``pronosticar_reposicion``: primero lo que se agota antes."""
+    pronosticos = PronosticoReposicion.objects.select_related('producto').order_by(
+        F('dias_cobertura').asc(nulls_last=True), 'producto__nombre'
+    )
+    solo_reponer = request.GET.get('reponer') == '1'
+    if solo_reponer:
+        pronosticos = pronosticos.filter(sugerido__gt=0)
+    pronosticos = list(pronosticos)
+    return render(request, 'tienda/reporte_reposicion.html', {
+        'pronosticos': pronosticos,
+        'calculado': pronosticos[0].calculado if pronosticos else None,
+        'solo_reponer': solo_reponer,
+    })
+
+
+@lectura_replica
+def venta_exportar(request):
+    """Exporta las ventas del rango como CSV (una fila por línea) o JSON lines (una por venta)."""
+    desde, hasta = _rango_fechas(request)
+    inicio, fin = limites(desde, hasta)
+    using = router.db_for_read(DetalleVenta)
+    # Bajo ASGI un generador síncrono se juntaría entero en memoria antes de enviarse.
+    asincrono = isinstance(request, ASGIRequest)
+
+    if request.GET.get('formato') == 'jsonl':
+        lineas = (alineas_jsonl if asincrono else lineas_jsonl)(inicio, fin, using=using)
+        response = StreamingHttpResponse(lineas, content_type='application/x-ndjson; charset=utf-8')
+        extension = 'jsonl'
+    else:
+        filas = (afilas_csv if asincrono else filas_csv)(inicio, fin, using=using)
+        response = StreamingHttpResponse(filas, content_type='text/csv; charset=utf-8')
+        extension = 'csv'
+
+    response['Content-Disposition'] = f'attachment; filename="ventas_{desde:%Y%m%d}_{hasta:%Y%m%d}.{extension}"'
+    return response
+
+
+def exponer_metricas(request):
+    """Métricas por vista en formato de texto de Prometheus."""
+    token = settings.METRICAS_TOKEN
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metricas.exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _carrito_ocupado(vista):
+    # Otro pedido del mismo carrito tiene tomado el bloqueo: 409 en vez de un 500.
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        try:
+            return vista(request, *args, **kwargs)
+        except carrito.CarritoOcupado as exc:
+            return HttpResponse(str(exc), status=409, content_type='text/plain; charset=utf-8')
+    return envoltura
+
+
+def _token_carrito(request):
+    return request.COOKIES.get(carrito.COOKIE) or carrito.nuevo_token()
+
+
+def _con_cookie(response, token):
+    response.set_cookie(carrito.COOKIE, token, max_age=60 * 60 * 24 * 30, httponly=True, samesite='Lax')
+    return response
+
+
+def _render_carrito(request, token, form, error=None):
+    # Solo lectura: nombres y precios para mostrar, más lo reservado por todos los carritos.
+    lineas = carrito.lineas(token)
+    productos = Producto.objects.in_bulk(list(lineas))
+    reservas = carrito.reservado(list(lineas))
+    filas = []
+    for pk, litros in lineas.items():
+        producto = productos.get(pk)
+        if producto is None:
+            continue
+        precio = producto.precio_litro or Decimal('0')
+        filas.append({
+            'producto': producto,
+            'litros': litros,
+            'subtotal': (litros * precio).quantize(Decimal('0.01')),
+            'libre': (producto.stock_litros or Decimal('0')) - reservas[pk],
+        })
+    return render(request, 'tienda/carrito.html', {
+        'filas': filas,
+        'total': sum((f['subtotal'] for f in filas), Decimal('0')),
+        'form': form,
+        'error': error,
+        'minutos': settings.CARRITO_RESERVA // 60,
+    })
+
+
+@_carrito_ocupado
+def carrito_ver(request):
+    token = _token_carrito(request)
+    return _con_cookie(_render_carrito(request, token, CarritoForm()), token)
+
+
+@require_POST
+@_carrito_ocupado
+def carrito_agregar(request):
+    token = _token_carrito(request)
+    form = CarritoForm(request.POST)
+    if form.is_valid():
+        try:
+            carrito.agregar(token, form.cleaned_data['producto'].pk, form.cleaned_data['litros'])
+        except ValueError as exc:
+            return _con_cookie(_render_carrito(request, token, form, str(exc)), token)
+        return _con_cookie(redirect('tienda:carrito'), token)
+    return _con_cookie(_render_carrito(request, token, form), token)
+
+
+@require_POST
+@_carrito_ocupado
+def carrito_quitar(request, pk):
+    token = _token_carrito(request)
+    carrito.quitar(token, pk)
+    return _con_cookie(redirect('tienda:carrito'), token)
+
+
+@_carrito_ocupado
+def checkout(request):
+    token = _token_carrito(request)
+    form = VentaForm(request.POST or None)
+    error = None
+    if request.method == 'POST' and form.is_valid():
+        try:
+            venta = carrito.confirmar(token, form.cleaned_data['cliente'])
+        except ValueError as exc:
+            error = str(exc)
+        else:
+            comprobantes.encolar(venta.pk)
+            return redirect('tienda:venta_list')
+    lineas = carrito.lineas(token)
+    return _con_cookie(render(request, 'tienda/checkout.html', {
+        'form': form,
+        'error': error,
+        'lineas': [(p, lineas[p.pk]) for p in Producto.objects.filter(pk__in=list(lineas)).order_by('nombre')],
+    }), token)
+